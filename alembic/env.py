@@ -12,8 +12,15 @@ from alembic import context
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.core.config import settings
+from app.core.partitions import is_partition
 from app.models.base import Base
-from app.models import Chat, Message  # noqa
+from app.models import (  # noqa
+    Chat,
+    Message,
+    MessageArchive,
+    MessageIdempotencyKey,
+    RateLimitBucket,
+)
 
 config = context.config
 
@@ -24,12 +31,21 @@ if config.config_file_name is not None:
 
 target_metadata = Base.metadata
 
+
+def include_name(name, type_, parent_names) -> bool:
+    """Партиции messages создает приложение: autogenerate их не сравнивает."""
+    if type_ == "table":
+        return not is_partition(name)
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode."""
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -38,7 +54,11 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+    )
     with context.begin_transaction():
         context.run_migrations()
 
@@ -0,0 +1,42 @@
+"""Add composite index for keyset pagination of messages
+
+Revision ID: 5ee44cf218e9
+Revises: 40f9b42cdb82
+Create Date: 2026-10-18 15:40:12.311904
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5ee44cf218e9"
+down_revision: Union[str, Sequence[str], None] = "40f9b42cdb82"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в messages на время построения индекса
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_chat_id_created_at_id",
+            "messages",
+            ["chat_id", "created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_messages_chat_id_created_at_id",
+            table_name="messages",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,128 @@
+"""Partition messages by month of created_at
+
+Revision ID: 8c1d2f6a9b47
+Revises: 5ee44cf218e9
+Create Date: 2026-10-18 16:05:41.902113
+
+"""
+
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8c1d2f6a9b47"
+down_revision: Union[str, Sequence[str], None] = "5ee44cf218e9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Партиции наперед; дальше их создает приложение (app.core.partitions)
+MONTHS_AHEAD = 3
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _create_partitions(first: datetime.date, last: datetime.date) -> None:
+    month = first.replace(day=1)
+    while month <= last:
+        end = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE messages_y{month.year:04d}m{month.month:02d} "
+            f"PARTITION OF messages "
+            f"FOR VALUES FROM ('{month} 00:00+00') TO ('{end} 00:00+00')"
+        )
+        month = end
+
+
+def _create_messages_table(*args, **kw) -> None:
+    op.create_table(
+        "messages",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('messages_id_seq')"),
+            nullable=False,
+        ),
+        sa.Column("chat_id", sa.Integer(), nullable=False),
+        sa.Column("text", sa.String(length=5000), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["chat_id"], ["chats.id"], ondelete="CASCADE"),
+        *args,
+        **kw,
+    )
+
+
+def _rename_old_table(name: str) -> None:
+    op.rename_table("messages", name)
+    op.execute(f"ALTER TABLE {name} RENAME CONSTRAINT messages_pkey TO {name}_pkey")
+    op.execute(f"ALTER INDEX ix_messages_id RENAME TO ix_{name}_id")
+    op.execute(
+        f"ALTER INDEX ix_messages_chat_id_created_at_id "
+        f"RENAME TO ix_{name}_chat_id_created_at_id"
+    )
+
+
+def _move_rows(name: str) -> None:
+    """Переносит строки в новую messages и удаляет старую таблицу."""
+    op.execute(
+        f"INSERT INTO messages (id, chat_id, text, created_at) "
+        f"SELECT id, chat_id, text, created_at FROM {name}"
+    )
+    # Последовательность id переходит к новой таблице, иначе удалится со старой
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.drop_table(name)
+    op.create_index(op.f("ix_messages_id"), "messages", ["id"], unique=False)
+    op.create_index(
+        "ix_messages_chat_id_created_at_id",
+        "messages",
+        ["chat_id", "created_at", "id"],
+        unique=False,
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Данные копируются в новую таблицу целиком, под блокировкой; на большой
+    базе миграцию стоит запускать в окно обслуживания.
+    """
+    _rename_old_table("messages_unpartitioned")
+    _create_messages_table(
+        sa.PrimaryKeyConstraint("id", "created_at"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    bounds = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT min(created_at), max(created_at) FROM messages_unpartitioned"
+            )
+        )
+        .one()
+    )
+    first, last = (
+        bound.astimezone(datetime.timezone.utc).date() if bound else today
+        for bound in bounds
+    )
+    _create_partitions(min(first, today), max(last, _add_months(today, MONTHS_AHEAD)))
+
+    _move_rows("messages_unpartitioned")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rename_old_table("messages_partitioned")
+    _create_messages_table(sa.PrimaryKeyConstraint("id"))
+    _move_rows("messages_partitioned")
@@ -0,0 +1,31 @@
+"""Add history version to chats
+
+Revision ID: a4c7e2d91b53
+Revises: d8e2a4f6b019
+Create Date: 2026-10-18 22:05:41.316207
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a4c7e2d91b53"
+down_revision: Union[str, Sequence[str], None] = "d8e2a4f6b019"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "chats",
+        sa.Column("history_version", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("chats", "history_version")
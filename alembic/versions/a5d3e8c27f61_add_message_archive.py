@@ -0,0 +1,60 @@
+"""Add message archive
+
+Revision ID: a5d3e8c27f61
+Revises: f2c8d5e91a37
+Create Date: 2026-10-18 19:15:08.774529
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.archive import unpack_messages
+
+# revision identifiers, used by Alembic.
+revision: str = "a5d3e8c27f61"
+down_revision: Union[str, Sequence[str], None] = "f2c8d5e91a37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "message_archive",
+        sa.Column("chat_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("first_created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("first_id", sa.Integer(), nullable=False),
+        sa.Column("last_created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_id", sa.Integer(), nullable=False),
+        sa.Column("codec", sa.String(length=8), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["chat_id"], ["chats.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("chat_id", "day"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Заархивированные сообщения возвращаются в messages до удаления архива.
+    """
+    messages = sa.table(
+        "messages",
+        sa.column("id", sa.Integer()),
+        sa.column("chat_id", sa.Integer()),
+        sa.column("text", sa.String()),
+        sa.column("created_at", sa.DateTime(timezone=True)),
+    )
+    blocks = op.get_bind().execute(
+        sa.text("SELECT chat_id, codec, data FROM message_archive")
+    )
+    for block in blocks:
+        op.bulk_insert(
+            messages, unpack_messages(block.chat_id, block.codec, block.data)
+        )
+    op.drop_table("message_archive")
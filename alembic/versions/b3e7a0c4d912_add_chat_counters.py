@@ -0,0 +1,55 @@
+"""Add denormalized message counters to chats
+
+Revision ID: b3e7a0c4d912
+Revises: 8c1d2f6a9b47
+Create Date: 2026-10-18 16:42:07.518330
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b3e7a0c4d912"
+down_revision: Union[str, Sequence[str], None] = "8c1d2f6a9b47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "chats",
+        sa.Column("message_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "chats", sa.Column("last_message_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.add_column("chats", sa.Column("last_message_id", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE chats SET message_count = s.n, "
+        "last_message_at = s.created_at, last_message_id = s.id "
+        "FROM (SELECT DISTINCT ON (chat_id) chat_id, created_at, id, "
+        "count(*) OVER (PARTITION BY chat_id) AS n "
+        "FROM messages ORDER BY chat_id, created_at DESC, id DESC) s "
+        "WHERE chats.id = s.chat_id"
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_chats_activity",
+            "chats",
+            [sa.text("coalesce(last_message_at, created_at)"), "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_chats_activity", table_name="chats", if_exists=True)
+    op.drop_column("chats", "last_message_id")
+    op.drop_column("chats", "last_message_at")
+    op.drop_column("chats", "message_count")
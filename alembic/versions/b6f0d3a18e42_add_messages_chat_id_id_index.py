@@ -0,0 +1,30 @@
+"""Add (chat_id, id) index on messages for delta sync
+
+Revision ID: b6f0d3a18e42
+Revises: c91e4b7d2f05
+Create Date: 2026-10-18 20:41:07.532810
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b6f0d3a18e42"
+down_revision: Union[str, Sequence[str], None] = "c91e4b7d2f05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # На секционированной таблице индекс создается в каждой секции
+    op.create_index(
+        "ix_messages_chat_id_id", "messages", ["chat_id", "id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_messages_chat_id_id", table_name="messages")
@@ -0,0 +1,57 @@
+"""Widen message ids to BIGINT
+
+Revision ID: c91e4b7d2f05
+Revises: a5d3e8c27f61
+Create Date: 2026-10-18 19:58:44.215907
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c91e4b7d2f05"
+down_revision: Union[str, Sequence[str], None] = "a5d3e8c27f61"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Колонки с id сообщений: (таблица, колонка, nullable)
+COLUMNS = (
+    ("messages", "id", False),
+    ("chats", "last_message_id", True),
+    ("message_idempotency_keys", "message_id", False),
+    ("message_archive", "first_id", False),
+    ("message_archive", "last_id", False),
+)
+
+
+def _retype(old: sa.types.TypeEngine, new: sa.types.TypeEngine) -> None:
+    for table, column, nullable in COLUMNS:
+        op.alter_column(
+            table,
+            column,
+            type_=new,
+            existing_type=old,
+            existing_nullable=nullable,
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Смена типа переписывает таблицу messages со всеми партициями;
+    на большой базе миграцию стоит запускать в окно обслуживания.
+    """
+    op.execute("ALTER SEQUENCE messages_id_seq AS bigint")
+    _retype(sa.Integer(), sa.BigInteger())
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Невозможен, если уже выданы id длиннее 32 бит (MESSAGE_ID_STRATEGY=snowflake).
+    """
+    _retype(sa.BigInteger(), sa.Integer())
+    op.execute("ALTER SEQUENCE messages_id_seq AS integer")
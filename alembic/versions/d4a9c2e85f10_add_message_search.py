@@ -0,0 +1,63 @@
+"""Add full-text search vector to messages
+
+Revision ID: d4a9c2e85f10
+Revises: b3e7a0c4d912
+Create Date: 2026-10-18 17:20:33.104876
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "d4a9c2e85f10"
+down_revision: Union[str, Sequence[str], None] = "b3e7a0c4d912"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Вычисляемый столбец перезаписывает все партиции, а индексы на
+    секционированной таблице строятся без CONCURRENTLY: на большой базе
+    миграцию стоит запускать в окно обслуживания.
+    """
+    op.add_column(
+        "messages",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('simple', text)", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_messages_search_vector",
+        "messages",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    if settings.SEARCH_TRIGRAM:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.create_index(
+            "ix_messages_text_trgm",
+            "messages",
+            ["text"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={"text": "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_messages_text_trgm", table_name="messages", if_exists=True)
+    op.drop_index("ix_messages_search_vector", table_name="messages")
+    op.drop_column("messages", "search_vector")
@@ -0,0 +1,42 @@
+"""Add DEFAULT partition for messages
+
+Revision ID: d8e2a4f6b019
+Revises: b6f0d3a18e42
+Create Date: 2026-10-18 21:12:36.804517
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d8e2a4f6b019"
+down_revision: Union[str, Sequence[str], None] = "b6f0d3a18e42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Вставка с created_at вне созданных месяцев не падает, а попадает сюда;
+    # приложение переносит такие строки, когда создает партицию месяца
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    stray = (
+        op.get_bind()
+        .execute(sa.text("SELECT count(*) FROM messages_default"))
+        .scalar_one()
+    )
+    if stray:
+        raise RuntimeError(
+            f"messages_default holds {stray} messages; create partitions "
+            f"for their months before downgrading"
+        )
+    op.drop_table("messages_default")
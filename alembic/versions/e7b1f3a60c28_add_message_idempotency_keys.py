@@ -0,0 +1,52 @@
+"""Add message idempotency keys
+
+Revision ID: e7b1f3a60c28
+Revises: d4a9c2e85f10
+Create Date: 2026-10-18 18:02:15.640218
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b1f3a60c28"
+down_revision: Union[str, Sequence[str], None] = "d4a9c2e85f10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "message_idempotency_keys",
+        sa.Column("chat_id", sa.Integer(), nullable=False),
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("message_id", sa.Integer(), nullable=False),
+        sa.Column("message_created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["chat_id"], ["chats.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("chat_id", "key"),
+    )
+    op.create_index(
+        op.f("ix_message_idempotency_keys_created_at"),
+        "message_idempotency_keys",
+        ["created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_message_idempotency_keys_created_at"),
+        table_name="message_idempotency_keys",
+    )
+    op.drop_table("message_idempotency_keys")
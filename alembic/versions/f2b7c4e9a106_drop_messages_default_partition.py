@@ -0,0 +1,61 @@
+"""Drop DEFAULT partition for messages
+
+Revision ID: f2b7c4e9a106
+Revises: a4c7e2d91b53
+Create Date: 2026-10-18 23:40:12.529184
+
+"""
+
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f2b7c4e9a106"
+down_revision: Union[str, Sequence[str], None] = "a4c7e2d91b53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # С DEFAULT-партицией первая страница истории читается через Merge Append
+    # по всем месяцам; строки из нее переезжают в партиции своих месяцев
+    months = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT DISTINCT date_trunc('month', created_at "
+                "AT TIME ZONE 'UTC')::date FROM messages_default"
+            )
+        )
+        .scalars()
+        .all()
+    )
+    op.execute("ALTER TABLE messages DETACH PARTITION messages_default")
+    for month in months:
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS "
+            f"messages_y{month.year:04d}m{month.month:02d} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month} 00:00+00') "
+            f"TO ('{_add_months(month, 1)} 00:00+00')"
+        )
+    op.execute(
+        "INSERT INTO messages (id, chat_id, text, created_at) "
+        "SELECT id, chat_id, text, created_at FROM messages_default"
+    )
+    op.drop_table("messages_default")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT"
+    )
@@ -0,0 +1,34 @@
+"""Add rate limit buckets
+
+Revision ID: f2c8d5e91a37
+Revises: e7b1f3a60c28
+Create Date: 2026-10-18 18:40:52.318406
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f2c8d5e91a37"
+down_revision: Union[str, Sequence[str], None] = "e7b1f3a60c28"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "rate_limit_buckets",
+        sa.Column("key", sa.String(length=200), nullable=False),
+        sa.Column("tat", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+        prefixes=["UNLOGGED"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("rate_limit_buckets")
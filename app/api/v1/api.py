@@ -1,7 +1,8 @@
 """Конфигурация маршрутизатора API v1"""
 
 from fastapi import APIRouter
-from app.api.v1.endpoints import chats
+from app.api.v1.endpoints import chats, search
 
 api_router = APIRouter()
 api_router.include_router(chats.router, prefix="/chats", tags=["chats"])
+api_router.include_router(search.router, prefix="/search", tags=["search"])
@@ -1,74 +1,533 @@
+import asyncio
+import hashlib
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import NonNegativeInt
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from app import crud
-from app.core.db import get_db
-from app.schemas.chat import ChatCreate, ChatRead, ChatWithMessages
-from app.schemas.message import MessageCreate, MessageRead
+from app.core.broadcast import Subscription, broadcast, hub
+from app.core.config import settings
+from app.core.db import (
+    AsyncSessionLocal,
+    get_db,
+    get_read_db,
+    read_session_factory,
+)
+from app.core.idempotency import idempotency_cache
+from app.core.pagination import decode_cursor
+from app.core.ratelimit import limit_message_rate
+from app.core.serialization import dumps
+from app.models.idempotency_key import KEY_LENGTH
+from app.schemas.chat import (
+    ChatCreate,
+    ChatList,
+    ChatRead,
+    ChatSync,
+    ChatWithMessages,
+)
+from app.schemas.message import MessageBulkItem, MessageCreate, MessageRead
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def _publish(messages: Sequence[Row]) -> None:
+    """Рассылает закоммиченные сообщения подписчикам чатов."""
+    for message in messages:
+        if broadcast.has_audience(message.chat_id):
+            payload = dumps(message._asdict()).decode()
+            broadcast.publish(message.chat_id, message.id, payload)
+
+
 @router.post("/", response_model=ChatRead, status_code=status.HTTP_201_CREATED)
 async def create_chat(
     chat_in: ChatCreate, db: AsyncSession = Depends(get_db)
 ) -> ChatRead:
     """Инициализирует новый чат."""
-    logger.info(f"Request to create chat with title: '{chat_in.title}'")
+    logger.info("Request to create chat with title: '%s'", chat_in.title)
     chat = await crud.chat.create(db, obj_in=chat_in)
-    logger.info(f"Chat created successfully with id={chat.id}")
+    logger.info("Chat created successfully with id=%s", chat.id)
     return chat
 
 
+@router.get("/", response_model=ChatList)
+async def list_chats(
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[str] = Query(None, description="Курсор следующей страницы"),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """Список чатов, отсортированный по последней активности."""
+    try:
+        cursor = decode_cursor(before) if before else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    page = await crud.chat.list_by_activity(db, limit=limit, before=cursor)
+    return Response(content=dumps(page), media_type="application/json")
+
+
 @router.post(
     "/{chat_id}/messages/",
     response_model=MessageRead,
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(limit_message_rate)],
 )
 async def create_message(
-    chat_id: int, message_in: MessageCreate, db: AsyncSession = Depends(get_db)
+    chat_id: int,
+    message_in: MessageCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=KEY_LENGTH),
+    db: AsyncSession = Depends(get_db),
 ) -> MessageRead:
-    """Публикует сообщение в указанный чат."""
-    logger.debug(f"Request to add message to chat_id={chat_id}")
+    """Публикует сообщение в указанный чат.
 
-    chat = await crud.chat.get(db, obj_id=chat_id)
-    if not chat:
-        logger.warning(f"Failed to add message: Chat with id={chat_id} not found")
+    С заголовком `Idempotency-Key` повтор запроса возвращает исходное
+    сообщение вместо новой вставки.
+    """
+    logger.debug("Request to add message to chat_id=%s", chat_id)
+
+    if idempotency_key is not None:
+        return await _create_message_idempotent(
+            db, chat_id, message_in, idempotency_key, response
+        )
+    if crud.message_buffer.running:
+        message = await crud.message_buffer.submit(chat_id, message_in.text)
+    else:
+        message = await crud.chat.create_message(db, chat_id=chat_id, obj_in=message_in)
+    if message is None:
+        logger.warning("Failed to add message: Chat with id=%s not found", chat_id)
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    message = await crud.chat.create_message(db, chat_id=chat_id, obj_in=message_in)
-    logger.info(f"Message created in chat_id={chat_id}, message_id={message.id}")
+    _publish([message])
+    logger.info("Message created in chat_id=%s, message_id=%s", chat_id, message.id)
     return message
 
 
+async def _create_message_idempotent(
+    db: AsyncSession,
+    chat_id: int,
+    message_in: MessageCreate,
+    key: str,
+    response: Response,
+) -> MessageRead:
+    """Отправка с ключом идемпотентности.
+
+    Повтор сначала ищется в LRU процесса, затем его отсекает уникальный
+    ключ в БД при вставке. Буфер записи не используется: ключ должен
+    вставляться в одной транзакции с сообщением.
+    """
+    message = idempotency_cache.get(chat_id, key)
+    created = False
+    if message is None:
+        row, created = await crud.chat.create_message_idempotent(
+            db, chat_id=chat_id, obj_in=message_in, key=key
+        )
+        if row is None and created:
+            logger.warning("Failed to add message: Chat with id=%s not found", chat_id)
+            raise HTTPException(status_code=404, detail="Chat not found")
+        if row is None:
+            raise HTTPException(
+                status_code=409, detail="Idempotency key refers to a deleted message"
+            )
+        message = row._asdict()
+        idempotency_cache.put(chat_id, key, message)
+        if created:
+            _publish([row])
+            logger.info("Message created in chat_id=%s, message_id=%s", chat_id, row.id)
+            return message
+
+    if message["text"] != message_in.text:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency key was already used with a different message",
+        )
+    response.headers["Idempotent-Replayed"] = "true"
+    return message
+
+
+@router.post(
+    "/{chat_id}/messages/bulk/",
+    response_model=List[MessageRead],
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_messages_in_chat(
+    chat_id: int,
+    messages_in: List[MessageCreate] = Body(
+        ..., min_length=1, max_length=settings.MESSAGE_BULK_MAX_ITEMS
+    ),
+    db: AsyncSession = Depends(get_db),
+) -> List[MessageRead]:
+    """Публикует пачку сообщений в указанный чат одной транзакцией."""
+    items = [
+        MessageBulkItem(chat_id=chat_id, text=message.text) for message in messages_in
+    ]
+    return await _create_messages(db, items)
+
+
+@router.post(
+    "/messages/bulk/",
+    response_model=List[MessageRead],
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_messages(
+    messages_in: List[MessageBulkItem] = Body(
+        ..., min_length=1, max_length=settings.MESSAGE_BULK_MAX_ITEMS
+    ),
+    db: AsyncSession = Depends(get_db),
+) -> List[MessageRead]:
+    """Публикует пачку сообщений в разные чаты одной транзакцией."""
+    return await _create_messages(db, messages_in)
+
+
+async def _create_messages(
+    db: AsyncSession, items: List[MessageBulkItem]
+) -> List[MessageRead]:
+    """Общая часть пакетных эндпоинтов."""
+    logger.debug("Request to add %s messages", len(items))
+
+    messages = await crud.chat.create_messages(db, objs_in=items)
+    if messages is None:
+        logger.warning("Failed to add messages: some chats not found")
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    _publish(messages)
+    logger.info("Bulk created %s messages", len(messages))
+    return messages
+
+
+@router.post("/sync", response_model=ChatSync)
+async def sync_chats(
+    chats: Dict[int, NonNegativeInt] = Body(
+        ...,
+        embed=True,
+        min_length=1,
+        max_length=settings.SYNC_MAX_CHATS,
+        description="id последнего известного сообщения по id чата; 0 - с начала",
+    ),
+    limit: int = Query(50, ge=1, le=100, description="Сообщений на чат"),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """Новые сообщения многих чатов за один запрос, например после переподключения.
+
+    Возвращает только чаты с новыми сообщениями; `last_message_id` -
+    значение для следующей синхронизации. При `has_more` остаток
+    догружается следующим вызовом.
+    """
+    result = await crud.chat.sync(db, last_seen=chats, limit=limit)
+    logger.debug(
+        "Synced %s chats, %s with new messages", len(chats), len(result["chats"])
+    )
+    return Response(content=dumps(result), media_type="application/json")
+
+
+def _history_etag(
+    chat_id: int,
+    limit: int,
+    before: Optional[str],
+    after: Optional[str],
+    version: Tuple[int, int, int],
+) -> str:
+    """ETag страницы истории по версии чата.
+
+    Версия - (последнее сообщение, число сообщений, поколение). Новые
+    сообщения меняют только страницы без `before`. Удаление старых сообщений
+    и перенос в архив увеличивают поколение и меняют все страницы.
+    """
+    last_message_id, message_count, generation = version
+    if before:
+        key = f"{chat_id}:{limit}:b:{before}:{generation}"
+    else:
+        key = (
+            f"{chat_id}:{limit}:a:{after or ''}:"
+            f"{last_message_id}:{message_count}:{generation}"
+        )
+    return f'W/"{hashlib.blake2b(key.encode(), digest_size=8).hexdigest()}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Слабое сравнение ETag с заголовком If-None-Match."""
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+async def _load_history(
+    db: AsyncSession, chat_id: int, params: Dict[str, Any]
+) -> Optional[Tuple[bytes, Tuple[int, int, int]]]:
+    """Читает страницу истории и сериализует ее.
+
+    Возвращает тело ответа и версию чата для ETag или None, если чата нет.
+    Версия читается в той же сессии до страницы: сообщение, вставленное
+    между чтениями, попадет в следующий ответ, а не спрячется за 304.
+    """
+    version = await crud.chat.get_history_version(db, chat_id=chat_id)
+    if version is None:
+        return None
+    # Ответ сериализуется сразу в байты, минуя ORM и повторную валидацию
+    # response_model; схема в OpenAPI остается прежней
+    first_page = params["before"] is None and params["after"] is None
+    if settings.HISTORY_JSON_AGG and (not first_page or not crud.chat.cache.window):
+        body = await crud.chat.get_history_json(db, chat_id=chat_id, **params)
+        return (body, version) if body is not None else None
+
+    page = await crud.chat.get_history_page(db, chat_id=chat_id, **params)
+    if page is None:
+        return None
+    chat, message_count = page
+    if message_count is not None:
+        # Первая страница может прийти из кэша: версия берется по ней самой,
+        # чтобы отставший кэш не отдал старую страницу под новым ETag
+        newest_id = chat["messages"][-1]["id"] if chat["messages"] else 0
+        version = (newest_id, message_count, version[2])
+    return dumps(chat), version
+
+
 @router.get("/{chat_id}", response_model=ChatWithMessages)
 async def get_chat(
     chat_id: int,
+    request: Request,
     limit: int = Query(20, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
-) -> ChatWithMessages:
-    """Загружает историю чата с пагинацией."""
-    logger.debug(f"Fetching chat_id={chat_id} with limit={limit}")
+    before: Optional[str] = Query(None, description="Курсор для более старых"),
+    after: Optional[str] = Query(None, description="Курсор для более новых"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """Загружает историю чата с пагинацией.
+
+    Ответ помечается ETag; при совпадении If-None-Match возвращается 304
+    без чтения и сериализации сообщений. Одновременные одинаковые запросы
+    объединяются в одно чтение.
+    """
+    logger.debug("Fetching chat_id=%s with limit=%s", chat_id, limit)
+
+    if before and after:
+        raise HTTPException(
+            status_code=400, detail="Use either 'before' or 'after', not both"
+        )
+    try:
+        before_cursor = decode_cursor(before) if before else None
+        after_cursor = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    headers = {"Cache-Control": "private, no-cache"}
+    if if_none_match:
+        version = await crud.chat.get_history_version(db, chat_id=chat_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        etag = _history_etag(chat_id, limit, before, after, version)
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={**headers, "ETag": etag})
+
+    params = {"limit": limit, "before": before_cursor, "after": after_cursor}
+    if settings.HISTORY_SINGLE_FLIGHT:
+        # Одинаковые запросы делят один запрос к БД и одно тело ответа.
+        # Чтение идет в своей сессии: запрос, начавший его, может отмениться
+        session_factory = read_session_factory(request)
+        key = (chat_id, limit, before, after, session_factory is AsyncSessionLocal)
+
+        async def load() -> Optional[Tuple[bytes, Tuple[int, int, int]]]:
+            async with session_factory() as flight_db:
+                return await _load_history(flight_db, chat_id, params)
+
+        # Соединение проверки ETag возвращается в пул до чтения: иначе
+        # запрос держит два соединения и при малом пуле ждет сам себя
+        await db.close()
+        page = await crud.chat.flights.do(key, load)
+    else:
+        page = await _load_history(db, chat_id, params)
+
+    if page is None:
+        logger.warning("Chat retrieval failed: Chat with id=%s not found", chat_id)
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    body, version = page
+    headers["ETag"] = _history_etag(chat_id, limit, before, after, version)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def _export_stream(
+    session_factory: async_sessionmaker,
+    chat: Dict[str, Any],
+    export_format: str,
+) -> AsyncIterator[bytes]:
+    """Формирует выгрузку чата по частям, по одной на пачку строк."""
+    async with session_factory() as db:
+        batches = crud.chat.stream_messages(
+            db, chat_id=chat["id"], batch_size=settings.EXPORT_BATCH_SIZE
+        )
+        if export_format == "ndjson":
+            async for messages in batches:
+                yield b"".join(dumps(message) + b"\n" for message in messages)
+            return
+
+        yield dumps(chat)[:-1] + b',"messages":['
+        separator = b""
+        async for messages in batches:
+            yield separator + b",".join(dumps(message) for message in messages)
+            separator = b","
+        yield b"]}"
+
+
+@router.get("/{chat_id}/export", response_class=StreamingResponse)
+async def export_chat(
+    chat_id: int,
+    request: Request,
+    export_format: Literal["json", "ndjson"] = Query("ndjson", alias="format"),
+    db: AsyncSession = Depends(get_read_db),
+) -> StreamingResponse:
+    """Выгружает всю историю чата потоком: JSON или NDJSON (по сообщению в строке).
 
-    chat = await crud.chat.get_with_messages(db, chat_id=chat_id, limit=limit)
+    Сообщения читаются серверным курсором и отправляются по мере чтения,
+    поэтому память не растет с размером чата.
+    """
+    chat = await crud.chat.get(db, obj_id=chat_id)
     if not chat:
-        logger.warning(f"Chat retrieval failed: Chat with id={chat_id} not found")
         raise HTTPException(status_code=404, detail="Chat not found")
+    chat_data = {"id": chat.id, "title": chat.title, "created_at": chat.created_at}
+    # Поток читает своей сессией: соединение запроса больше не нужно
+    await db.close()
 
-    return chat
+    media_type = (
+        "application/x-ndjson" if export_format == "ndjson" else "application/json"
+    )
+    filename = f"chat-{chat_id}.{export_format}"
+    return StreamingResponse(
+        _export_stream(read_session_factory(request), chat_data, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def _forward(websocket: WebSocket, subscription: Subscription) -> None:
+    """Пересылает сообщения подписки в WebSocket."""
+    async for payload in subscription:
+        await websocket.send_text(payload)
+
+
+async def _wait_disconnect(websocket: WebSocket) -> None:
+    """Ждет отключения клиента, игнорируя входящие сообщения."""
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@router.websocket("/{chat_id}/ws")
+async def subscribe_ws(
+    websocket: WebSocket, chat_id: int, db: AsyncSession = Depends(get_read_db)
+):
+    """Подписка на новые сообщения чата через WebSocket."""
+    if not await crud.chat.get(db, obj_id=chat_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    # Соединение с БД не должно удерживаться на все время подписки
+    await db.close()
+
+    await websocket.accept()
+    with hub.subscribe(chat_id) as subscription:
+        sender = asyncio.create_task(_forward(websocket, subscription))
+        receiver = asyncio.create_task(_wait_disconnect(websocket))
+        done, pending = await asyncio.wait(
+            {sender, receiver}, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+        if subscription.dropped:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+
+
+async def _event_stream(chat_id: int) -> AsyncIterator[str]:
+    """Формирует поток Server-Sent Events с периодическим heartbeat."""
+    with hub.subscribe(chat_id) as subscription:
+        iterator = aiter(subscription)
+        while True:
+            try:
+                payload = await asyncio.wait_for(
+                    anext(iterator), timeout=settings.SSE_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            except StopAsyncIteration:
+                return
+            yield f"event: message\ndata: {payload}\n\n"
 
 
-@router.delete("/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_chat(chat_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/{chat_id}/events")
+async def subscribe_sse(
+    chat_id: int, db: AsyncSession = Depends(get_read_db)
+) -> StreamingResponse:
+    """Подписка на новые сообщения чата через Server-Sent Events."""
+    if not await crud.chat.get(db, obj_id=chat_id):
+        raise HTTPException(status_code=404, detail="Chat not found")
+    await db.close()
+
+    return StreamingResponse(
+        _event_stream(chat_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+async def _purge_chat(chat_id: int) -> None:
+    """Фоновое удаление большого чата пачками."""
+    async with AsyncSessionLocal() as db:
+        deleted = await crud.chat.purge(
+            db, chat_id=chat_id, batch_size=settings.CHAT_PURGE_BATCH_SIZE
+        )
+    logger.info("Chat_id=%s purged in background, messages=%s", chat_id, deleted)
+
+
+@router.delete(
+    "/{chat_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"description": "Удаление запланировано в фоне"}},
+)
+async def delete_chat(
+    chat_id: int,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    background: bool = Query(False, description="Удалить чат в фоне пачками"),
+    db: AsyncSession = Depends(get_db),
+):
     """Удаляет чат и всю связанную переписку."""
-    logger.info(f"Request to delete chat_id={chat_id}")
+    logger.info("Request to delete chat_id=%s", chat_id)
 
-    chat = await crud.chat.remove(db, obj_id=chat_id)
-    if not chat:
-        logger.warning(f"Deletion failed: Chat with id={chat_id} not found")
+    if background:
+        if not await crud.chat.get(db, obj_id=chat_id):
+            logger.warning("Deletion failed: Chat with id=%s not found", chat_id)
+            raise HTTPException(status_code=404, detail="Chat not found")
+        background_tasks.add_task(_purge_chat, chat_id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return None
+
+    if not await crud.chat.remove(db, obj_id=chat_id):
+        logger.warning("Deletion failed: Chat with id=%s not found", chat_id)
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    logger.info(f"Chat_id={chat_id} and its messages deleted successfully")
+    logger.info("Chat_id=%s and its messages deleted successfully", chat_id)
     return None
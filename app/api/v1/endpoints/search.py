@@ -0,0 +1,47 @@
+import logging
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.core.config import settings
+from app.core.db import get_read_db
+from app.core.pagination import decode_rank_cursor
+from app.core.serialization import dumps
+from app.schemas.message import MessageSearchResults
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.get("/messages", response_model=MessageSearchResults)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    chat_id: Optional[int] = Query(None, description="Искать только в этом чате"),
+    mode: Literal["fts", "substring"] = Query(
+        "fts", description="Полнотекстовый поиск по словам или поиск подстроки"
+    ),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы"),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """Ищет сообщения по тексту, самые релевантные первыми."""
+    logger.debug("Searching messages, chat_id=%s, mode=%s", chat_id, mode)
+
+    if mode == "substring" and not settings.SEARCH_TRIGRAM:
+        raise HTTPException(status_code=400, detail="Substring search is disabled")
+    try:
+        after = decode_rank_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    page = await crud.chat.search(
+        db,
+        query=q,
+        chat_id=chat_id,
+        limit=limit,
+        after=after,
+        substring=mode == "substring",
+    )
+    return Response(content=dumps(page), media_type="application/json")
@@ -0,0 +1,151 @@
+import asyncio
+from collections import deque
+from typing import Deque, Optional, Sequence
+
+from .config import settings
+from .metrics import Counter, registry
+from .serialization import dumps
+
+REQUESTS_SHED = registry.register(
+    Counter(
+        "http_requests_shed_total",
+        "Запросы, отклоненные контролем допуска",
+        ("reason",),
+    )
+)
+
+
+class ConcurrencyLimiter:
+    """Ограничение числа одновременно обрабатываемых запросов.
+
+    Сверх `limit` запросы ждут в очереди FIFO длиной не больше `queue_size`
+    и не дольше `timeout` секунд. При полной очереди или по истечении
+    ожидания `acquire` возвращает False, и запрос сразу получает отказ,
+    а не копится в очереди к пулу соединений.
+    """
+
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Занимает слот; False - запрос нужно отклонить."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            REQUESTS_SHED.inc("queue_full")
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # Слот успели передать: возвращаем его следующему
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            REQUESTS_SHED.inc("queue_timeout")
+            return False
+
+    def release(self) -> None:
+        """Освобождает слот, передавая его первому ожидающему."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionMiddleware:
+    """ASGI middleware: контроль допуска HTTP-запросов.
+
+    Слот занимается до отправки заголовков ответа, поэтому потоковые
+    ответы (SSE, выгрузка) не держат его все время передачи. При перегрузке
+    отвечает 503 с Retry-After, не доходя до обработчика и пула соединений.
+    """
+
+    def __init__(
+        self,
+        app,
+        limiter: Optional[ConcurrencyLimiter] = None,
+        exempt_paths: Sequence[str] = ("/metrics",),
+    ):
+        self.app = app
+        self.limiter = limiter or admission_limiter
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        if not await self.limiter.acquire():
+            await _send_overloaded(send)
+            return
+
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.limiter.release()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
+
+
+admission_limiter = ConcurrencyLimiter(
+    settings.ADMISSION_MAX_CONCURRENCY,
+    settings.ADMISSION_QUEUE_SIZE,
+    settings.ADMISSION_QUEUE_TIMEOUT,
+)
+
+registry.callback(
+    "http_requests_admitted",
+    "Запросы, занимающие слот контроля допуска",
+    lambda: admission_limiter.active,
+)
+registry.callback(
+    "http_requests_queued",
+    "Запросы в очереди контроля допуска",
+    lambda: admission_limiter.waiting,
+)
+
+
+async def _send_overloaded(send) -> None:
+    body = dumps({"detail": "Server is overloaded, retry later"})
+    retry_after = str(settings.ADMISSION_RETRY_AFTER_SECONDS).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", retry_after),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,225 @@
+import asyncio
+import datetime
+import logging
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.models.message_archive import MessageArchive
+
+from .config import settings
+from .serialization import dumps
+
+try:
+    import zstandard
+except ImportError:  # без zstandard архив сжимается zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-lock, чтобы воркеры не архивировали одновременно
+LOCK_KEY = 0x6D736761
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+
+def pack_messages(messages: Sequence[Dict[str, Any]]) -> Tuple[str, bytes]:
+    """Сжимает сообщения дня в блок архива; возвращает (кодек, данные)."""
+    raw = dumps([[m["id"], m["text"], m["created_at"]] for m in messages])
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+
+def unpack_messages(chat_id: int, codec: str, data: bytes) -> List[Dict[str, Any]]:
+    """Распаковывает блок архива в сообщения в порядке (created_at, id)."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this archive block")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raw = zlib.decompress(data)
+    return [
+        {
+            "id": message_id,
+            "chat_id": chat_id,
+            "text": body,
+            "created_at": datetime.datetime.fromisoformat(created_at),
+        }
+        for message_id, body, created_at in orjson.loads(raw)
+    ]
+
+
+def archive_day(created_at: datetime.datetime) -> datetime.date:
+    """День (UTC) блока архива, в который попадает сообщение."""
+    return created_at.astimezone(datetime.timezone.utc).date()
+
+
+async def archive_chats(
+    conn: AsyncConnection,
+    chat_ids: Sequence[int],
+    cutoff: datetime.datetime,
+    limit: int,
+) -> int:
+    """Переносит до `limit` сообщений чатов старше `cutoff` в архив.
+
+    Сообщения берутся по порядку (chat_id, created_at, id), поэтому
+    транзакция держит в памяти и блокирует ограниченную пачку, а следующий
+    вызов продолжает с того же места. Последнее сообщение чата остается
+    в messages: на него ссылается строка чата и превью в списке чатов.
+    Возвращает число перенесенных сообщений.
+    """
+    rows = (
+        await conn.execute(
+            text(
+                "WITH batch AS (SELECT m.id, m.created_at FROM messages m "
+                "JOIN chats c ON c.id = m.chat_id "
+                "WHERE m.chat_id = ANY(:chats) AND m.created_at < :cutoff "
+                "AND m.id IS DISTINCT FROM c.last_message_id "
+                "ORDER BY m.chat_id, m.created_at, m.id LIMIT :limit) "
+                "DELETE FROM messages m USING batch b "
+                "WHERE m.id = b.id AND m.created_at = b.created_at "
+                "RETURNING m.chat_id, m.id, m.text, m.created_at"
+            ),
+            {"chats": list(chat_ids), "cutoff": cutoff, "limit": limit},
+        )
+    ).all()
+    if not rows:
+        return 0
+
+    blocks: Dict[Tuple[int, datetime.date], List[Dict[str, Any]]] = {}
+    for row in rows:
+        blocks.setdefault((row.chat_id, archive_day(row.created_at)), []).append(
+            row._asdict()
+        )
+
+    # Сообщения прошлой пачки того же дня и оставленные прошлым проходом
+    # последними дописываются в уже существующие блоки
+    archive = MessageArchive.__table__
+    existing = await conn.execute(
+        archive.select()
+        .where(archive.c.chat_id.in_({chat_id for chat_id, _ in blocks}))
+        .where(archive.c.day.in_({day for _, day in blocks}))
+        .with_for_update()
+    )
+    for block in existing:
+        messages = blocks.get((block.chat_id, block.day))
+        if messages is not None:
+            messages.extend(unpack_messages(block.chat_id, block.codec, block.data))
+
+    values = []
+    for (chat_id, day), messages in blocks.items():
+        messages.sort(key=lambda m: (m["created_at"], m["id"]))
+        codec, data = pack_messages(messages)
+        values.append(
+            {
+                "chat_id": chat_id,
+                "day": day,
+                "message_count": len(messages),
+                "first_created_at": messages[0]["created_at"],
+                "first_id": messages[0]["id"],
+                "last_created_at": messages[-1]["created_at"],
+                "last_id": messages[-1]["id"],
+                "codec": codec,
+                "data": data,
+            }
+        )
+    stmt = insert(archive)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[archive.c.chat_id, archive.c.day],
+        set_={
+            name: stmt.excluded[name]
+            for name in values[0]
+            if name not in ("chat_id", "day")
+        },
+    )
+    await conn.execute(stmt, values)
+    # Страницы истории теперь читаются из архива: их ETag должен смениться
+    await conn.execute(
+        text(
+            "UPDATE chats SET history_version = history_version + 1 "
+            "WHERE id = ANY(:chats)"
+        ),
+        {"chats": sorted({chat_id for chat_id, _ in blocks})},
+    )
+    return len(rows)
+
+
+async def _next_chats(
+    conn: AsyncConnection, after: int, cutoff: datetime.datetime
+) -> List[int]:
+    # Чаты, созданные после cutoff, старых сообщений не имеют
+    result = await conn.execute(
+        text(
+            "SELECT id FROM chats WHERE id > :after AND created_at < :cutoff "
+            "ORDER BY id LIMIT :limit"
+        ),
+        {
+            "after": after,
+            "cutoff": cutoff,
+            "limit": settings.MESSAGES_ARCHIVE_BATCH_CHATS,
+        },
+    )
+    return list(result.scalars())
+
+
+class MessageArchiver:
+    """Периодически переносит старые сообщения в архив.
+
+    Горячая таблица messages остается небольшой, а история старше
+    `MESSAGES_ARCHIVE_AFTER_DAYS` дней читается из сжатых блоков.
+    Чаты обрабатываются пачками по `MESSAGES_ARCHIVE_BATCH_CHATS`,
+    сообщения пачки переносятся транзакциями не больше
+    `MESSAGES_ARCHIVE_BATCH_MESSAGES` строк.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, today: Optional[datetime.date] = None) -> int:
+        today = today or datetime.datetime.now(datetime.timezone.utc).date()
+        day = today - datetime.timedelta(days=settings.MESSAGES_ARCHIVE_AFTER_DAYS)
+        cutoff = datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc)
+
+        limit = settings.MESSAGES_ARCHIVE_BATCH_MESSAGES
+        moved, after = 0, 0
+        while True:
+            async with self.engine.connect() as conn:
+                chat_ids = await _next_chats(conn, after, cutoff)
+            if not chat_ids:
+                break
+            while True:
+                async with self.engine.begin() as conn:
+                    await conn.execute(
+                        text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY}
+                    )
+                    count = await archive_chats(conn, chat_ids, cutoff, limit)
+                moved += count
+                if count < limit:
+                    break
+            after = chat_ids[-1]
+        if moved:
+            logger.info("Archived %s messages older than %s", moved, day)
+        return moved
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning("Message archiving failed: %r", e)
+            await asyncio.sleep(settings.MESSAGES_ARCHIVE_CHECK_SECONDS)
@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+)
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from .config import settings
+from .serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Ошибки оборванного соединения: запрос повторяется после переподключения
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InternalClientError,
+)
+
+
+class Subscription:
+    """Подписка на новые сообщения одного чата.
+
+    Сообщения копятся в ограниченной очереди. Если подписчик не успевает
+    их забирать, хаб отключает его, не задерживая остальных.
+    """
+
+    def __init__(self, hub: "MessageHub", chat_id: int, queue_size: int):
+        self.hub = hub
+        self.chat_id = chat_id
+        self.dropped = False
+        self._queue: asyncio.Queue[Optional[str]] = asyncio.Queue(queue_size)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.hub.unsubscribe(self)
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self
+
+    async def __anext__(self) -> str:
+        payload = await self._queue.get()
+        if payload is None:
+            raise StopAsyncIteration
+        return payload
+
+    def deliver(self, payload: str) -> bool:
+        """Кладет сообщение в очередь. Возвращает False, если она заполнена."""
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def drop(self) -> None:
+        """Отключает подписчика: очередь очищается, итерация завершается."""
+        self.dropped = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+
+class MessageHub:
+    """Реестр подписчиков по чатам внутри процесса."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+
+    def subscribe(self, chat_id: int) -> Subscription:
+        """Регистрирует подписчика на чат."""
+        subscription = Subscription(self, chat_id, self.queue_size)
+        self._subscribers.setdefault(chat_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Удаляет подписчика из реестра."""
+        subscribers = self._subscribers.get(subscription.chat_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.chat_id]
+
+    def subscriber_count(self, chat_id: int) -> int:
+        """Возвращает число подписчиков чата."""
+        return len(self._subscribers.get(chat_id, ()))
+
+    def publish(self, chat_id: int, payload: str) -> None:
+        """Рассылает сериализованное сообщение подписчикам чата."""
+        for subscription in list(self._subscribers.get(chat_id, ())):
+            if not subscription.deliver(payload):
+                logger.warning("Dropping slow subscriber of chat_id=%s", chat_id)
+                self.unsubscribe(subscription)
+                subscription.drop()
+
+
+class LocalBroadcast:
+    """Рассылка новых сообщений только подписчикам текущего процесса."""
+
+    def __init__(self, hub: MessageHub):
+        self.hub = hub
+        # Вызываются при сообщениях из других процессов с id чата;
+        # None означает, что часть сообщений могла быть пропущена
+        self.remote_listeners: List[Callable[[Optional[int]], Awaitable[None]]] = []
+
+    async def start(self) -> None:
+        """Запускает бэкенд."""
+
+    async def stop(self) -> None:
+        """Останавливает бэкенд."""
+
+    def has_audience(self, chat_id: int) -> bool:
+        """Возвращает True, если сообщение чата кому-то нужно доставить."""
+        return self.hub.subscriber_count(chat_id) > 0
+
+    def publish(self, chat_id: int, message_id: int, payload: str) -> None:
+        """Рассылает сериализованное сообщение."""
+        self.hub.publish(chat_id, payload)
+
+
+class PostgresBroadcast(LocalBroadcast):
+    """Рассылка между процессами через Postgres LISTEN/NOTIFY.
+
+    Каждый процесс держит одно выделенное соединение: на нем он слушает
+    канал и отправляет уведомления. Сообщения, опубликованные в пределах
+    BROADCAST_BATCH_DELAY_MS, уходят пачкой в одном NOTIFY. Сообщение, не
+    влезающее в лимит payload, передается ссылкой и дочитывается из БД.
+    После переподключения пропущенные сообщения дочитываются по id; id
+    выдаются до коммита, поэтому сообщение, закоммиченное позже более
+    нового, при обрыве может не дойти (кэши при этом сбрасываются целиком).
+    Подписчикам, которым нужна полная история, стоит перечитать ее после
+    переподключения.
+    """
+
+    # Лимит payload NOTIFY - 8000 байт, оставляем запас на обертку
+    MAX_PAYLOAD = 7900
+    MAX_PENDING = 10000
+
+    def __init__(
+        self,
+        hub: MessageHub,
+        dsn: str,
+        channel: str,
+        batch_delay: float,
+        reconnect_delay: float,
+        catchup_limit: int,
+    ):
+        super().__init__(hub)
+        self.dsn = dsn
+        self.channel = channel
+        self.batch_delay = batch_delay
+        self.reconnect_delay = reconnect_delay
+        self.catchup_limit = catchup_limit
+        self.last_seen_id: Optional[int] = None
+        self._conn: Optional[asyncpg.Connection] = None
+        self._pid: Optional[int] = None
+        self._pending: List[str] = []
+        # asyncpg не допускает параллельных запросов в одном соединении
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._connected = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # Ссылки на разовые задачи, чтобы их не собрал сборщик мусора
+        self._background: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """Запускает фоновые задачи.
+
+        Подключение идет в фоне: недоступная БД не мешает приложению
+        запуститься, а сообщения копятся до подключения.
+        """
+        self._tasks = [
+            asyncio.create_task(self._supervise()),
+            asyncio.create_task(self._flush_loop()),
+        ]
+
+    async def wait_connected(self) -> None:
+        """Ждет, пока канал будет слушаться."""
+        await self._connected.wait()
+
+    async def stop(self) -> None:
+        """Останавливает фоновые задачи и закрывает соединение."""
+        tasks = [*self._tasks, *self._background]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+
+    def has_audience(self, chat_id: int) -> bool:
+        return True
+
+    def publish(self, chat_id: int, message_id: int, payload: str) -> None:
+        self._seen(message_id)
+        self.hub.publish(chat_id, payload)
+        item = {"c": chat_id, "i": message_id, "m": payload}
+        encoded = json.dumps(item, separators=(",", ":"))
+        if len(encoded.encode()) > self.MAX_PAYLOAD:
+            del item["m"]
+            encoded = json.dumps(item, separators=(",", ":"))
+        self._pending.append(encoded)
+        if len(self._pending) > self.MAX_PENDING:
+            del self._pending[0]
+        self._wakeup.set()
+
+    def _seen(self, message_id: int) -> None:
+        if self.last_seen_id is None or message_id > self.last_seen_id:
+            self.last_seen_id = message_id
+
+    async def _supervise(self) -> None:
+        """Держит соединение открытым и переподключается при обрыве."""
+        while True:
+            try:
+                await self._connect()
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                asyncpg.PostgresError,
+                asyncpg.InterfaceError,
+            ) as e:
+                logger.warning("Broadcast connection failed: %r", e)
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            await self._lost.wait()
+            logger.warning("Broadcast connection lost, reconnecting")
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _connect(self) -> None:
+        self._connected.clear()
+        self._lost.clear()
+        if self._conn is not None:
+            self._conn.terminate()
+        conn = await asyncpg.connect(self.dsn)
+        try:
+            conn.add_termination_listener(lambda _: self._lost.set())
+            await conn.add_listener(self.channel, self._on_notify)
+            if self.last_seen_id is None:
+                self.last_seen_id = await conn.fetchval(
+                    "SELECT coalesce(max(id), 0) FROM messages"
+                )
+            else:
+                await self._catch_up(conn)
+                self._remote_changed([None])
+        except BaseException:
+            await conn.close()
+            raise
+        self._conn, self._pid = conn, conn.get_server_pid()
+        self._connected.set()
+        self._wakeup.set()
+
+    async def _catch_up(self, conn: asyncpg.Connection) -> None:
+        """Доставляет сообщения, опубликованные, пока соединения не было."""
+        chat_ids = list(self.hub._subscribers)
+        if not chat_ids:
+            return
+        rows = await conn.fetch(
+            "SELECT id, chat_id, text, created_at FROM messages "
+            "WHERE chat_id = ANY($1::int[]) AND id > $2 ORDER BY id LIMIT $3",
+            chat_ids,
+            self.last_seen_id,
+            self.catchup_limit,
+        )
+        logger.info("Broadcast catch-up delivered %s messages", len(rows))
+        self._deliver_rows(rows)
+
+    def _deliver_rows(self, rows: List[asyncpg.Record]) -> None:
+        for row in rows:
+            self._seen(row["id"])
+            payload = dumps(dict(row)).decode()
+            self.hub.publish(row["chat_id"], payload)
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str) -> None:
+        """Раздает уведомление подписчикам процесса."""
+        if pid == self._pid:
+            # Свои сообщения уже доставлены локально при публикации
+            return
+        items = json.loads(payload)
+        self._remote_changed({item["c"] for item in items})
+        refs: List[int] = []
+        for item in items:
+            self._seen(item["i"])
+            if "m" in item:
+                self.hub.publish(item["c"], item["m"])
+            elif self.hub.subscriber_count(item["c"]):
+                refs.append(item["i"])
+        if refs:
+            self._spawn(self._fetch_refs(refs))
+
+    def _remote_changed(self, chat_ids: Iterable[Optional[int]]) -> None:
+        for listener in self.remote_listeners:
+            for chat_id in chat_ids:
+                self._spawn(listener(chat_id))
+
+    def _spawn(self, coro: Awaitable[None]) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Broadcast task failed: %r", task.exception())
+
+    async def _fetch_refs(self, message_ids: List[int]) -> None:
+        """Дочитывает из БД сообщения, переданные ссылкой.
+
+        При обрыве соединения повторяет после переподключения: догон по
+        id их уже не вернет, так как они отмечены увиденными.
+        """
+        while True:
+            await self._connected.wait()
+            try:
+                async with self._lock:
+                    rows = await self._conn.fetch(
+                        "SELECT id, chat_id, text, created_at FROM messages "
+                        "WHERE id = ANY($1::bigint[]) ORDER BY id",
+                        message_ids,
+                    )
+            except CONNECTION_ERRORS as e:
+                logger.warning("Broadcast fetch failed, retrying: %r", e)
+                self._lost.set()
+                self._connected.clear()
+                continue
+            self._deliver_rows(rows)
+            return
+
+    def _chunks(self, items: List[str]) -> List[str]:
+        """Склеивает сообщения в JSON-массивы в пределах лимита NOTIFY."""
+        chunks, current, size = [], [], 2
+        for item in items:
+            item_size = len(item.encode()) + 1
+            if current and size + item_size > self.MAX_PAYLOAD:
+                chunks.append("[" + ",".join(current) + "]")
+                current, size = [], 2
+            current.append(item)
+            size += item_size
+        if current:
+            chunks.append("[" + ",".join(current) + "]")
+        return chunks
+
+    async def _flush_loop(self) -> None:
+        """Отправляет накопленные сообщения пачками."""
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.batch_delay)
+            await self._connected.wait()
+            self._wakeup.clear()
+            items, self._pending = self._pending, []
+            try:
+                async with self._lock:
+                    for chunk in self._chunks(items):
+                        await self._conn.execute(
+                            "SELECT pg_notify($1, $2)", self.channel, chunk
+                        )
+            except (asyncpg.PostgresError, *CONNECTION_ERRORS) as e:
+                logger.warning("Broadcast NOTIFY failed: %r", e)
+                self._pending[:0] = items
+                self._lost.set()
+                self._connected.clear()
+
+
+def create_broadcast(hub: MessageHub) -> LocalBroadcast:
+    """Создает бэкенд рассылки согласно настройкам."""
+    if settings.BROADCAST_BACKEND == "postgres":
+        dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+        return PostgresBroadcast(
+            hub,
+            dsn=dsn.render_as_string(hide_password=False),
+            channel=settings.BROADCAST_CHANNEL,
+            batch_delay=settings.BROADCAST_BATCH_DELAY_MS / 1000,
+            reconnect_delay=settings.BROADCAST_RECONNECT_SECONDS,
+            catchup_limit=settings.BROADCAST_CATCHUP_LIMIT,
+        )
+    return LocalBroadcast(hub)
+
+
+hub = MessageHub(queue_size=settings.SUBSCRIBER_QUEUE_SIZE)
+broadcast = create_broadcast(hub)
@@ -0,0 +1,285 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Примерные накладные расходы на одно сообщение в памяти, байт
+MESSAGE_OVERHEAD = 250
+
+
+@dataclass
+class CachedPage:
+    """Страница последних сообщений, отданная из кэша."""
+
+    chat: Dict[str, Any]
+    messages: List[Dict[str, Any]]
+    has_older: bool
+    # Число сообщений чата, которому соответствует страница
+    message_count: int
+
+
+class HistoryCache(ABC):
+    """Интерфейс кэша последних сообщений чатов.
+
+    Методы асинхронные, чтобы интерфейс мог реализовать и внешний
+    общий для нескольких узлов бэкенд.
+    """
+
+    # Сколько последних сообщений стоит читать из БД при промахе
+    window: int = 0
+    hits: int = 0
+    misses: int = 0
+
+    @abstractmethod
+    async def get(self, chat_id: int, limit: int) -> Optional[CachedPage]:
+        """Возвращает последние `limit` сообщений или None при промахе."""
+
+    @abstractmethod
+    async def fill_token(self, chat_id: int) -> int:
+        """Возвращает токен, который нужно получить до чтения истории из БД."""
+
+    @abstractmethod
+    async def fill(
+        self,
+        chat_id: int,
+        token: int,
+        chat: Dict[str, Any],
+        messages: Sequence[Dict[str, Any]],
+        complete: bool,
+        message_count: int,
+    ) -> None:
+        """Сохраняет прочитанную из БД историю.
+
+        `messages` идут в хронологическом порядке, `complete` означает, что
+        более старых сообщений у чата нет, `message_count` - счетчик
+        сообщений из строки чата. Если после получения токена чат менялся,
+        данные считаются устаревшими и не сохраняются.
+        """
+
+    @abstractmethod
+    async def append(self, messages: Sequence[Dict[str, Any]]) -> None:
+        """Добавляет закоммиченные сообщения в историю их чатов."""
+
+    @abstractmethod
+    async def invalidate(self, chat_id: int) -> None:
+        """Удаляет историю чата из кэша."""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Очищает кэш."""
+
+
+class NullHistoryCache(HistoryCache):
+    """Отключенный кэш: всегда промах."""
+
+    async def get(self, chat_id: int, limit: int) -> Optional[CachedPage]:
+        return None
+
+    async def fill_token(self, chat_id: int) -> int:
+        return 0
+
+    async def fill(
+        self, chat_id, token, chat, messages, complete, message_count
+    ) -> None:
+        pass
+
+    async def append(self, messages: Sequence[Dict[str, Any]]) -> None:
+        pass
+
+    async def invalidate(self, chat_id: int) -> None:
+        pass
+
+    async def clear(self) -> None:
+        pass
+
+
+@dataclass
+class _Entry:
+    chat: Dict[str, Any]
+    messages: Deque[Dict[str, Any]]
+    complete: bool
+    expires_at: float
+    message_count: int
+    size: int = 0
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    return len(message["text"]) + MESSAGE_OVERHEAD
+
+
+class MemoryHistoryCache(HistoryCache):
+    """Кэш в памяти процесса.
+
+    Для каждого чата хранится кольцевой буфер из `max_messages` последних
+    сообщений. Чаты вытесняются по LRU, когда суммарный размер превышает
+    `max_bytes`. Записи живут не дольше `ttl` секунд.
+    """
+
+    # Сколько последних изменившихся чатов помнить для проверки токенов
+    MAX_TRACKED_WRITES = 10000
+
+    def __init__(self, max_messages: int, max_bytes: int, ttl: float):
+        self.window = max_messages
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._epoch = 0
+        self._floor = 0
+        self._writes: "OrderedDict[int, int]" = OrderedDict()
+
+    async def get(self, chat_id: int, limit: int) -> Optional[CachedPage]:
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry.expires_at < time.monotonic():
+            self._drop(chat_id)
+            entry = None
+        if entry is None or (len(entry.messages) < limit and not entry.complete):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(chat_id)
+        count = len(entry.messages)
+        start = max(count - limit, 0)
+        return CachedPage(
+            chat=entry.chat,
+            messages=[entry.messages[i] for i in range(start, count)],
+            has_older=start > 0 or not entry.complete,
+            message_count=entry.message_count,
+        )
+
+    async def fill_token(self, chat_id: int) -> int:
+        return self._epoch
+
+    async def fill(
+        self, chat_id, token, chat, messages, complete, message_count
+    ) -> None:
+        if token < self._floor or self._writes.get(chat_id, -1) > token:
+            return
+        self._drop(chat_id)
+        entry = _Entry(
+            chat=dict(chat),
+            messages=deque(maxlen=self.max_messages),
+            complete=complete,
+            expires_at=time.monotonic() + self.ttl,
+            message_count=message_count,
+        )
+        self._entries[chat_id] = entry
+        self._push(entry, messages)
+        self._evict()
+
+    async def append(self, messages: Sequence[Dict[str, Any]]) -> None:
+        by_chat: Dict[int, List[Dict[str, Any]]] = {}
+        for message in messages:
+            by_chat.setdefault(message["chat_id"], []).append(message)
+        for chat_id, chat_messages in by_chat.items():
+            self._touch(chat_id)
+            entry = self._entries.get(chat_id)
+            if entry is not None:
+                self._push(entry, chat_messages)
+                entry.message_count += len(chat_messages)
+        self._evict()
+
+    async def invalidate(self, chat_id: int) -> None:
+        self._touch(chat_id)
+        self._drop(chat_id)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._writes.clear()
+        self.size = 0
+        self._floor = self._epoch = self._epoch + 1
+
+    def _push(self, entry: _Entry, messages: Sequence[Dict[str, Any]]) -> None:
+        """Добавляет сообщения в буфер, сохраняя порядок (created_at, id)."""
+        for message in messages:
+            if len(entry.messages) == entry.messages.maxlen:
+                self._resize(entry, -_message_size(entry.messages[0]))
+                entry.complete = False
+            entry.messages.append(message)
+            self._resize(entry, _message_size(message))
+        # Параллельные вставки могут закоммититься не в порядке id
+        tail = max(len(entry.messages) - len(messages), 1)
+        ordered = all(
+            _order_key(entry.messages[i - 1]) <= _order_key(entry.messages[i])
+            for i in range(tail, len(entry.messages))
+        )
+        if not ordered:
+            entry.messages = deque(
+                sorted(entry.messages, key=_order_key), maxlen=entry.messages.maxlen
+            )
+
+    def _resize(self, entry: _Entry, delta: int) -> None:
+        entry.size += delta
+        self.size += delta
+
+    def _touch(self, chat_id: int) -> None:
+        """Отмечает изменение чата, чтобы отклонить заполнение старыми данными."""
+        self._epoch += 1
+        self._writes[chat_id] = self._epoch
+        self._writes.move_to_end(chat_id)
+        if len(self._writes) > self.MAX_TRACKED_WRITES:
+            _, epoch = self._writes.popitem(last=False)
+            self._floor = epoch
+
+    def _drop(self, chat_id: int) -> None:
+        entry = self._entries.pop(chat_id, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and self._entries:
+            chat_id, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+
+
+def _order_key(message: Dict[str, Any]) -> Tuple[Any, int]:
+    return message["created_at"], message["id"]
+
+
+def create_history_cache() -> HistoryCache:
+    """Создает кэш истории согласно настройкам.
+
+    Кэш в памяти видит только записи своего процесса; записи других
+    воркеров сбрасывают его через рассылку Postgres. Поэтому "auto"
+    включает кэш только при BROADCAST_BACKEND=postgres.
+    """
+    backend = settings.HISTORY_CACHE_BACKEND
+    if backend == "auto":
+        backend = "memory" if settings.BROADCAST_BACKEND == "postgres" else "none"
+    elif backend == "memory" and settings.BROADCAST_BACKEND != "postgres":
+        logger.warning(
+            "HISTORY_CACHE_BACKEND=memory without BROADCAST_BACKEND=postgres "
+            "is only safe with a single worker process"
+        )
+    if backend == "memory":
+        return MemoryHistoryCache(
+            max_messages=settings.HISTORY_CACHE_MESSAGES,
+            max_bytes=settings.HISTORY_CACHE_MAX_BYTES,
+            ttl=settings.HISTORY_CACHE_TTL_SECONDS,
+        )
+    return NullHistoryCache()
+
+
+history_cache = create_history_cache()
+
+registry.callback(
+    "history_cache_hits_total",
+    "Чтения истории из кэша",
+    lambda: history_cache.hits,
+    type="counter",
+)
+registry.callback(
+    "history_cache_misses_total",
+    "Чтения истории мимо кэша",
+    lambda: history_cache.misses,
+    type="counter",
+)
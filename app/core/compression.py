@@ -0,0 +1,147 @@
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен: без пакета доступен только gzip
+    zstandard = None
+
+from .config import settings
+
+# Уже сжатые или потоковые форматы, которые сжимать бессмысленно или нельзя
+SKIP_CONTENT_TYPES = (b"text/event-stream", b"image/", b"application/zip")
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        # wbits=31: формат gzip
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        mode = (
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if final
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Выбирает кодировку из Accept-Encoding: zstd, если доступен, иначе gzip."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """ASGI middleware: сжатие ответов gzip или zstd по Accept-Encoding.
+
+    Ответы меньше `minimum_size` отдаются как есть. Потоковые ответы
+    сжимаются по частям со сбросом буфера после каждой, поэтому первый
+    байт уходит клиенту сразу.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = (
+            settings.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode())
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                response_start, start = start, None
+                if not self._should_compress(response_start, body, more_body):
+                    await send(response_start)
+                    await send(message)
+                    return
+                compressor = (
+                    _Zstd(settings.COMPRESSION_ZSTD_LEVEL)
+                    if encoding == "zstd"
+                    else _Gzip(settings.COMPRESSION_GZIP_LEVEL)
+                )
+                await send(
+                    {
+                        **response_start,
+                        "headers": _encoded_headers(response_start, encoding),
+                    }
+                )
+            if compressor is None:
+                await send(message)
+                return
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": compressor.compress(body, final=not more_body),
+                    "more_body": more_body,
+                }
+            )
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(
+        self, start: Dict[str, Any], body: bytes, more_body: bool
+    ) -> bool:
+        if start["status"] < 200 or start["status"] in (204, 304):
+            return False
+        headers = dict(start.get("headers", []))
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"")
+        if any(content_type.startswith(skip) for skip in SKIP_CONTENT_TYPES):
+            return False
+        return more_body or len(body) >= self.minimum_size
+
+
+def _encoded_headers(start: Dict[str, Any], encoding: str) -> List[Tuple[bytes, bytes]]:
+    headers = [
+        (name, value)
+        for name, value in start.get("headers", [])
+        if name.lower() != b"content-length"
+    ]
+    headers.append((b"content-encoding", encoding.encode()))
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
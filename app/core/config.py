@@ -1,3 +1,5 @@
+from typing import List, Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -7,6 +9,118 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     DATABASE_URL: str
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: Literal["json", "text"] = "json"
+    # Доля INFO-записей, попадающих в лог (1.0 - все)
+    LOG_INFO_SAMPLE_RATE: float = 1.0
+    # При переполнении очереди записи отбрасываются, а не блокируют запросы
+    LOG_QUEUE_SIZE: int = 10000
+
+    # Реплики для чтения (JSON-список URL); пустой список - все в основную БД
+    DATABASE_REPLICA_URLS: List[str] = []
+    # Сколько секунд после записи клиент читает из основной БД
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    # Пул соединений и драйвер
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = False
+    # NullPool: соединение на каждую сессию, пулом управляет PgBouncer
+    DB_NULL_POOL: bool = False
+    # Совместимость с PgBouncer: без кэша подготовленных выражений
+    DB_PGBOUNCER: bool = False
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # 0 - без ограничения; с DB_PGBOUNCER задается на роли в БД
+    DB_STATEMENT_TIMEOUT_MS: int = 0
+    # Ожидание соединения дольше порога пишется в лог
+    DB_POOL_SLOW_CHECKOUT_MS: float = 100.0
+
+    # Месячные партиции messages: сколько создавать наперед и сколько хранить
+    MESSAGES_PARTITIONS_AHEAD: int = 3
+    # 0 - хранить все; иначе старые партиции удаляются целиком
+    MESSAGES_RETENTION_MONTHS: int = 0
+    MESSAGES_PARTITION_CHECK_SECONDS: float = 3600.0
+    # Сообщения старше N дней переносятся в сжатый архив (0 - не переносить)
+    MESSAGES_ARCHIVE_AFTER_DAYS: int = 0
+    MESSAGES_ARCHIVE_BATCH_CHATS: int = 100
+    # Сообщений, переносимых в архив одной транзакцией
+    MESSAGES_ARCHIVE_BATCH_MESSAGES: int = 5000
+    MESSAGES_ARCHIVE_CHECK_SECONDS: float = 3600.0
+
+    # Поиск: релевантность считается по стольким последним совпадениям
+    SEARCH_RANK_WINDOW: int = 1000
+    # Поиск подстроки через pg_trgm; индекс создает миграция при включенной опции
+    SEARCH_TRIGRAM: bool = False
+
+    # id сообщений: "serial" - последовательность БД, "snowflake" - 64-битные
+    # упорядоченные по времени id из приложения; у каждого процесса свой
+    # воркер, для snowflake SNOWFLAKE_WORKER_ID обязателен
+    MESSAGE_ID_STRATEGY: Literal["serial", "snowflake"] = "serial"
+    SNOWFLAKE_WORKER_ID: Optional[int] = None
+
+    # Буфер записи: сообщения копятся и вставляются пачкой с одним коммитом
+    MESSAGE_BUFFER_ENABLED: bool = False
+    MESSAGE_BUFFER_MAX_BATCH: int = 500
+    MESSAGE_BUFFER_DELAY_MS: float = 2.0
+    MESSAGE_BUFFER_QUEUE_SIZE: int = 10000
+    # Ключи идемпотентности отправки: сколько хранить и сколько держать в памяти
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_PURGE_SECONDS: float = 600.0
+
+    # Контроль допуска: одновременно обрабатываемые запросы (0 - без лимита),
+    # очередь ожидающих и сколько ждать в ней, прежде чем ответить 503
+    ADMISSION_MAX_CONCURRENCY: int = 100
+    ADMISSION_QUEUE_SIZE: int = 500
+    ADMISSION_QUEUE_TIMEOUT: float = 1.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+
+    # Лимиты отправки сообщений (в секунду и пачкой; 0 - без лимита).
+    # "memory" - в процессе, "postgres" - общие для всех воркеров
+    RATE_LIMIT_BACKEND: Literal["memory", "postgres", "none"] = "none"
+    # Заголовок с адресом клиента от доверенного прокси (X-Real-IP,
+    # X-Forwarded-For); без него клиент - адрес соединения
+    RATE_LIMIT_CLIENT_HEADER: Optional[str] = None
+    RATE_LIMIT_CLIENT_PER_SECOND: float = 20.0
+    RATE_LIMIT_CLIENT_BURST: int = 40
+    RATE_LIMIT_CHAT_PER_SECOND: float = 50.0
+    RATE_LIMIT_CHAT_BURST: int = 100
+    RATE_LIMIT_MAX_KEYS: int = 100000
+
+    CHAT_PURGE_BATCH_SIZE: int = 5000
+    MESSAGE_BULK_MAX_ITEMS: int = 1000
+    # Синхронизация: чатов в одном запросе
+    SYNC_MAX_CHATS: int = 500
+    SUBSCRIBER_QUEUE_SIZE: int = 100
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+
+    # Рассылка новых сообщений: "memory" - внутри процесса,
+    # "postgres" - между процессами через LISTEN/NOTIFY
+    BROADCAST_BACKEND: Literal["memory", "postgres"] = "memory"
+    BROADCAST_CHANNEL: str = "chat_messages"
+    BROADCAST_BATCH_DELAY_MS: float = 5.0
+    BROADCAST_RECONNECT_SECONDS: float = 1.0
+    BROADCAST_CATCHUP_LIMIT: int = 1000
+
+    # Сжатие ответов gzip/zstd (zstd - при установленном zstandard)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 5
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    # Выгрузка чата: строк за одно чтение из серверного курсора
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Кэш последних сообщений чатов: "memory", "none" или "auto" - в памяти,
+    # только если воркеры сбрасывают кэши друг друга (BROADCAST_BACKEND=postgres)
+    HISTORY_CACHE_BACKEND: Literal["auto", "memory", "none"] = "auto"
+    HISTORY_CACHE_MESSAGES: int = 100
+    HISTORY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    HISTORY_CACHE_TTL_SECONDS: float = 60.0
+    # Собирать JSON страниц истории в Postgres (string_agg) при промахе кэша
+    HISTORY_JSON_AGG: bool = False
+    # Одновременные одинаковые чтения истории выполняются одним запросом
+    HISTORY_SINGLE_FLIGHT: bool = True
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
@@ -1,8 +1,119 @@
-from typing import AsyncGenerator
+import itertools
+import logging
+import time
+import uuid
+from typing import Any, AsyncGenerator, Dict, Iterator, Optional
+from fastapi.requests import HTTPConnection
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from .config import settings
+from .metrics import DB_POOL_WAIT, instrument_engine, registry
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Статистика ожидания соединений из пула."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def observe(self, wait: float) -> None:
+        """Учитывает время ожидания одного соединения, в секундах."""
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        DB_POOL_WAIT.observe(wait)
+        if wait * 1000 >= settings.DB_POOL_SLOW_CHECKOUT_MS:
+            self.slow_checkouts += 1
+            logger.warning(
+                "Slow DB pool checkout: waited %.1f ms "
+                "(avg %.1f ms, max %.1f ms over %s)",
+                wait * 1000,
+                self.total_wait / self.checkouts * 1000,
+                self.max_wait * 1000,
+                self.checkouts,
+            )
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, измеряющий время ожидания свободного соединения."""
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.observe(time.perf_counter() - started)
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def engine_options() -> Dict[str, Any]:
+    """Параметры пула и драйвера из настроек."""
+    connect_args: Dict[str, Any] = {
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+    if settings.DB_PGBOUNCER:
+        # PgBouncer в режиме transaction не сохраняет подготовленные выражения
+        # между транзакциями: кэши выключены, имена выражений уникальны
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=_unique_statement_name,
+        )
+        # PgBouncer отклоняет незнакомые параметры запуска, а SET на
+        # соединении достался бы чужим транзакциям: таймаут задается
+        # на роли (ALTER ROLE ... SET statement_timeout)
+        if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+            logger.warning(
+                "DB_STATEMENT_TIMEOUT_MS is ignored with DB_PGBOUNCER; "
+                "set statement_timeout on the database role instead"
+            )
+    elif settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {
+            "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)
+        }
+
+    options: Dict[str, Any] = {"echo": False, "connect_args": connect_args}
+    if settings.DB_NULL_POOL:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    return options
+
+
+def make_engine(url: str) -> AsyncEngine:
+    """Создает движок с настройками пула из конфигурации."""
+    engine = create_async_engine(url, **engine_options())
+    instrument_engine(engine)
+    return engine
+
+
+engine = make_engine(settings.DATABASE_URL)
+
+registry.callback(
+    "db_pool_checked_out",
+    "Соединения, выданные из пула",
+    lambda: getattr(engine.pool, "checkedout", lambda: 0)(),
+)
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
@@ -13,3 +124,104 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Предоставляет сессию базы данных."""
     async with AsyncSessionLocal() as session:
         yield session
+
+
+replica_engines = [make_engine(url) for url in settings.DATABASE_REPLICA_URLS]
+
+_replica_sessions: Optional[Iterator[async_sessionmaker]] = (
+    itertools.cycle(
+        [
+            async_sessionmaker(
+                bind=replica,
+                class_=AsyncSession,
+                expire_on_commit=False,
+                autoflush=False,
+                info={"replica": True},
+            )
+            for replica in replica_engines
+        ]
+    )
+    if replica_engines
+    else None
+)
+
+# Cookie с моментом, до которого чтения клиента идут в основную БД
+PRIMARY_COOKIE = "fastchat_primary_until"
+# Отметка в scope: запрос только читает, хотя метод не GET (например, POST /sync)
+READ_ONLY_SCOPE_KEY = "fastchat.read_only"
+
+
+def is_replica(session: AsyncSession) -> bool:
+    """Сессия открыта на реплике и может видеть данные с отставанием."""
+    return bool(session.info.get("replica"))
+
+
+def pinned_to_primary(request: HTTPConnection) -> bool:
+    """Клиент недавно писал и должен читать свои записи из основной БД."""
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_session_factory(request: HTTPConnection) -> async_sessionmaker:
+    """Выбирает БД для чтения.
+
+    Запросы распределяются по репликам по кругу. Клиент, недавно
+    выполнивший запись, читает из основной БД (read-your-writes).
+    """
+    if _replica_sessions is None or pinned_to_primary(request):
+        return AsyncSessionLocal
+    return next(_replica_sessions)
+
+
+async def get_read_db(
+    request: HTTPConnection,
+) -> AsyncGenerator[AsyncSession, None]:
+    """Предоставляет сессию для чтения.
+
+    Запрос помечается как читающий, чтобы не закреплять клиента
+    за основной БД, даже если метод не GET.
+    """
+    request.scope[READ_ONLY_SCOPE_KEY] = True
+    async with read_session_factory(request)() as session:
+        yield session
+
+
+class PrimaryPinMiddleware:
+    """ASGI middleware: после успешной записи закрепляет клиента за основной БД.
+
+    Ставит cookie на READ_YOUR_WRITES_SECONDS, пока реплики догоняют.
+    """
+
+    SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in self.SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if (
+                message["type"] == "http.response.start"
+                and message["status"] < 400
+                and not scope.get(READ_ONLY_SCOPE_KEY)
+            ):
+                window = settings.READ_YOUR_WRITES_SECONDS
+                cookie = (
+                    f"{PRIMARY_COOKIE}={time.time() + window:.3f}; "
+                    f"Max-Age={int(window) + 1}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"set-cookie", cookie.encode()),
+                    ],
+                }
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
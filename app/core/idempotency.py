@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyCache:
+    """LRU ответов на запросы с ключом идемпотентности в памяти процесса.
+
+    Повтор, попавший в тот же процесс, отвечается без обращения к БД.
+    Хранится не больше `max_entries` записей, каждая не дольше `ttl` секунд;
+    надежную проверку дает уникальный ключ в таблице.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+
+    def get(self, chat_id: int, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get((chat_id, key))
+        if entry is None:
+            return None
+        expires_at, message = entry
+        if expires_at < time.monotonic():
+            del self._entries[(chat_id, key)]
+            return None
+        self._entries.move_to_end((chat_id, key))
+        return message
+
+    def put(self, chat_id: int, key: str, message: Dict[str, Any]) -> None:
+        self._entries[(chat_id, key)] = (time.monotonic() + self.ttl, message)
+        self._entries.move_to_end((chat_id, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class IdempotencyKeyPurger:
+    """Периодически удаляет из БД ключи старше `IDEMPOTENCY_TTL_SECONDS`."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                text(
+                    "DELETE FROM message_idempotency_keys "
+                    "WHERE created_at < now() - make_interval(secs => :ttl)"
+                ),
+                {"ttl": settings.IDEMPOTENCY_TTL_SECONDS},
+            )
+        return result.rowcount
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_PURGE_SECONDS)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning("Idempotency key purge failed: %r", e)
+
+
+idempotency_cache = IdempotencyCache(
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+)
@@ -0,0 +1,66 @@
+import datetime
+import time
+from typing import Optional
+
+from .config import settings
+
+# Начало отсчета времени в id
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+EPOCH_MS = int(EPOCH.timestamp() * 1000)
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class SnowflakeGenerator:
+    """Генератор 64-битных id, упорядоченных по времени (Snowflake).
+
+    id = 41 бит миллисекунд от EPOCH_MS | 10 бит воркера | 12 бит счетчика.
+    В пределах процесса id строго возрастают: при переводе часов назад
+    или исчерпании счетчика за миллисекунду время в id берется наперед.
+    Процессы должны иметь разные `worker_id`.
+    """
+
+    def __init__(self, worker_id: int):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be in [0, {MAX_WORKER_ID}]")
+        self.worker_id = worker_id
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self) -> int:
+        now_ms = int(time.time() * 1000) - EPOCH_MS
+        if now_ms > self._last_ms:
+            self._last_ms, self._sequence = now_ms, 0
+        elif self._sequence < MAX_SEQUENCE:
+            self._sequence += 1
+        else:
+            self._last_ms, self._sequence = self._last_ms + 1, 0
+        return (
+            (self._last_ms << (WORKER_BITS + SEQUENCE_BITS))
+            | (self.worker_id << SEQUENCE_BITS)
+            | self._sequence
+        )
+
+
+def id_time(snowflake_id: int) -> datetime.datetime:
+    """Время создания, закодированное в id."""
+    ms = snowflake_id >> (WORKER_BITS + SEQUENCE_BITS)
+    return EPOCH + datetime.timedelta(milliseconds=ms)
+
+
+def create_message_ids() -> Optional[SnowflakeGenerator]:
+    """Генератор id сообщений или None, если id выдает последовательность БД."""
+    if settings.MESSAGE_ID_STRATEGY != "snowflake":
+        return None
+    # Выводить воркера из pid нельзя: в контейнерах pid у реплик совпадают,
+    # и одинаковые id ломают вставку
+    if settings.SNOWFLAKE_WORKER_ID is None:
+        raise ValueError(
+            "SNOWFLAKE_WORKER_ID must be set for MESSAGE_ID_STRATEGY=snowflake"
+        )
+    return SnowflakeGenerator(settings.SNOWFLAKE_WORKER_ID)
+
+
+message_ids = create_message_ids()
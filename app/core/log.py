@@ -0,0 +1,105 @@
+import atexit
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .config import settings
+from .serialization import dumps
+
+# Атрибуты LogRecord; все остальное попало в запись через extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON, включая поля из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return dumps(data, default=str).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает лишь долю INFO-записей; остальные уровни не трогает."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.INFO or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Кладет записи в ограниченную очередь и не ждет медленный вывод.
+
+    Сообщение не форматируется в вызывающем потоке: это делает слушатель в
+    фоновом потоке. При переполнении очереди запись отбрасывается.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        # Дописывает оставшиеся в очереди записи
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging() -> NonBlockingQueueHandler:
+    """Настраивает корневой логгер: очередь в памяти и вывод в фоновом потоке."""
+    global _listener
+    _stop_listener()
+
+    output = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+
+    handler = NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter(settings.LOG_INFO_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = QueueListener(handler.queue, output)
+    _listener.start()
+    return handler
+
+
+atexit.register(_stop_listener)
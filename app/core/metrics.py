@@ -0,0 +1,269 @@
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Базовый класс метрики в формате Prometheus."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Возвращает (суффикс имени, метки, значение) для экспорта."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {value:g}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            ("", _format_labels(self.labels, key), value)
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и убывать."""
+
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class CallbackMetric(Metric):
+    """Метрика без меток, значение которой вычисляется при экспорте."""
+
+    def __init__(
+        self, name: str, documentation: str, callback: Callable[[], float], type: str
+    ):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self.type = type
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [("", "", float(self.callback()))]
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Для каждой комбинации меток: счетчики корзин (+Inf последней) и сумма
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1][0] += value
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        result = []
+        names = self.labels + ("le",)
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                result.append(
+                    ("_bucket", _format_labels(names, key + (le,)), cumulative)
+                )
+            labels = _format_labels(self.labels, key)
+            result.append(("_sum", labels, total[0]))
+            result.append(("_count", labels, cumulative))
+        return result
+
+
+class Registry:
+    """Набор метрик процесса."""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], float],
+        type: str = "gauge",
+    ) -> None:
+        """Регистрирует метрику, значение которой читается при экспорте."""
+        self.register(CallbackMetric(name, documentation, callback, type))
+
+    def render(self) -> str:
+        """Экспортирует метрики в текстовом формате Prometheus."""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(
+    Counter(
+        "http_requests_total",
+        "Число HTTP-запросов",
+        ("method", "route", "status"),
+    )
+)
+HTTP_LATENCY = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Время обработки HTTP-запроса",
+        ("method", "route"),
+    )
+)
+HTTP_IN_FLIGHT = registry.register(
+    Gauge("http_requests_in_flight", "Запросы в обработке")
+)
+REQUEST_DB_STATEMENTS = registry.register(
+    Histogram(
+        "http_request_db_statements",
+        "Число SQL-запросов за HTTP-запрос",
+        ("method", "route"),
+        buckets=COUNT_BUCKETS,
+    )
+)
+REQUEST_DB_TIME = registry.register(
+    Histogram(
+        "http_request_db_seconds",
+        "Суммарное время SQL-запросов за HTTP-запрос",
+        ("method", "route"),
+    )
+)
+DB_STATEMENT_LATENCY = registry.register(
+    Histogram("db_statement_duration_seconds", "Время выполнения SQL-запроса")
+)
+DB_POOL_WAIT = registry.register(
+    Histogram("db_pool_checkout_wait_seconds", "Ожидание соединения из пула")
+)
+
+
+class RequestDBStats:
+    """SQL-статистика одного HTTP-запроса."""
+
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+_request_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar(
+    "request_db_stats", default=None
+)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подключает учет SQL-запросов через события движка."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_STATEMENT_LATENCY.observe(elapsed)
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.seconds += elapsed
+
+
+class MetricsMiddleware:
+    """ASGI middleware: задержки, запросы в обработке и SQL на запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestDBStats()
+        token = _request_db_stats.set(stats)
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _request_db_stats.reset(token)
+
+            route = scope.get("route")
+            # Шаблон пути, а не сам путь, чтобы не плодить метки
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, path, str(status))
+            HTTP_LATENCY.observe(elapsed, method, path)
+            REQUEST_DB_STATEMENTS.observe(stats.statements, method, path)
+            REQUEST_DB_TIME.observe(stats.seconds, method, path)
@@ -0,0 +1,55 @@
+import base64
+import binascii
+import datetime
+from typing import NamedTuple
+
+
+class RankCursor(NamedTuple):
+    """Позиция в результатах поиска, упорядоченных по релевантности."""
+
+    rank: float
+    id: int
+
+
+class Cursor(NamedTuple):
+    """Позиция в истории сообщений для keyset-пагинации."""
+
+    created_at: datetime.datetime
+    id: int
+
+
+def encode_cursor(created_at: datetime.datetime, obj_id: int) -> str:
+    """Кодирует позицию сообщения в непрозрачный курсор."""
+    raw = f"{created_at.isoformat()}|{obj_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> Cursor:
+    """Декодирует курсор. Бросает ValueError при некорректном значении."""
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, obj_id = raw.rsplit("|", 1)
+        cursor = Cursor(datetime.datetime.fromisoformat(created_at), int(obj_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {value!r}") from e
+    if cursor.created_at.tzinfo is None:
+        raise ValueError(f"Invalid cursor: {value!r}")
+    return cursor
+
+
+def encode_rank_cursor(rank: float, obj_id: int) -> str:
+    """Кодирует позицию результата поиска в непрозрачный курсор."""
+    raw = f"{rank!r}|{obj_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_rank_cursor(value: str) -> RankCursor:
+    """Декодирует курсор поиска. Бросает ValueError при некорректном значении."""
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        rank, obj_id = raw.rsplit("|", 1)
+        return RankCursor(float(rank), int(obj_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {value!r}") from e
@@ -0,0 +1,189 @@
+import asyncio
+import datetime
+import logging
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .cache import history_cache
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PARENT = "messages"
+# Ключ advisory-lock, чтобы воркеры не обслуживали партиции одновременно
+LOCK_KEY = 0x6D736770
+_NAME = re.compile(rf"^{PARENT}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(day: datetime.date, months: int) -> datetime.date:
+    """Первое число месяца, отстоящего от `day` на `months` месяцев."""
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{PARENT}_y{month.year:04d}m{month.month:02d}"
+
+
+def _today() -> datetime.date:
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def is_partition(name: str) -> bool:
+    """Таблица - партиция сообщений, которой управляет приложение."""
+    return _NAME.match(name) is not None
+
+
+def create_partition(connection: Connection, month: datetime.date) -> None:
+    """Создает месячную партицию сообщений, если ее еще нет.
+
+    DEFAULT-партиции нет: с ней Postgres не может читать партиции по порядку
+    и собирает первую страницу истории через Merge Append по всем месяцам.
+    Вставка вне созданных месяцев отклоняется, поэтому партиции создаются
+    заранее.
+    """
+    start, end = month_start(month), add_months(month, 1)
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} "
+            f"PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{start} 00:00+00') TO ('{end} 00:00+00')"
+        )
+    )
+
+
+def list_partitions(connection: Connection) -> List[str]:
+    """Имена месячных партиций сообщений в порядке возрастания."""
+    names = connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass)"
+        ),
+        {"parent": PARENT},
+    ).scalars()
+    return sorted(name for name in names if _NAME.match(name))
+
+
+def ensure_partitions(
+    connection: Connection,
+    months_ahead: int,
+    today: Optional[datetime.date] = None,
+) -> None:
+    """Создает партиции с текущего месяца на `months_ahead` месяцев вперед."""
+    current = month_start(today or _today())
+    for offset in range(months_ahead + 1):
+        create_partition(connection, add_months(current, offset))
+
+
+def _forget_messages(connection: Connection, name: str, end: datetime.date) -> None:
+    """Вычитает сообщения партиции из счетчиков чатов перед ее удалением.
+
+    Если последнее сообщение чата старше конца партиции, у чата не остается
+    сообщений, и ссылка на последнее сообщение сбрасывается.
+    """
+    connection.execute(
+        text(
+            "UPDATE chats SET message_count = chats.message_count - d.n, "
+            "history_version = chats.history_version + 1, "
+            "last_message_at = CASE WHEN chats.last_message_at < :end "
+            "THEN NULL ELSE chats.last_message_at END, "
+            "last_message_id = CASE WHEN chats.last_message_at < :end "
+            "THEN NULL ELSE chats.last_message_id END "
+            f"FROM (SELECT chat_id, count(*) AS n FROM {name} GROUP BY chat_id) d "
+            "WHERE chats.id = d.chat_id"
+        ),
+        {"end": datetime.datetime.combine(end, datetime.time(), datetime.timezone.utc)},
+    )
+
+
+def _forget_archive(connection: Connection, cutoff: datetime.date) -> None:
+    """Удаляет блоки архива старше `cutoff`, вычитая их из счетчиков чатов."""
+    connection.execute(
+        text(
+            "WITH expired AS (DELETE FROM message_archive WHERE day < :cutoff "
+            "RETURNING chat_id, message_count) "
+            "UPDATE chats SET message_count = chats.message_count - d.n, "
+            "history_version = chats.history_version + 1 "
+            "FROM (SELECT chat_id, sum(message_count) AS n FROM expired "
+            "GROUP BY chat_id) d "
+            "WHERE chats.id = d.chat_id"
+        ),
+        {"cutoff": cutoff},
+    )
+
+
+def drop_expired_partitions(
+    connection: Connection,
+    retention_months: int,
+    today: Optional[datetime.date] = None,
+) -> List[str]:
+    """Удаляет партиции, целиком старше `retention_months` месяцев.
+
+    Старые сообщения уходят вместе с таблицей, без построчного DELETE
+    и последующего VACUUM. Возвращает имена удаленных партиций.
+    """
+    cutoff = add_months(month_start(today or _today()), -retention_months)
+    _forget_archive(connection, cutoff)
+    dropped = []
+    for name in list_partitions(connection):
+        year, month = map(int, _NAME.match(name).groups())
+        end = add_months(datetime.date(year, month, 1), 1)
+        if end <= cutoff:
+            _forget_messages(connection, name, end)
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def maintain_partitions(connection: Connection) -> List[str]:
+    """Создает будущие партиции и удаляет просроченные согласно настройкам."""
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+    ensure_partitions(connection, settings.MESSAGES_PARTITIONS_AHEAD)
+    if settings.MESSAGES_RETENTION_MONTHS <= 0:
+        return []
+    return drop_expired_partitions(connection, settings.MESSAGES_RETENTION_MONTHS)
+
+
+class PartitionMaintainer:
+    """Периодически обслуживает партиции таблицы сообщений."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> List[str]:
+        async with self.engine.begin() as conn:
+            dropped = await conn.run_sync(maintain_partitions)
+        if dropped:
+            logger.info("Dropped expired message partitions: %s", ", ".join(dropped))
+            # В кэше могли остаться сообщения из удаленных партиций
+            await history_cache.clear()
+        return dropped
+
+    async def start(self) -> None:
+        # Первый проход синхронный: без партиций на текущий месяц вставка упадет
+        await self.run_once()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.MESSAGES_PARTITION_CHECK_SECONDS)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning("Message partition maintenance failed: %r", e)
@@ -0,0 +1,175 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import engine
+from .metrics import Counter, registry
+
+RATE_LIMITED = registry.register(
+    Counter(
+        "http_requests_rate_limited_total",
+        "Запросы, отклоненные лимитом частоты",
+        ("scope",),
+    )
+)
+
+
+class RateLimiter(ABC):
+    """Интерфейс лимитов частоты запросов по ключу (token bucket).
+
+    Ключ может сделать `rate` запросов в секунду и до `burst` подряд.
+    Реализовано через GCRA: на ключ хранится одно время - когда бакет
+    станет полным, - что эквивалентно token bucket, но компактнее.
+    """
+
+    @abstractmethod
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        """Списывает запрос; возвращает 0 или сколько секунд ждать до следующего."""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Сбрасывает все лимиты."""
+
+
+class NullRateLimiter(RateLimiter):
+    """Отключенные лимиты: разрешено все."""
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        return 0.0
+
+    async def clear(self) -> None:
+        pass
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Лимиты в памяти процесса: по одному float на ключ.
+
+    Хранится не больше `max_keys` ключей; давно не использованные
+    вытесняются по LRU, что равносильно полному бакету.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        interval = 1 / rate
+        tat = max(self._tat.get(key, now), now)
+        wait = tat - now - (burst - 1) * interval
+        if wait > 0:
+            return wait
+        self._tat[key] = tat + interval
+        self._tat.move_to_end(key)
+        if len(self._tat) > self.max_keys:
+            self._tat.popitem(last=False)
+        return 0.0
+
+    async def clear(self) -> None:
+        self._tat.clear()
+
+
+class PostgresRateLimiter(RateLimiter):
+    """Лимиты в UNLOGGED-таблице Postgres, общие для всех воркеров.
+
+    Проверка и списание - один атомарный UPSERT. Ключи с прошедшим
+    временем (полные бакеты) удаляются раз в `PURGE_SECONDS`.
+    """
+
+    PURGE_SECONDS = 60.0
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._next_purge = 0.0
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        interval = 1 / rate
+        async with self.engine.begin() as conn:
+            if time.monotonic() > self._next_purge:
+                self._next_purge = time.monotonic() + self.PURGE_SECONDS
+                await conn.execute(
+                    text("DELETE FROM rate_limit_buckets WHERE tat < now()")
+                )
+            allowed = await conn.scalar(
+                text(
+                    "INSERT INTO rate_limit_buckets AS b (key, tat) "
+                    "VALUES (:key, now() + make_interval(secs => :interval)) "
+                    "ON CONFLICT (key) DO UPDATE "
+                    "SET tat = greatest(b.tat, now()) "
+                    "+ make_interval(secs => :interval) "
+                    "WHERE b.tat <= now() + make_interval(secs => :tolerance) "
+                    "RETURNING true"
+                ),
+                {"key": key, "interval": interval, "tolerance": (burst - 1) * interval},
+            )
+        # Точное время ожидания стоило бы еще одного запроса
+        return 0.0 if allowed else interval
+
+    async def clear(self) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(text("DELETE FROM rate_limit_buckets"))
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Создает хранилище лимитов согласно настройкам."""
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryRateLimiter(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+    if settings.RATE_LIMIT_BACKEND == "postgres":
+        return PostgresRateLimiter(engine)
+    return NullRateLimiter()
+
+
+rate_limiter = create_rate_limiter()
+
+
+def client_id(request: Request) -> str:
+    """Ключ клиента для лимитов.
+
+    За прокси адрес соединения у всех клиентов один, поэтому клиент
+    берется из заголовка RATE_LIMIT_CLIENT_HEADER. В X-Forwarded-For
+    доверенный прокси дописывает адрес последним.
+    """
+    if settings.RATE_LIMIT_CLIENT_HEADER:
+        forwarded = request.headers.get(settings.RATE_LIMIT_CLIENT_HEADER)
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def limit_message_rate(request: Request, chat_id: int) -> None:
+    """Зависимость: лимиты отправки сообщений на клиента и на чат.
+
+    Сначала проверяется клиент, чтобы отклоненный клиент не расходовал
+    общий лимит чата. Превышение - 429 с Retry-After.
+    """
+    limits = (
+        (
+            "client",
+            client_id(request),
+            settings.RATE_LIMIT_CLIENT_PER_SECOND,
+            settings.RATE_LIMIT_CLIENT_BURST,
+        ),
+        (
+            "chat",
+            str(chat_id),
+            settings.RATE_LIMIT_CHAT_PER_SECOND,
+            settings.RATE_LIMIT_CHAT_BURST,
+        ),
+    )
+    for scope, key, rate, burst in limits:
+        if rate <= 0:
+            continue
+        wait = await rate_limiter.acquire(f"{scope}:{key}", rate, burst)
+        if wait > 0:
+            RATE_LIMITED.inc(scope)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
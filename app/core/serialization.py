@@ -0,0 +1,8 @@
+from typing import Any, Callable, Optional
+
+import orjson
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """Сериализует данные ответа в JSON в том же формате, что и Pydantic."""
+    return orjson.dumps(obj, default=default, option=orjson.OPT_UTC_Z)
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые вызовы в один (single-flight).
+
+    Первый вызов с ключом запускает работу в отдельной задаче, остальные
+    ждут ее результат. Отмена одного из ожидающих, например при отключении
+    клиента первого запроса, не прерывает работу для остальных; задача
+    отменяется, только когда ждать результата больше некому.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls: Dict[Hashable, _Call] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._drop(key, call))
+        else:
+            self.shared += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Новые вызовы не должны присоединиться к отменяемой задаче
+                self._drop(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def forget(self, match: Optional[Callable[[Hashable], bool]] = None) -> None:
+        """Следующие вызовы с подходящими ключами запустят новую работу.
+
+        Нужно после записи: начатое до нее чтение может ее не увидеть.
+        Уже ожидающие вызовы получат результат начатой работы.
+        """
+        for key in [key for key in self._calls if match is None or match(key)]:
+            del self._calls[key]
+
+    def _drop(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
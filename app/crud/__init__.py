@@ -1 +1,4 @@
 from .crud_chat import chat
+from .message_buffer import create_message_buffer
+
+message_buffer = create_message_buffer(chat)
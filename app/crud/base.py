@@ -1,4 +1,5 @@
 from typing import Any, Generic, Type, TypeVar, Optional
+from sqlalchemy import delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.base import Base
 
@@ -24,10 +25,15 @@ class CRUDBase(Generic[ModelType, CreateSchemaType]):
         await db.commit()
         return db_obj
 
-    async def remove(self, db: AsyncSession, *, obj_id: int) -> Optional[ModelType]:
-        """Удаляет запись по ID."""
-        obj = await db.get(self.model, obj_id)
-        if obj:
-            await db.delete(obj)
-            await db.commit()
-        return obj
+    async def remove(self, db: AsyncSession, *, obj_id: int) -> bool:
+        """Удаляет запись по ID одним запросом.
+
+        Объект в сессию не загружается, зависимые строки удаляет каскад
+        внешнего ключа в БД. Возвращает True, если запись существовала.
+        """
+        stmt = (
+            delete(self.model).where(self.model.id == obj_id).returning(self.model.id)
+        )
+        deleted = (await db.execute(stmt)).scalar_one_or_none()
+        await db.commit()
+        return deleted is not None
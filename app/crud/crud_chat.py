@@ -1,60 +1,976 @@
+import datetime
 import logging
-from typing import Any
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import (
+    CTE,
+    BigInteger,
+    Row,
+    Select,
+    String,
+    Text,
+    Update,
+    and_,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from sqlalchemy.exc import IntegrityError
 
+from app.core.archive import archive_day, unpack_messages
+from app.core.cache import HistoryCache, history_cache
+from app.core.config import settings
+from app.core.db import is_replica
+from app.core.ids import SnowflakeGenerator, id_time, message_ids
+from app.core.metrics import registry
+from app.core.pagination import Cursor, RankCursor, encode_cursor, encode_rank_cursor
+from app.core.serialization import dumps
+from app.core.singleflight import SingleFlight
 from app.crud.base import CRUDBase
 from app.models.chat import Chat
-from app.models.message import Message
+from app.models.idempotency_key import MessageIdempotencyKey
+from app.models.message import SEARCH_CONFIG, Message
+from app.models.message_archive import MessageArchive
 from app.schemas.chat import ChatCreate
-from app.schemas.message import MessageCreate
+from app.schemas.message import MessageBulkItem, MessageCreate
 
 logger = logging.getLogger(__name__)
 
+# SQLSTATE нарушения внешнего ключа: сообщение в несуществующий чат
+FOREIGN_KEY_VIOLATION = "23503"
+# SQLSTATE нарушения уникальности: ключ идемпотентности уже использован
+UNIQUE_VIOLATION = "23505"
+# SQLSTATE вставки вне созданных партиций сообщений
+CHECK_VIOLATION = "23514"
+
+MESSAGE_COLUMNS = (Message.id, Message.chat_id, Message.text, Message.created_at)
+
+# Длина превью последнего сообщения в списке чатов
+PREVIEW_LENGTH = 200
+# Блоков архива (дней) за одно чтение из курсора
+ARCHIVE_BLOCKS_PER_FETCH = 4
+
+
+class NewMessage(NamedTuple):
+    """Сообщение с id от приложения; заменяет строку из RETURNING."""
+
+    id: int
+    chat_id: int
+    text: str
+    created_at: datetime.datetime
+
+
+def _position(message: Dict[str, Any]) -> Cursor:
+    return Cursor(message["created_at"], message["id"])
+
+
+def _json_timestamp(column: Any) -> Any:
+    """Время в JSON в том же виде, что и у dumps (orjson с OPT_UTC_Z).
+
+    UTC с суффиксом "Z", микросекунды - только если они не нулевые.
+    Формат Postgres по умолчанию ("+00:00", урезанные доли) отличался бы
+    от ответа, собранного в Python.
+    """
+    utc = func.timezone("UTC", column)
+    micros = func.to_char(utc, "US")
+    return func.concat(
+        func.to_char(utc, 'YYYY-MM-DD"T"HH24:MI:SS'),
+        case((micros == "000000", ""), else_=func.concat(".", micros)),
+        "Z",
+    )
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 
 class CRUDChat(CRUDBase[Chat, ChatCreate]):
-    """CRUD операции для чатов."""
+    """CRUD операции для чатов.
+
+    Последние сообщения чатов читаются через кэш истории: вставки
+    дописывают в него новые сообщения, удаление чата его сбрасывает.
+    """
+
+    def __init__(
+        self,
+        model: Type[Chat],
+        cache: HistoryCache,
+        flights: SingleFlight,
+        ids: Optional[SnowflakeGenerator] = None,
+    ):
+        super().__init__(model)
+        self.cache = cache
+        # Чтения истории в полете; ключ начинается с chat_id
+        self.flights = flights
+        # Генератор id сообщений; None - id выдает последовательность БД
+        self.ids = ids
+
+    def _new_message(self, chat_id: int, text: str) -> "NewMessage":
+        message_id = self.ids.next_id()
+        return NewMessage(message_id, chat_id, text, id_time(message_id))
+
+    async def invalidate_cache(self, chat_id: Optional[int] = None) -> None:
+        """Сбрасывает кэш истории чата или, без chat_id, весь кэш."""
+        if chat_id is None:
+            await self.cache.clear()
+            self.flights.forget()
+        else:
+            await self.cache.invalidate(chat_id)
+            self._forget_flights({chat_id})
+
+    async def remove(self, db: AsyncSession, *, obj_id: int) -> bool:
+        """Удаляет чат и сбрасывает его кэш истории."""
+        removed = await super().remove(db, obj_id=obj_id)
+        await self.cache.invalidate(obj_id)
+        self._forget_flights({obj_id})
+        return removed
+
+    def _forget_flights(self, chat_ids: Set[int]) -> None:
+        """Новые чтения чатов не присоединятся к начатым до записи."""
+        self.flights.forget(lambda key: key[0] in chat_ids)
+
+    async def _insert_messages(
+        self,
+        db: AsyncSession,
+        values: List[Dict[str, Any]],
+        key: Optional[str] = None,
+    ) -> Optional[List[Row]]:
+        """Вставляет сообщения одним запросом и коммитит транзакцию.
+
+        Вставка, обновление счетчиков чатов и, с `key`, запись ключа
+        идемпотентности - части одного запроса (WITH ... INSERT ... RETURNING),
+        поэтому отправка стоит одного обращения к БД и COMMIT. Строки
+        возвращаются в порядке входных данных. Если хотя бы одного чата
+        не существует, транзакция откатывается и возвращается None. Если id
+        выдает приложение, строки собираются из вставленных значений и
+        обратно не передаются.
+        """
+        generated = self.ids is not None
+        if generated:
+            # id и время известны заранее
+            rows = [self._new_message(v["chat_id"], v["text"]) for v in values]
+            values = [row._asdict() for row in rows]
+        inserted = (
+            insert(Message).values(values).returning(*MESSAGE_COLUMNS).cte("inserted")
+        )
+        ctes = []
+        if key is not None:
+            ctes.append(
+                insert(MessageIdempotencyKey)
+                .from_select(
+                    ["chat_id", "key", "message_id", "message_created_at"],
+                    select(
+                        inserted.c.chat_id,
+                        literal(key, String),
+                        inserted.c.id,
+                        inserted.c.created_at,
+                    ),
+                )
+                .cte("remembered")
+            )
+        counted = self._count_messages(inserted)
+        if generated:
+            stmt = counted.add_cte(*ctes)
+        else:
+            # id из последовательности растут в порядке строк VALUES
+            stmt = (
+                select(*inserted.c)
+                .add_cte(counted.cte("counted"), *ctes)
+                .order_by(inserted.c.id)
+            )
+        try:
+            result = await db.execute(stmt)
+            if not generated:
+                rows = result.all()
+        except IntegrityError as e:
+            await db.rollback()
+            sqlstate = getattr(e.orig, "sqlstate", None)
+            if sqlstate == FOREIGN_KEY_VIOLATION:
+                return None
+            if sqlstate == CHECK_VIOLATION:
+                logger.error("No messages partition for the insert: %s", e.orig)
+            raise
+        await db.commit()
+        await self.cache.append([row._asdict() for row in rows])
+        self._forget_flights({row.chat_id for row in rows})
+        return rows
+
+    @staticmethod
+    def _count_messages(inserted: CTE) -> Update:
+        """UPDATE счетчиков и последнего сообщения чатов по вставленным строкам.
+
+        Последнее сообщение не откатывается назад, если параллельная
+        транзакция с более новым сообщением успела закоммититься раньше.
+        Чаты обновляются по возрастанию id, чтобы пачки не ловили deadlock.
+        """
+        latest = (
+            select(
+                inserted.c.chat_id,
+                inserted.c.created_at,
+                inserted.c.id,
+                func.count().over(partition_by=inserted.c.chat_id).label("added"),
+            )
+            .distinct(inserted.c.chat_id)
+            .order_by(
+                inserted.c.chat_id, inserted.c.created_at.desc(), inserted.c.id.desc()
+            )
+            .subquery("latest")
+        )
+        chats = Chat.__table__.c
+        newer = or_(
+            chats.last_message_at.is_(None),
+            tuple_(chats.last_message_at, chats.last_message_id)
+            < tuple_(latest.c.created_at, latest.c.id),
+        )
+        return (
+            update(Chat.__table__)
+            .where(chats.id == latest.c.chat_id)
+            .values(
+                message_count=chats.message_count + latest.c.added,
+                last_message_at=case(
+                    (newer, latest.c.created_at), else_=chats.last_message_at
+                ),
+                last_message_id=case((newer, latest.c.id), else_=chats.last_message_id),
+            )
+        )
 
     async def create_message(
         self, db: AsyncSession, *, chat_id: int, obj_in: MessageCreate
-    ) -> Message:
-        """Создает сообщение в чате."""
-        logger.debug(f"Inserting new message into DB for chat_id={chat_id}")
-        db_obj = Message(chat_id=chat_id, text=obj_in.text)
-        db.add(db_obj)
-        await db.commit()
-        return db_obj
+    ) -> Optional[Row]:
+        """Создает сообщение в чате одним INSERT ... RETURNING.
+
+        Существование чата проверяет внешний ключ: если чата нет,
+        возвращается None.
+        """
+        logger.debug("Inserting new message into DB for chat_id=%s", chat_id)
+        rows = await self._insert_messages(
+            db, [{"chat_id": chat_id, "text": obj_in.text}]
+        )
+        return rows[0] if rows else None
+
+    async def create_message_idempotent(
+        self, db: AsyncSession, *, chat_id: int, obj_in: MessageCreate, key: str
+    ) -> Tuple[Optional[Row], bool]:
+        """Создает сообщение с ключом идемпотентности.
+
+        Сообщение и ключ вставляются одним запросом, поэтому первая попытка
+        стоит столько же, сколько обычная отправка. Если ключ в чате уже
+        занят, вставка откатывается и возвращается исходное сообщение.
+        Возвращает (сообщение, создано ли оно сейчас); сообщение None -
+        чата нет или исходное сообщение уже удалено.
+        """
+        try:
+            rows = await self._insert_messages(
+                db, [{"chat_id": chat_id, "text": obj_in.text}], key=key
+            )
+        except IntegrityError as e:
+            if getattr(e.orig, "sqlstate", None) != UNIQUE_VIOLATION:
+                raise
+            logger.debug("Replaying idempotent message for chat_id=%s", chat_id)
+            return (
+                await self.get_by_idempotency_key(db, chat_id=chat_id, key=key),
+                False,
+            )
+        return (rows[0] if rows else None), True
+
+    async def get_by_idempotency_key(
+        self, db: AsyncSession, *, chat_id: int, key: str
+    ) -> Optional[NewMessage]:
+        """Сообщение, созданное запросом с ключом идемпотентности.
+
+        Сообщение, уже перенесенное в архив, читается из блока своего дня.
+        """
+        keys = MessageIdempotencyKey
+        stmt = (
+            select(keys.message_id, keys.message_created_at, *MESSAGE_COLUMNS)
+            .outerjoin(
+                Message,
+                and_(
+                    Message.id == keys.message_id,
+                    Message.created_at == keys.message_created_at,
+                ),
+            )
+            .where(keys.chat_id == chat_id, keys.key == key)
+        )
+        row = (await db.execute(stmt)).first()
+        if row is None:
+            return None
+        if row.id is not None:
+            return NewMessage(row.id, row.chat_id, row.text, row.created_at)
+
+        archive = MessageArchive
+        block = (
+            await db.execute(
+                select(archive.codec, archive.data).filter(
+                    archive.chat_id == chat_id,
+                    archive.day == archive_day(row.message_created_at),
+                )
+            )
+        ).first()
+        if block is None:
+            return None
+        for message in unpack_messages(chat_id, block.codec, block.data):
+            if message["id"] == row.message_id:
+                return NewMessage(**message)
+        return None
+
+    async def create_messages(
+        self, db: AsyncSession, *, objs_in: Sequence[MessageBulkItem]
+    ) -> Optional[List[Row]]:
+        """Создает пачку сообщений (возможно, в разных чатах) одной вставкой."""
+        logger.debug("Inserting %s messages into DB", len(objs_in))
+        return await self._insert_messages(
+            db, [{"chat_id": obj.chat_id, "text": obj.text} for obj in objs_in]
+        )
+
+    async def list_by_activity(
+        self, db: AsyncSession, *, limit: int = 20, before: Optional[Cursor] = None
+    ) -> Dict[str, Any]:
+        """Возвращает страницу чатов, начиная с самых активных.
+
+        Счетчики берутся из строки чата, превью - по первичному ключу
+        последнего сообщения, поэтому страница читается одним проходом по
+        индексу активности без подсчета сообщений.
+        """
+        activity = Chat.activity()
+        stmt = (
+            select(
+                Chat.id,
+                Chat.title,
+                Chat.created_at,
+                Chat.message_count,
+                Chat.last_message_at,
+                Chat.last_message_id,
+                func.left(Message.text, PREVIEW_LENGTH).label("last_message_text"),
+                activity.label("activity"),
+            )
+            .outerjoin(
+                Message,
+                and_(
+                    Message.id == Chat.last_message_id,
+                    Message.created_at == Chat.last_message_at,
+                ),
+            )
+            .order_by(activity.desc(), Chat.id.desc())
+            .limit(limit + 1)
+        )
+        if before is not None:
+            stmt = stmt.filter(tuple_(activity, Chat.id) < tuple_(*before))
+
+        rows = (await db.execute(stmt)).all()
+        chats = []
+        for row in rows[:limit]:
+            chat = row._asdict()
+            del chat["activity"]
+            chats.append(chat)
+        last = rows[limit - 1] if len(rows) > limit else None
+        return {
+            "chats": chats,
+            "next_cursor": encode_cursor(last.activity, last.id) if last else None,
+        }
+
+    async def search(
+        self,
+        db: AsyncSession,
+        *,
+        query: str,
+        chat_id: Optional[int] = None,
+        limit: int = 20,
+        after: Optional[RankCursor] = None,
+        substring: bool = False,
+    ) -> Dict[str, Any]:
+        """Ищет сообщения во всех чатах или в одном, по убыванию релевантности.
+
+        Совпадения ищутся по GIN-индексу (tsvector или, для подстрок,
+        pg_trgm). Релевантность считается только для SEARCH_RANK_WINDOW
+        самых свежих совпадений, поэтому частые слова не заставляют
+        ранжировать всю таблицу.
+        """
+        if substring:
+            match = Message.text.ilike(f"%{_escape_like(query)}%", escape="\\")
+            candidates = select(*MESSAGE_COLUMNS).filter(match)
+        else:
+            tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+            match = Message.search_vector.op("@@")(tsquery)
+            candidates = select(*MESSAGE_COLUMNS, Message.search_vector).filter(match)
+        if chat_id is not None:
+            candidates = candidates.filter(Message.chat_id == chat_id)
+        candidates = (
+            candidates.order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(settings.SEARCH_RANK_WINDOW)
+            .subquery()
+        )
+
+        if substring:
+            rank = func.word_similarity(query, candidates.c.text)
+        else:
+            rank = func.ts_rank(candidates.c.search_vector, tsquery)
+        ranked = select(
+            candidates.c.id,
+            candidates.c.chat_id,
+            candidates.c.text,
+            candidates.c.created_at,
+            rank.label("rank"),
+        ).subquery()
+
+        stmt = (
+            select(ranked)
+            .order_by(ranked.c.rank.desc(), ranked.c.id.desc())
+            .limit(limit + 1)
+        )
+        if after is not None:
+            stmt = stmt.filter(tuple_(ranked.c.rank, ranked.c.id) < tuple_(*after))
+
+        rows = (await db.execute(stmt)).all()
+        last = rows[limit - 1] if len(rows) > limit else None
+        return {
+            "messages": [row._asdict() for row in rows[:limit]],
+            "next_cursor": encode_rank_cursor(last.rank, last.id) if last else None,
+        }
+
+    async def stream_messages(
+        self, db: AsyncSession, *, chat_id: int, batch_size: int
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Отдает все сообщения чата пачками в хронологическом порядке.
+
+        Сначала идут блоки архива, затем строки messages, прочитанные
+        серверным курсором по `batch_size`, поэтому память не зависит
+        от размера чата.
+        """
+        archive = MessageArchive
+        blocks = await db.stream(
+            select(archive.codec, archive.data)
+            .filter(archive.chat_id == chat_id)
+            .order_by(archive.day)
+            .execution_options(yield_per=ARCHIVE_BLOCKS_PER_FETCH)
+        )
+        async for block in blocks:
+            yield unpack_messages(chat_id, block.codec, block.data)
+
+        stmt = (
+            select(*MESSAGE_COLUMNS)
+            .filter(Message.chat_id == chat_id)
+            .order_by(Message.created_at, Message.id)
+            .execution_options(yield_per=batch_size)
+        )
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield [row._asdict() for row in rows]
+
+    async def get_history_version(
+        self, db: AsyncSession, *, chat_id: int
+    ) -> Optional[Tuple[int, int, int]]:
+        """Версия истории чата для ETag, None без чата.
+
+        Это id последнего сообщения (0 для пустого чата), число сообщений и
+        счетчик удалений и переносов в архив. Число сообщений меняется при
+        каждой вставке, даже если сообщение закоммичено позже более нового
+        и последнее сообщение не сдвинулось. Читается по первичному ключу
+        из строки чата, без чтения сообщений.
+        """
+        row = (
+            await db.execute(
+                select(
+                    Chat.last_message_id, Chat.message_count, Chat.history_version
+                ).filter(Chat.id == chat_id)
+            )
+        ).one_or_none()
+        if row is None:
+            return None
+        return row.last_message_id or 0, row.message_count, row.history_version
+
+    async def sync(
+        self, db: AsyncSession, *, last_seen: Dict[int, int], limit: int
+    ) -> Dict[str, Any]:
+        """Новые сообщения сразу многих чатов одним запросом.
+
+        `last_seen` - id последнего сообщения, известного клиенту, по
+        чатам. Для каждого чата возвращается до `limit` сообщений с большим
+        id по возрастанию (LATERAL-подзапрос по индексу (chat_id, id)).
+        Возвращаются только чаты с новыми сообщениями и список
+        несуществующих чатов.
+
+        Архив в синхронизацию не входит: если новее `last_seen` есть
+        сообщения в архиве, чат возвращается без сообщений с `resync`,
+        и клиент перечитывает его историю целиком.
+        """
+        seen = (
+            func.unnest(
+                literal(list(last_seen), ARRAY(BigInteger)),
+                literal(list(last_seen.values()), ARRAY(BigInteger)),
+            )
+            .table_valued("chat_id", "last_id")
+            .render_derived("seen")
+        )
+        skip = []
+        if self.ids is not None:
+            # Строка чата хранит последнее сообщение по (created_at, id); с
+            # id приложения этот порядок совпадает с порядком id, и чаты без
+            # новых сообщений отсекаются без чтения messages
+            skip.append(Chat.last_message_id != seen.c.last_id)
+        new = (
+            select(*MESSAGE_COLUMNS)
+            .filter(
+                *skip,
+                Message.chat_id == seen.c.chat_id,
+                Message.id > seen.c.last_id,
+            )
+            .order_by(Message.id)
+            .limit(limit + 1)
+            .lateral("new")
+        )
+        archived = (
+            select(MessageArchive.chat_id)
+            .filter(
+                MessageArchive.chat_id == seen.c.chat_id,
+                MessageArchive.last_id > seen.c.last_id,
+            )
+            .exists()
+        )
+        stmt = (
+            select(
+                seen.c.chat_id,
+                Chat.id.label("found"),
+                Chat.last_message_id,
+                archived.label("resync"),
+                new.c.id,
+                new.c.text,
+                new.c.created_at,
+            )
+            .select_from(seen)
+            .outerjoin(Chat, Chat.id == seen.c.chat_id)
+            .outerjoin(new, true())
+            .order_by(seen.c.chat_id, new.c.id)
+        )
+
+        chats: Dict[int, Dict[str, Any]] = {}
+        missing = []
+        for row in await db.execute(stmt):
+            if row.found is None:
+                missing.append(row.chat_id)
+                continue
+            if row.resync:
+                chats[row.chat_id] = {
+                    "chat_id": row.chat_id,
+                    "messages": [],
+                    "has_more": False,
+                    "resync": True,
+                    "last_message_id": row.last_message_id or 0,
+                }
+                continue
+            if row.id is None:
+                continue
+            delta = chats.setdefault(
+                row.chat_id,
+                {
+                    "chat_id": row.chat_id,
+                    "messages": [],
+                    "has_more": False,
+                    "resync": False,
+                },
+            )
+            if len(delta["messages"]) == limit:
+                delta["has_more"] = True
+                continue
+            delta["messages"].append(
+                {
+                    "id": row.id,
+                    "chat_id": row.chat_id,
+                    "text": row.text,
+                    "created_at": row.created_at,
+                }
+            )
+        for delta in chats.values():
+            if not delta["resync"]:
+                delta["last_message_id"] = delta["messages"][-1]["id"]
+        return {"chats": list(chats.values()), "missing": missing}
 
     async def get_with_messages(
-        self, db: AsyncSession, chat_id: int, limit: int = 20
+        self,
+        db: AsyncSession,
+        chat_id: int,
+        limit: int = 20,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
     ) -> Any:
-        """Возвращает чат с последними сообщениями."""
+        """Возвращает чат со страницей сообщений.
+
+        Без курсоров отдаются последние сообщения, по возможности из кэша.
+        `before` листает историю назад, `after` - вперед. Страница выбирается
+        по индексу (chat_id, created_at, id), поэтому ее стоимость не зависит
+        от глубины.
+        """
+        page = await self.get_history_page(db, chat_id, limit, before, after)
+        return page[0] if page is not None else None
+
+    async def get_history_page(
+        self,
+        db: AsyncSession,
+        chat_id: int,
+        limit: int = 20,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
+    ) -> Optional[Tuple[Dict[str, Any], Optional[int]]]:
+        """Как get_with_messages, но вместе со счетчиком сообщений чата.
+
+        Для первой страницы возвращается `message_count`, которому она
+        соответствует: из кэша или из строки чата, прочитанной до сообщений.
+        Для остальных страниц вместо счетчика None.
+        """
+        first_page = before is None and after is None
+        # Реплика может отставать от основной БД: ее данными кэш не заполняем
+        fill = first_page and bool(self.cache.window) and not is_replica(db)
+        if first_page:
+            page = await self.cache.get(chat_id, limit)
+            if page is not None:
+                history = self._history(
+                    page.chat, page.messages, has_older=page.has_older
+                )
+                return history, page.message_count
+            token = await self.cache.fill_token(chat_id)
+
         # Получаем сам чат
         chat = await self.get(db, chat_id)
         if not chat:
             return None
+        chat_data = {"id": chat.id, "title": chat.title, "created_at": chat.created_at}
+
+        logger.debug(
+            "Querying messages for chat_id=%s, limit=%s, before=%s, after=%s",
+            chat_id,
+            limit,
+            before,
+            after,
+        )
+
+        stmt = self._page_query(chat_id, before, after)
+
+        # Первую страницу читаем с запасом, чтобы заполнить кэш
+        fetch = max(limit, self.cache.window) if fill else limit
+        # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+        result = await db.execute(stmt.limit(fetch + 1))
+        messages = [row._asdict() for row in result]
+        if not (first_page and len(messages) >= chat.message_count):
+            messages = await self._with_archive(
+                db, chat_id, messages, fetch + 1, before, after
+            )
+        has_more = len(messages) > fetch
+        messages = messages[:fetch]
+
+        # Хронологический порядок для выдачи (старые сверху)
+        if after is None:
+            messages.reverse()
 
-        logger.debug(f"Querying messages for chat_id={chat_id}, limit={limit}")
+        if fill:
+            await self.cache.fill(
+                chat_id,
+                token,
+                chat_data,
+                messages,
+                complete=not has_more,
+                message_count=chat.message_count,
+            )
+            has_more = has_more or len(messages) > limit
+            messages = messages[-limit:]
 
-        # Получаем сообщения
+        history = self._history(
+            chat_data,
+            messages,
+            has_older=has_more if after is None else bool(messages),
+            has_newer=has_more if after is not None else before is not None,
+        )
+        return history, chat.message_count if first_page else None
+
+    async def _archive_bound(self, db: AsyncSession, chat_id: int) -> Optional[Cursor]:
+        """Позиция самого нового сообщения чата в архиве."""
+        archive = MessageArchive
         stmt = (
-            select(Message)
-            .filter(Message.chat_id == chat_id)
-            .order_by(desc(Message.created_at))
-            .limit(limit)
+            select(archive.last_created_at, archive.last_id)
+            .filter(archive.chat_id == chat_id)
+            .order_by(archive.day.desc())
+            .limit(1)
+        )
+        row = (await db.execute(stmt)).first()
+        return Cursor(*row) if row else None
+
+    async def _archived_page(
+        self,
+        db: AsyncSession,
+        chat_id: int,
+        limit: int,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
+    ) -> List[Dict[str, Any]]:
+        """До `limit` сообщений архива в порядке обхода страницы.
+
+        Блоки читаются по одному дню, начиная с дня курсора, пока страница
+        не заполнится.
+        """
+        archive = MessageArchive
+        stmt = select(archive.codec, archive.data).filter(archive.chat_id == chat_id)
+        if after is not None:
+            stmt = stmt.filter(archive.day >= archive_day(after.created_at))
+            stmt = stmt.order_by(archive.day)
+        else:
+            if before is not None:
+                stmt = stmt.filter(archive.day <= archive_day(before.created_at))
+            stmt = stmt.order_by(archive.day.desc())
+
+        messages: List[Dict[str, Any]] = []
+        result = await db.stream(
+            stmt.execution_options(yield_per=ARCHIVE_BLOCKS_PER_FETCH)
         )
-        result = await db.execute(stmt)
-        messages = result.scalars().all()
+        try:
+            async for block in result:
+                block_messages = unpack_messages(chat_id, block.codec, block.data)
+                if after is not None:
+                    messages.extend(m for m in block_messages if _position(m) > after)
+                else:
+                    messages.extend(
+                        m
+                        for m in reversed(block_messages)
+                        if before is None or _position(m) < before
+                    )
+                if len(messages) >= limit:
+                    break
+        finally:
+            await result.close()
+        return messages[:limit]
+
+    async def _with_archive(
+        self,
+        db: AsyncSession,
+        chat_id: int,
+        messages: List[Dict[str, Any]],
+        limit: int,
+        before: Optional[Cursor],
+        after: Optional[Cursor],
+    ) -> List[Dict[str, Any]]:
+        """Дополняет страницу из messages сообщениями из архива.
 
-        # Сортируем хронологически для выдачи (старые сверху)
-        sorted_messages = sorted(messages, key=lambda x: x.created_at)
+        Все сообщения архива старше сообщений в messages, поэтому при обходе
+        назад архив продолжает страницу, а при обходе вперед предшествует ей.
+        """
+        if after is None:
+            if len(messages) >= limit:
+                return messages
+            edge = _position(messages[-1]) if messages else before
+            archived = await self._archived_page(
+                db, chat_id, limit - len(messages), before=edge
+            )
+            return messages + archived
 
+        bound = await self._archive_bound(db, chat_id)
+        if bound is None or after >= bound:
+            return messages
+        archived = await self._archived_page(db, chat_id, limit, after=after)
+        return (archived + messages)[:limit]
+
+    async def get_history_json(
+        self,
+        db: AsyncSession,
+        chat_id: int,
+        limit: int = 20,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
+    ) -> Optional[bytes]:
+        """Возвращает страницу истории в виде готового JSON.
+
+        Массив сообщений собирает Postgres через string_agg, поэтому строки
+        не разбираются в Python. Чат и страница читаются одним запросом.
+        """
+        logger.debug("Querying JSON history for chat_id=%s, limit=%s", chat_id, limit)
+
+        # Нумеруем строки уже после LIMIT, чтобы не читать всю историю
+        scan = self._page_query(chat_id, before, after).limit(limit + 1).subquery()
+        page = select(
+            scan,
+            func.row_number()
+            .over(order_by=self._page_order(after, scan.c.created_at, scan.c.id))
+            .label("rn"),
+            func.count().over().label("total"),
+        ).subquery()
+
+        in_page = page.c.rn <= limit
+        first = page.c.rn == 1
+        last = page.c.rn == func.least(page.c.total, limit)
+        # JSON сообщения собирается строкой: json_build_object и json_agg
+        # вставляют пробелы, а ответ должен совпадать с dumps побайтно.
+        # Ключи - в порядке MESSAGE_COLUMNS; to_json экранирует текст так же,
+        # как orjson
+        message = func.concat(
+            '{"id":',
+            page.c.id,
+            ',"chat_id":',
+            page.c.chat_id,
+            ',"text":',
+            cast(func.to_json(page.c.text), Text),
+            ',"created_at":"',
+            _json_timestamp(page.c.created_at),
+            '"}',
+        )
+        messages = (
+            select(
+                func.concat(
+                    "[",
+                    func.string_agg(
+                        message,
+                        aggregate_order_by(literal(","), page.c.created_at, page.c.id),
+                    ).filter(in_page),
+                    "]",
+                ).label("messages"),
+                func.count().label("total"),
+                func.max(page.c.created_at).filter(first).label("first_created_at"),
+                func.max(page.c.id).filter(first).label("first_id"),
+                func.max(page.c.created_at).filter(last).label("last_created_at"),
+                func.max(page.c.id).filter(last).label("last_id"),
+            )
+            .select_from(page)
+            .subquery()
+        )
+        stmt = (
+            select(Chat.id, Chat.title, Chat.created_at, messages)
+            .join(messages, true())
+            .filter(Chat.id == chat_id)
+        )
+        row = (await db.execute(stmt)).one_or_none()
+        if row is None:
+            return None
+        if after is not None or row.total <= limit:
+            bound = await self._archive_bound(db, chat_id)
+            if bound is not None and (after is None or after < bound):
+                # Страница заходит в архив: его блоки распаковываются в Python
+                page = await self.get_with_messages(db, chat_id, limit, before, after)
+                return dumps(page)
+
+        has_more = row.total > limit
+        # Первая строка в порядке обхода - самая новая, если не листаем вперед
+        newest, oldest = (
+            (row.last_created_at, row.last_id),
+            (row.first_created_at, row.first_id),
+        )
+        if after is None:
+            newest, oldest = oldest, newest
+        has_older = has_more if after is None else row.total > 0
+        has_newer = has_more if after is not None else before is not None
+
+        head = dumps({"id": row.id, "title": row.title, "created_at": row.created_at})
+        tail = dumps(
+            {
+                "next_cursor": (
+                    encode_cursor(*oldest) if has_older and row.total else None
+                ),
+                "prev_cursor": (
+                    encode_cursor(*newest) if has_newer and row.total else None
+                ),
+            }
+        )
+        # Ключи в том же порядке, что и у _history
+        return head[:-1] + b',"messages":' + row.messages.encode() + b"," + tail[1:]
+
+    @staticmethod
+    def _page_order(
+        after: Optional[Cursor], created_at: Any, message_id: Any
+    ) -> Tuple[Any, ...]:
+        """Порядок обхода страницы: с `after` от старых к новым, иначе наоборот."""
+        if after is not None:
+            return created_at, message_id
+        return created_at.desc(), message_id.desc()
+
+    def _page_query(
+        self, chat_id: int, before: Optional[Cursor], after: Optional[Cursor]
+    ) -> Select:
+        """Запрос страницы сообщений в порядке обхода индекса."""
+        position = tuple_(Message.created_at, Message.id)
+        stmt = select(*MESSAGE_COLUMNS).filter(Message.chat_id == chat_id)
+        # Отдельное условие на created_at позволяет отсечь лишние партиции
+        if after is not None:
+            stmt = stmt.filter(
+                Message.created_at >= after.created_at, position > tuple_(*after)
+            )
+        elif before is not None:
+            stmt = stmt.filter(
+                Message.created_at <= before.created_at, position < tuple_(*before)
+            )
+        return stmt.order_by(*self._page_order(after, Message.created_at, Message.id))
+
+    @staticmethod
+    def _history(
+        chat: Dict[str, Any],
+        messages: List[Dict[str, Any]],
+        has_older: bool,
+        has_newer: bool = False,
+    ) -> Dict[str, Any]:
+        """Собирает ответ с курсорами соседних страниц."""
+        oldest, newest = (messages[0], messages[-1]) if messages else (None, None)
         return {
-            "id": chat.id,
-            "title": chat.title,
-            "created_at": chat.created_at,
-            "messages": sorted_messages,
+            **chat,
+            "messages": messages,
+            "next_cursor": (
+                encode_cursor(oldest["created_at"], oldest["id"])
+                if has_older and oldest
+                else None
+            ),
+            "prev_cursor": (
+                encode_cursor(newest["created_at"], newest["id"])
+                if has_newer and newest
+                else None
+            ),
         }
 
+    async def purge(self, db: AsyncSession, *, chat_id: int, batch_size: int) -> int:
+        """Удаляет сообщения чата пачками, затем сам чат.
+
+        Каждая пачка коммитится отдельно, поэтому удаление большого чата
+        не держит долгих блокировок. Возвращает число удаленных сообщений.
+        """
+        batch = (
+            select(Message.id)
+            .filter(Message.chat_id == chat_id)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        total = 0
+        while True:
+            stmt = (
+                delete(Message)
+                .where(Message.id.in_(batch))
+                .execution_options(synchronize_session=False)
+            )
+            result = await db.execute(stmt)
+            await db.commit()
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                break
+        await self.remove(db, obj_id=chat_id)
+        return total
+
+
+chat = CRUDChat(Chat, cache=history_cache, flights=SingleFlight(), ids=message_ids)
 
-chat = CRUDChat(Chat)
+registry.callback(
+    "history_reads_shared_total",
+    "Чтения истории, присоединившиеся к уже идущему запросу",
+    lambda: chat.flights.shared,
+    type="counter",
+)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models.chat import Chat
+from app.schemas.message import MessageBulkItem
+
+from .crud_chat import CRUDChat
+
+logger = logging.getLogger(__name__)
+
+Pending = Tuple[MessageBulkItem, "asyncio.Future[Optional[Row]]"]
+
+
+class MessageWriteBuffer:
+    """Буфер записи сообщений с групповым коммитом.
+
+    Запросы кладут сообщение в очередь и ждут свой future. Фоновая задача
+    каждые `delay` секунд или при наборе `max_batch` сообщений вставляет
+    накопленное одной многострочной вставкой в одной транзакции, так что
+    один fsync WAL приходится на всю пачку. Ответ клиенту по-прежнему
+    отправляется только после коммита.
+    """
+
+    def __init__(
+        self,
+        crud: CRUDChat,
+        session_factory: Callable[[], AsyncSession],
+        max_batch: int,
+        delay: float,
+        queue_size: int,
+    ):
+        self.crud = crud
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.delay = delay
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue[Optional[Pending]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает буфер, дописав уже принятые сообщения."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        await self._queue.put(None)
+        await task
+        # Сообщения, поставленные в очередь уже после сигнала остановки
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                leftover.append(item)
+        if leftover:
+            await self._flush(leftover)
+
+    async def submit(self, chat_id: int, text: str) -> Optional[Row]:
+        """Ставит сообщение в очередь и ждет его вставки.
+
+        Возвращает строку сообщения или None, если чата не существует.
+        """
+        if self._task is None:
+            raise RuntimeError("Message write buffer is not running")
+        future = asyncio.get_running_loop().create_future()
+        # При заполненной очереди запрос ждет: это и есть backpressure
+        await self._queue.put((MessageBulkItem(chat_id=chat_id, text=text), future))
+        return await future
+
+    async def _run(self) -> None:
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Даем накопиться пачке, если она еще не заполнена
+            if self._queue.qsize() + 1 < self.max_batch:
+                await asyncio.sleep(self.delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Pending]) -> None:
+        try:
+            async with self.session_factory() as db:
+                await self._insert(db, batch)
+        except Exception as e:
+            logger.exception("Buffered insert of %s messages failed", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _insert(self, db: AsyncSession, batch: List[Pending]) -> None:
+        """Вставляет пачку; сообщения в несуществующие чаты получают None.
+
+        Внешний ключ откатывает всю пачку, поэтому при ошибке отсеиваем
+        сообщения в отсутствующие чаты и повторяем вставку с остальными.
+        """
+        while batch:
+            rows = await self.crud.create_messages(
+                db, objs_in=[item for item, _ in batch]
+            )
+            if rows is not None:
+                for (_, future), row in zip(batch, rows):
+                    if not future.done():
+                        future.set_result(row)
+                return
+
+            chat_ids = {item.chat_id for item, _ in batch}
+            existing = set(
+                (
+                    await db.execute(select(Chat.id).where(Chat.id.in_(chat_ids)))
+                ).scalars()
+            )
+            await db.rollback()
+            remaining = []
+            for item, future in batch:
+                if item.chat_id in existing:
+                    remaining.append((item, future))
+                elif not future.done():
+                    future.set_result(None)
+            batch = remaining
+
+
+def create_message_buffer(crud: CRUDChat) -> MessageWriteBuffer:
+    """Создает буфер записи согласно настройкам."""
+    return MessageWriteBuffer(
+        crud,
+        AsyncSessionLocal,
+        max_batch=settings.MESSAGE_BUFFER_MAX_BATCH,
+        delay=settings.MESSAGE_BUFFER_DELAY_MS / 1000,
+        queue_size=settings.MESSAGE_BUFFER_QUEUE_SIZE,
+    )
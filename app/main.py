@@ -1,15 +1,62 @@
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from app import crud
 from app.api.v1.api import api_router
+from app.core.admission import AdmissionMiddleware
+from app.core.archive import MessageArchiver
+from app.core.broadcast import broadcast
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.db import PrimaryPinMiddleware, engine
+from app.core.idempotency import IdempotencyKeyPurger
+from app.core.log import setup_logging
+from app.core.metrics import MetricsMiddleware, registry
+from app.core.partitions import PartitionMaintainer
 
-logging.basicConfig(
-    level=settings.LOG_LEVEL,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 logger.info("Starting FastChat API...")
 
-app = FastAPI(title="FastChat API")
+partitions = PartitionMaintainer(engine)
+idempotency_keys = IdempotencyKeyPurger(engine)
+archiver = MessageArchiver(engine)
+# Сообщения из других воркеров делают локальный кэш истории устаревшим;
+# регистрируется один раз, а не при каждом запуске lifespan
+broadcast.remote_listeners.append(crud.chat.invalidate_cache)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Запускает и останавливает фоновые службы приложения."""
+    await partitions.start()
+    await idempotency_keys.start()
+    if settings.MESSAGES_ARCHIVE_AFTER_DAYS > 0:
+        await archiver.start()
+    await broadcast.start()
+    if settings.MESSAGE_BUFFER_ENABLED:
+        await crud.message_buffer.start()
+    yield
+    await crud.message_buffer.stop()
+    await broadcast.stop()
+    await archiver.stop()
+    await idempotency_keys.stop()
+    await partitions.stop()
+
+
+app = FastAPI(title="FastChat API", lifespan=lifespan)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+if settings.ADMISSION_MAX_CONCURRENCY > 0:
+    app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+if settings.DATABASE_REPLICA_URLS:
+    app.add_middleware(PrimaryPinMiddleware)
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Метрики в текстовом формате Prometheus."""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
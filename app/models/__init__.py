@@ -1,3 +1,6 @@
 from .base import Base
 from .chat import Chat
 from .message import Message
+from .idempotency_key import MessageIdempotencyKey
+from .rate_limit import RateLimitBucket
+from .message_archive import MessageArchive
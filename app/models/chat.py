@@ -1,7 +1,7 @@
 import datetime
-from typing import List
+from typing import List, Optional
 
-from sqlalchemy import String, DateTime
+from sqlalchemy import BigInteger, String, DateTime, Index, Integer
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -9,7 +9,11 @@ from .base import Base
 
 
 class Chat(Base):
-    """Модель чата"""
+    """Модель чата.
+
+    Число сообщений и последнее сообщение денормализованы в строку чата и
+    обновляются вместе со вставкой, чтобы список чатов не считал сообщения.
+    """
 
     __tablename__ = "chats"
 
@@ -18,7 +22,28 @@ class Chat(Base):
     created_at: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
+    message_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, server_default="0"
+    )
+    last_message_at: Mapped[Optional[datetime.datetime]] = mapped_column(
+        DateTime(timezone=True)
+    )
+    last_message_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+    # Растет, когда старые сообщения чата удаляются или уходят в архив:
+    # входит в ETag страниц истории, которые иначе не меняются
+    history_version: Mapped[int] = mapped_column(
+        Integer, nullable=False, server_default="0"
+    )
 
     messages: Mapped[List["Message"]] = relationship(
-        back_populates="chat", cascade="all, delete-orphan"
+        back_populates="chat", cascade="all, delete-orphan", passive_deletes=True
     )
+
+    @classmethod
+    def activity(cls):
+        """Время последней активности: последнее сообщение или создание чата."""
+        return func.coalesce(cls.last_message_at, cls.created_at)
+
+
+# Список чатов по активности читается обратным проходом по этому индексу
+Index("ix_chats_activity", Chat.activity(), Chat.id)
@@ -0,0 +1,34 @@
+import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from .base import Base
+
+# Максимальная длина ключа идемпотентности
+KEY_LENGTH = 255
+
+
+class MessageIdempotencyKey(Base):
+    """Ключ идемпотентности отправки сообщения.
+
+    Уникальность ключа в чате гарантирует первичный ключ (chat_id, key):
+    повтор запроса не проходит вставку и находит исходное сообщение.
+    Таблица сообщений секционирована, поэтому ключ хранится отдельно,
+    а не уникальным индексом на ней. Устаревшие ключи удаляются по `created_at`.
+    """
+
+    __tablename__ = "message_idempotency_keys"
+
+    chat_id: Mapped[int] = mapped_column(
+        ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True
+    )
+    key: Mapped[str] = mapped_column(String(KEY_LENGTH), primary_key=True)
+    message_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    message_created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
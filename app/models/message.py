@@ -1,27 +1,66 @@
 import datetime
 
-from sqlalchemy import String, DateTime, ForeignKey
+from sqlalchemy import (
+    BigInteger,
+    Computed,
+    String,
+    DateTime,
+    ForeignKey,
+    Index,
+    event,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
+from app.core.config import settings
+from app.core.partitions import ensure_partitions
 from . import Chat
 from .base import Base
 
+# Конфигурация полнотекстового поиска: без стемминга, для любых языков
+SEARCH_CONFIG = "simple"
+
 
 class Message(Base):
-    """Модель сообщения"""
+    """Модель сообщения.
+
+    Таблица секционирована по месяцам `created_at`, поэтому первичный ключ
+    включает `created_at`. Партиции создает `app.core.partitions`.
+    """
 
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+        # Новые сообщения после известного клиенту id (синхронизация)
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    # BIGINT: при MESSAGE_ID_STRATEGY=snowflake id выдает приложение
+    id: Mapped[int] = mapped_column(
+        BigInteger, primary_key=True, autoincrement=True, index=True
+    )
 
     chat_id: Mapped[int] = mapped_column(
         ForeignKey("chats.id", ondelete="CASCADE"), nullable=False
     )
 
     text: Mapped[str] = mapped_column(String(5000), nullable=False)
+    # Вычисляется Postgres при вставке; в ORM не загружается
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{SEARCH_CONFIG}', text)", persisted=True),
+        deferred=True,
+    )
     created_at: Mapped[datetime.datetime] = mapped_column(
-        DateTime(timezone=True), server_default=func.now()
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
     )
 
     chat: Mapped["Chat"] = relationship(back_populates="messages")
+
+
+@event.listens_for(Message.__table__, "after_create")
+def _create_partitions(target, connection, **kw) -> None:
+    ensure_partitions(connection, settings.MESSAGES_PARTITIONS_AHEAD)
@@ -0,0 +1,40 @@
+import datetime
+
+from sqlalchemy import (
+    BigInteger,
+    Date,
+    DateTime,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    String,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class MessageArchive(Base):
+    """Архив старых сообщений: сжатый блок на чат и день (UTC).
+
+    Блок хранит сообщения дня в порядке (created_at, id); границы блока
+    позволяют найти нужный день по первичному ключу без распаковки.
+    """
+
+    __tablename__ = "message_archive"
+
+    chat_id: Mapped[int] = mapped_column(
+        ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True
+    )
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    first_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    last_created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    last_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    codec: Mapped[str] = mapped_column(String(8), nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
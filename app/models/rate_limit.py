@@ -0,0 +1,23 @@
+import datetime
+
+from sqlalchemy import DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class RateLimitBucket(Base):
+    """Состояние лимита запросов, общее для всех воркеров.
+
+    Хранится одно время (GCRA): когда ключ снова сможет сделать запрос
+    без использования запаса. Таблица UNLOGGED: потеря состояния при сбое
+    лишь временно снимает лимиты, зато запись не пишет WAL.
+    """
+
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: Mapped[str] = mapped_column(String(200), primary_key=True)
+    tat: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
@@ -1,2 +1,16 @@
-from .chat import ChatCreate, ChatRead, ChatWithMessages
-from .message import MessageCreate, MessageRead
+from .chat import (
+    ChatCreate,
+    ChatDelta,
+    ChatList,
+    ChatRead,
+    ChatSummary,
+    ChatSync,
+    ChatWithMessages,
+)
+from .message import (
+    MessageBulkItem,
+    MessageCreate,
+    MessageRead,
+    MessageSearchHit,
+    MessageSearchResults,
+)
@@ -1,4 +1,4 @@
-from typing import List, Annotated
+from typing import List, Annotated, Optional
 from datetime import datetime
 from pydantic import BaseModel, StringConstraints, ConfigDict
 from .message import MessageRead
@@ -30,3 +30,39 @@ class ChatWithMessages(ChatRead):
     """Схема чата с сообщениями."""
 
     messages: List[MessageRead] = []
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+class ChatSummary(ChatRead):
+    """Схема чата в списке: счетчик и превью последнего сообщения."""
+
+    message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    last_message_id: Optional[int] = None
+    last_message_text: Optional[str] = None
+
+
+class ChatList(BaseModel):
+    """Страница списка чатов."""
+
+    chats: List[ChatSummary] = []
+    next_cursor: Optional[str] = None
+
+
+class ChatDelta(BaseModel):
+    """Новые сообщения чата с момента последней синхронизации."""
+
+    chat_id: int
+    messages: List[MessageRead] = []
+    has_more: bool = False
+    # Новые сообщения уже в архиве: историю чата нужно перечитать
+    resync: bool = False
+    last_message_id: int
+
+
+class ChatSync(BaseModel):
+    """Результат синхронизации: только чаты с новыми сообщениями."""
+
+    chats: List[ChatDelta] = []
+    missing: List[int] = []
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel, Field, ConfigDict
 
 
@@ -14,6 +15,12 @@ class MessageCreate(MessageBase):
     pass
 
 
+class MessageBulkItem(MessageCreate):
+    """Схема сообщения для пакетной загрузки в разные чаты."""
+
+    chat_id: int
+
+
 class MessageRead(MessageBase):
     """Схема для чтения данных сообщения."""
 
@@ -22,3 +29,16 @@ class MessageRead(MessageBase):
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class MessageSearchHit(MessageRead):
+    """Найденное сообщение с оценкой релевантности."""
+
+    rank: float
+
+
+class MessageSearchResults(BaseModel):
+    """Страница результатов поиска."""
+
+    messages: List[MessageSearchHit] = []
+    next_cursor: Optional[str] = None
@@ -0,0 +1,333 @@
+"""Нагрузочный прогон эндпоинтов чатов.
+
+Примеры:
+    python -m benchmarks.run --messages 100000 --requests 2000 --concurrency 50
+    python -m benchmarks.run --base-url http://localhost:8000 --output run.json
+    python -m benchmarks.run --baseline baseline.json --threshold 0.1
+
+По умолчанию запросы идут прямо в ASGI-приложение, без сети. Данные
+засеваются в БД из DATABASE_URL (или --database-url) одним INSERT ...
+SELECT generate_series, поэтому чат на 10^6 сообщений создается за секунды.
+Прогон с ошибками, которых не было в baseline, считается деградацией.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+ENDPOINTS = ("create_chat", "create_message", "get_chat", "delete_chat")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database-url",
+        help="БД для засева; по умолчанию DATABASE_URL из окружения/.env",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="Адрес запущенного uvicorn; без него запросы идут в ASGI-приложение",
+    )
+    parser.add_argument(
+        "--create-schema",
+        action="store_true",
+        help="Создать таблицы по моделям (для пустой временной БД)",
+    )
+    parser.add_argument("--chats", type=int, default=10, help="Чатов для чтения")
+    parser.add_argument(
+        "--messages", type=int, default=1000, help="Сообщений в каждом чате"
+    )
+    parser.add_argument(
+        "--delete-messages",
+        type=int,
+        default=100,
+        help="Сообщений в каждом чате, удаляемом в delete_chat",
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="На эндпоинт")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20, help="limit для GET")
+    parser.add_argument(
+        "--endpoints",
+        default=",".join(ENDPOINTS),
+        help="Список эндпоинтов через запятую",
+    )
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    parser.add_argument("--baseline", help="Сохраненный прогон для сравнения")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Допустимая деградация p95/throughput относительно baseline",
+    )
+    return parser.parse_args(argv)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга, в миллисекундах."""
+    ordered = sorted(samples)
+    index = max(int(round(q / 100 * len(ordered))) - 1, 0)
+    return round(ordered[index] * 1000, 3)
+
+
+async def seed(chats: int, messages: int) -> List[int]:
+    """Создает чаты с заданным числом сообщений, возвращает их id.
+
+    Сообщения вставляются одним INSERT ... SELECT, а счетчики чата
+    (message_count, last_message_*) обновляются в том же запросе, как
+    при обычной вставке. Сообщения свежие: они попадают в текущую
+    партицию и не подлежат архивации. С MESSAGE_ID_STRATEGY=snowflake
+    id выдает генератор приложения, а время берется из id.
+    """
+    from sqlalchemy import text
+
+    from app.core import ids
+    from app.core.db import AsyncSessionLocal
+    from app.crud import chat
+
+    if chat.ids is None:
+        rows = (
+            "SELECT nextval(pg_get_serial_sequence('messages', 'id')) AS id, g, "
+            "now() - (:n - g) * interval '1 millisecond' AS created_at "
+            "FROM generate_series(1, :n) AS g"
+        )
+    else:
+        rows = (
+            "SELECT id, g, timestamptz 'epoch' + "
+            f"({ids.EPOCH_MS} + (id >> {ids.WORKER_BITS + ids.SEQUENCE_BITS})) "
+            "* interval '1 millisecond' AS created_at "
+            "FROM unnest(CAST(:ids AS bigint[])) WITH ORDINALITY AS s(id, g)"
+        )
+    insert_messages = text(
+        "WITH seeded AS ("
+        " INSERT INTO messages (id, chat_id, text, created_at)"
+        f" SELECT id, :chat_id, 'bench message ' || g, created_at FROM ({rows}) r"
+        " RETURNING id, created_at"
+        ") "
+        "UPDATE chats SET message_count = (SELECT count(*) FROM seeded),"
+        " (last_message_at, last_message_id) = ("
+        "  SELECT created_at, id FROM seeded"
+        "  ORDER BY created_at DESC, id DESC LIMIT 1)"
+        " WHERE id = :chat_id"
+    )
+
+    chat_ids = []
+    async with AsyncSessionLocal() as db:
+        for i in range(chats):
+            chat_id = (
+                await db.execute(
+                    text("INSERT INTO chats (title) VALUES (:title) RETURNING id"),
+                    {"title": f"bench-{i}"},
+                )
+            ).scalar_one()
+            params: Dict[str, Any] = {"chat_id": chat_id, "n": messages}
+            if chat.ids is not None:
+                params["ids"] = [chat.ids.next_id() for _ in range(messages)]
+            if messages:
+                await db.execute(insert_messages, params)
+            chat_ids.append(chat_id)
+        await db.commit()
+        await db.execute(text("ANALYZE chats, messages"))
+    return chat_ids
+
+
+async def cleanup(chat_ids: List[int]) -> None:
+    """Удаляет засеянные и созданные прогоном чаты."""
+    from sqlalchemy import text
+
+    from app.core.db import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            text("DELETE FROM chats WHERE id = ANY(:ids)"), {"ids": chat_ids}
+        )
+        await db.commit()
+
+
+async def drive(
+    requests: int,
+    concurrency: int,
+    call: Callable[[int], Awaitable[httpx.Response]],
+) -> Dict[str, Any]:
+    """Выполняет `requests` вызовов с заданной конкурентностью."""
+    latencies: List[float] = []
+    errors = 0
+    # Коды ошибок: 429/503 от лимитов выглядят как быстрые ответы
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await call(i)
+                status = str(response.status_code)
+            except httpx.HTTPError:
+                status = "connection"
+            latencies.append(time.perf_counter() - started)
+            if status == "connection" or int(status) >= 400:
+                errors += 1
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "error_statuses": statuses,
+        "throughput_rps": round(requests / elapsed, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.core.db import engine
+    from app.main import app
+    from app.models.base import Base
+
+    if args.create_schema:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    if args.base_url:
+        transport = None
+        base_url = args.base_url
+    else:
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+    prefix = "/api/v1/chats"
+
+    endpoints = [name for name in args.endpoints.split(",") if name]
+    chat_ids = await seed(args.chats, args.messages)
+    created: List[int] = []
+    results: Dict[str, Any] = {}
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(
+            transport=transport, base_url=base_url, limits=limits, timeout=60
+        ) as client,
+    ):
+
+        async def create_chat(i: int) -> httpx.Response:
+            response = await client.post(f"{prefix}/", json={"title": f"b{i}"})
+            if response.status_code == 201:
+                created.append(response.json()["id"])
+            return response
+
+        async def create_message(i: int) -> httpx.Response:
+            chat_id = chat_ids[i % len(chat_ids)]
+            return await client.post(
+                f"{prefix}/{chat_id}/messages/", json={"text": f"bench {i}"}
+            )
+
+        async def get_chat(i: int) -> httpx.Response:
+            chat_id = chat_ids[i % len(chat_ids)]
+            return await client.get(f"{prefix}/{chat_id}?limit={args.limit}")
+
+        async def delete_chat(i: int) -> httpx.Response:
+            return await client.delete(f"{prefix}/{delete_ids[i]}")
+
+        calls = {
+            "create_chat": create_chat,
+            "create_message": create_message,
+            "get_chat": get_chat,
+        }
+        for name in endpoints:
+            if name == "delete_chat":
+                delete_ids = await seed(args.requests, args.delete_messages)
+                calls[name] = delete_chat
+            results[name] = await drive(args.requests, args.concurrency, calls[name])
+            print(f"{name}: {results[name]}", file=sys.stderr)
+
+    await cleanup(chat_ids + created)
+    await engine.dispose()
+
+    return {
+        "config": {
+            "chats": args.chats,
+            "messages": args.messages,
+            "delete_messages": args.delete_messages,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "limit": args.limit,
+            "transport": "http" if args.base_url else "asgi",
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    current: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """Сравнивает прогон с baseline и возвращает список деградаций.
+
+    Рост доли ошибок - деградация сам по себе: быстрые отказы (429, 503)
+    иначе выглядели бы как улучшение задержек.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        errors = result["errors"] / result["requests"]
+        base = baseline.get("results", {}).get(name)
+        base_errors = base["errors"] / base["requests"] if base else 0.0
+        if errors > base_errors:
+            regressions.append(
+                f"{name}: errors {errors:.1%} (baseline {base_errors:.1%})"
+            )
+        if base is None:
+            continue
+        p95 = result["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps = 1 - result["throughput_rps"] / base["throughput_rps"]
+        result["baseline_delta"] = {"p95": round(p95, 4), "throughput": round(-rps, 4)}
+        if p95 > threshold:
+            regressions.append(f"{name}: p95 {p95:+.1%}")
+        if rps > threshold:
+            regressions.append(f"{name}: throughput {-rps:+.1%}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # Настройки читаются при импорте приложения
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    # Все запросы прогона идут от одного клиента: лимиты частоты мерили бы
+    # себя, а не эндпоинты. Явно заданный RATE_LIMIT_BACKEND сохраняется
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+
+    report = asyncio.run(run(args))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        status = 1 if regressions else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
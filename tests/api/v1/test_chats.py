@@ -1,5 +1,26 @@
+import asyncio
+from datetime import datetime
+
+import orjson
 import pytest
+from fastapi import status
 from httpx import AsyncClient
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import crud
+from app.api.v1.endpoints import chats as chats_endpoint
+from app.core import ratelimit
+from app.core.broadcast import hub
+from app.core.cache import history_cache
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal, get_read_db
+from app.core.idempotency import idempotency_cache
+from app.core.ids import SnowflakeGenerator, id_time
+from app.core.pagination import encode_cursor
+from app.core.ratelimit import MemoryRateLimiter
+from app.main import app
+from app.schemas.message import MessageCreate
 
 VALID_CHAT_TITLE = "Test Chat"
 VALID_MESSAGE_TEXT = "Hello, World!"
@@ -63,6 +84,34 @@ class TestChats:
         get_res = await client.get(f"/api/v1/chats/{chat_id}")
         assert get_res.status_code == 404
 
+    @pytest.mark.asyncio
+    async def test_list_chats_by_activity(self, client: AsyncClient):
+        """Список чатов отсортирован по последнему сообщению, со счетчиками."""
+        ids = []
+        for title in ("A", "B", "C"):
+            res = await client.post("/api/v1/chats/", json={"title": title})
+            ids.append(res.json()["id"])
+        await client.post(f"/api/v1/chats/{ids[0]}/messages/", json={"text": "x"})
+        await client.post(
+            "/api/v1/chats/messages/bulk/",
+            json=[{"chat_id": ids[0], "text": "y"}, {"chat_id": ids[1], "text": "z"}],
+        )
+
+        first = (await client.get("/api/v1/chats/", params={"limit": 2})).json()
+        assert [c["id"] for c in first["chats"]] == [ids[1], ids[0]]
+        assert first["chats"][1]["message_count"] == 2
+        assert first["chats"][1]["last_message_text"] == "y"
+
+        rest = (
+            await client.get(
+                "/api/v1/chats/", params={"limit": 2, "before": first["next_cursor"]}
+            )
+        ).json()
+        assert [c["id"] for c in rest["chats"]] == [ids[2]]
+        assert rest["chats"][0]["message_count"] == 0
+        assert rest["chats"][0]["last_message_id"] is None
+        assert rest["next_cursor"] is None
+
     @pytest.mark.asyncio
     async def test_chat_not_found(self, client: AsyncClient):
         """Операции с несуществующим чатом возвращают 404."""
@@ -96,6 +145,37 @@ class TestMessages:
         data = response.json()
         assert data["text"] == VALID_MESSAGE_TEXT
         assert data["chat_id"] == chat_id
+        assert isinstance(data["id"], int)
+        assert "created_at" in data
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("key", [None, "k"])
+    async def test_create_message_one_statement(
+        self, client: AsyncClient, db_session, chat_id: int, key
+    ):
+        """Сообщение и счетчики чата пишутся одним запросом."""
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = db_session.bind.sync_engine
+        event.listen(engine, "before_cursor_execute", record)
+        headers = {"Idempotency-Key": key} if key else {}
+        try:
+            response = await client.post(
+                f"/api/v1/chats/{chat_id}/messages/",
+                json={"text": "A"},
+                headers=headers,
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert response.status_code == 201
+        assert len(statements) == 1
+
+        chat = (await client.get("/api/v1/chats/")).json()["chats"][0]
+        assert chat["message_count"] == 1
+        assert chat["last_message_id"] == response.json()["id"]
 
     @pytest.mark.asyncio
     async def test_get_chat_history_with_pagination(
@@ -142,3 +222,705 @@ class TestMessages:
             f"/api/v1/chats/{chat_id}/messages/", json={"text": invalid_text}
         )
         assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_history_cursor_pagination(self, client: AsyncClient, chat_id: int):
+        """Листание истории курсорами before/after."""
+        for i in range(5):
+            await client.post(
+                f"/api/v1/chats/{chat_id}/messages/", json={"text": f"Msg {i}"}
+            )
+
+        first = (await client.get(f"/api/v1/chats/{chat_id}?limit=2")).json()
+        assert [m["text"] for m in first["messages"]] == ["Msg 3", "Msg 4"]
+        assert first["prev_cursor"] is None
+
+        second = (
+            await client.get(
+                f"/api/v1/chats/{chat_id}",
+                params={"limit": 2, "before": first["next_cursor"]},
+            )
+        ).json()
+        assert [m["text"] for m in second["messages"]] == ["Msg 1", "Msg 2"]
+
+        last = (
+            await client.get(
+                f"/api/v1/chats/{chat_id}",
+                params={"limit": 2, "before": second["next_cursor"]},
+            )
+        ).json()
+        assert [m["text"] for m in last["messages"]] == ["Msg 0"]
+        assert last["next_cursor"] is None
+
+        newer = (
+            await client.get(
+                f"/api/v1/chats/{chat_id}",
+                params={"limit": 2, "after": last["prev_cursor"]},
+            )
+        ).json()
+        assert [m["text"] for m in newer["messages"]] == ["Msg 1", "Msg 2"]
+        assert newer["prev_cursor"] is not None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"before": "not-a-cursor"},
+            {"before": "MjAyNi0wMS0wMVQwMDowMDowMCswMDowMHwx", "after": "x"},
+        ],
+    )
+    async def test_history_invalid_cursor(
+        self, client: AsyncClient, chat_id: int, params
+    ):
+        """Некорректные курсоры отклоняются с 400."""
+        response = await client.get(f"/api/v1/chats/{chat_id}", params=params)
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_delete_chat_with_messages(self, client: AsyncClient, chat_id: int):
+        """Удаление чата вместе с сообщениями одним запросом."""
+        for i in range(3):
+            await client.post(
+                f"/api/v1/chats/{chat_id}/messages/", json={"text": f"Msg {i}"}
+            )
+
+        assert (await client.delete(f"/api/v1/chats/{chat_id}")).status_code == 204
+        assert (await client.get(f"/api/v1/chats/{chat_id}")).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_delete_chat_in_background(self, client: AsyncClient, chat_id: int):
+        """Фоновое удаление возвращает 202 и удаляет чат."""
+        for i in range(3):
+            await client.post(
+                f"/api/v1/chats/{chat_id}/messages/", json={"text": f"Msg {i}"}
+            )
+
+        response = await client.delete(
+            f"/api/v1/chats/{chat_id}", params={"background": True}
+        )
+        assert response.status_code == 202
+        assert (await client.get(f"/api/v1/chats/{chat_id}")).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_bulk_create_messages_in_chat(
+        self, client: AsyncClient, chat_id: int
+    ):
+        """Пакетная загрузка сообщений в один чат сохраняет порядок."""
+        payload = [{"text": f"Msg {i}"} for i in range(5)]
+        response = await client.post(
+            f"/api/v1/chats/{chat_id}/messages/bulk/", json=payload
+        )
+        assert response.status_code == 201
+
+        data = response.json()
+        assert [m["text"] for m in data] == [p["text"] for p in payload]
+        assert all(m["chat_id"] == chat_id for m in data)
+
+        history = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+        assert len(history["messages"]) == 5
+
+    @pytest.mark.asyncio
+    async def test_bulk_create_messages_across_chats(
+        self, client: AsyncClient, chat_id: int
+    ):
+        """Пакетная загрузка в разные чаты; несуществующий чат откатывает все."""
+        other = (await client.post("/api/v1/chats/", json={"title": "Other"})).json()
+        payload = [
+            {"chat_id": chat_id, "text": "A"},
+            {"chat_id": other["id"], "text": "B"},
+        ]
+        response = await client.post("/api/v1/chats/messages/bulk/", json=payload)
+        assert response.status_code == 201
+        assert [m["chat_id"] for m in response.json()] == [chat_id, other["id"]]
+
+        payload.append({"chat_id": 999999, "text": "C"})
+        response = await client.post("/api/v1/chats/messages/bulk/", json=payload)
+        assert response.status_code == 404
+        history = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+        assert len(history["messages"]) == 1
+
+    @pytest.mark.asyncio
+    async def test_bulk_create_validation(self, client: AsyncClient, chat_id: int):
+        """Пустая пачка отклоняется."""
+        response = await client.post(f"/api/v1/chats/{chat_id}/messages/bulk/", json=[])
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_recent_history_served_from_cache(
+        self, client: AsyncClient, chat_id: int
+    ):
+        """Повторное чтение последних сообщений не идет в БД и видит новые."""
+        await client.post(f"/api/v1/chats/{chat_id}/messages/", json={"text": "A"})
+        first = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+
+        hits = history_cache.hits
+        await client.post(f"/api/v1/chats/{chat_id}/messages/", json={"text": "B"})
+        second = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+
+        assert history_cache.hits == hits + 1
+        assert [m["text"] for m in first["messages"]] == ["A"]
+        assert [m["text"] for m in second["messages"]] == ["A", "B"]
+        assert second["next_cursor"] is None
+
+    @pytest.mark.asyncio
+    async def test_history_built_by_postgres(
+        self, client: AsyncClient, db_session, chat_id: int, monkeypatch
+    ):
+        """JSON страницы, собранный через json_agg, совпадает с обычным побайтно."""
+        # Время без микросекунд: orjson опускает дробную часть. Начало месяца
+        # попадает в созданную партицию и старше остальных сообщений
+        await db_session.execute(
+            text(
+                "INSERT INTO messages (chat_id, text, created_at) "
+                "VALUES (:chat_id, 'Whole second', "
+                "date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')"
+            ),
+            {"chat_id": chat_id},
+        )
+        await db_session.commit()
+        # Символы, которые JSON экранирует, и не-ASCII
+        for i in range(3):
+            await client.post(
+                f"/api/v1/chats/{chat_id}/messages/",
+                json={"text": f'Msg {i} "q" \\ /\n\t\x01 ü 😀'},
+            )
+        first = (await client.get(f"/api/v1/chats/{chat_id}?limit=2")).json()
+        params = {"limit": 2, "before": first["next_cursor"]}
+        expected = await client.get(f"/api/v1/chats/{chat_id}", params=params)
+
+        monkeypatch.setattr(settings, "HISTORY_JSON_AGG", True)
+        response = await client.get(f"/api/v1/chats/{chat_id}", params=params)
+        assert response.status_code == 200
+        assert response.content == expected.content
+        created = [m["created_at"] for m in response.json()["messages"]]
+        assert created[0].endswith("-01T00:00:00Z") and len(created[0]) == 20
+        assert created[1].endswith("Z") and len(created[1]) == 27
+
+        missing = await client.get("/api/v1/chats/999999", params=params)
+        assert missing.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_buffered_messages_group_commit(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """Параллельные сообщения через буфер вставляются одной пачкой."""
+        batches = []
+        create_messages = crud.chat.create_messages
+
+        async def counting(db, *, objs_in):
+            batches.append(len(objs_in))
+            return await create_messages(db, objs_in=objs_in)
+
+        monkeypatch.setattr(crud.chat, "create_messages", counting)
+        monkeypatch.setattr(crud.message_buffer, "delay", 0.05)
+        await crud.message_buffer.start()
+        try:
+            responses = await asyncio.gather(
+                *(
+                    client.post(
+                        f"/api/v1/chats/{chat_id}/messages/", json={"text": f"Msg {i}"}
+                    )
+                    for i in range(5)
+                ),
+                client.post("/api/v1/chats/999999/messages/", json={"text": "Lost"}),
+            )
+        finally:
+            await crud.message_buffer.stop()
+
+        assert [r.status_code for r in responses] == [201] * 5 + [404]
+        assert [r.json()["text"] for r in responses[:5]] == [
+            f"Msg {i}" for i in range(5)
+        ]
+        # Первая попытка отклонена внешним ключом, повтор без чужого чата
+        assert batches == [6, 5]
+        history = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+        assert len(history["messages"]) == 5
+
+    @pytest.mark.asyncio
+    async def test_history_etag(self, client: AsyncClient, chat_id: int):
+        """Повторный запрос без изменений получает 304, новое сообщение - 200."""
+        url = f"/api/v1/chats/{chat_id}"
+        await client.post(f"{url}/messages/", json={"text": "A"})
+
+        first = await client.get(url)
+        etag = first.headers["etag"]
+        # Версия чата берется из строки чата и без кэша
+        await history_cache.clear()
+        second = await client.get(url, headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+
+        await client.post(f"{url}/messages/", json={"text": "B"})
+        third = await client.get(url, headers={"If-None-Match": etag})
+        assert third.status_code == 200
+        assert third.headers["etag"] != etag
+        assert [m["text"] for m in third.json()["messages"]] == ["A", "B"]
+
+        missing = await client.get(
+            "/api/v1/chats/999999", headers={"If-None-Match": etag}
+        )
+        assert missing.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_history_etag_out_of_order_commit(
+        self, client: AsyncClient, chat_id: int
+    ):
+        """Сообщение, закоммиченное после более нового, меняет ETag."""
+        url = f"/api/v1/chats/{chat_id}"
+        async with AsyncSessionLocal() as db:
+            # Транзакция A начинается раньше: ее сообщение старше, чем B
+            await db.execute(text("SELECT 1"))
+            await client.post(f"{url}/messages/", json={"text": "B"})
+            first = await client.get(url)
+            await crud.chat.create_message(
+                db, chat_id=chat_id, obj_in=MessageCreate(text="A")
+            )
+
+        again = await client.get(url, headers={"If-None-Match": first.headers["etag"]})
+        assert again.status_code == 200
+        assert [m["text"] for m in again.json()["messages"]] == ["A", "B"]
+
+    @pytest.mark.asyncio
+    async def test_history_etag_read_before_page(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """Сообщение, вставленное после чтения страницы, не прячется за 304."""
+        monkeypatch.setattr(settings, "HISTORY_JSON_AGG", True)
+        url = f"/api/v1/chats/{chat_id}"
+        created = (await client.post(f"{url}/messages/", json={"text": "A"})).json()
+        cursor = encode_cursor(
+            datetime.fromisoformat(created["created_at"]), created["id"]
+        )
+        load = crud.chat.get_history_json
+
+        async def load_then_insert(*args, **kwargs):
+            body = await load(*args, **kwargs)
+            async with AsyncSessionLocal() as db:
+                await crud.chat.create_message(
+                    db, chat_id=chat_id, obj_in=MessageCreate(text="B")
+                )
+            return body
+
+        monkeypatch.setattr(crud.chat, "get_history_json", load_then_insert)
+        params = {"after": cursor}
+        page = await client.get(url, params=params)
+        assert page.json()["messages"] == []
+
+        monkeypatch.setattr(crud.chat, "get_history_json", load)
+        again = await client.get(
+            url, params=params, headers={"If-None-Match": page.headers["etag"]}
+        )
+        assert again.status_code == 200
+        assert [m["text"] for m in again.json()["messages"]] == ["B"]
+
+    async def test_export_chat(self, client: AsyncClient, chat_id: int):
+        """Выгрузка отдает всю историю в JSON и NDJSON в порядке создания."""
+        url = f"/api/v1/chats/{chat_id}"
+        for i in range(3):
+            await client.post(f"{url}/messages/", json={"text": f"m{i}"})
+
+        response = await client.get(f"{url}/export", params={"format": "json"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        body = response.json()
+        assert body["id"] == chat_id
+        assert [m["text"] for m in body["messages"]] == ["m0", "m1", "m2"]
+
+        response = await client.get(f"{url}/export")
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [orjson.loads(line) for line in response.content.splitlines()]
+        assert [m["text"] for m in lines] == ["m0", "m1", "m2"]
+
+        missing = await client.get("/api/v1/chats/999999/export")
+        assert missing.status_code == 404
+
+    async def test_response_compression(self, client: AsyncClient, chat_id: int):
+        """Большие ответы сжимаются по Accept-Encoding, маленькие - нет."""
+        url = f"/api/v1/chats/{chat_id}"
+        for i in range(10):
+            await client.post(f"{url}/messages/", json={"text": "x" * 200})
+
+        for encoding in ("gzip", "zstd"):
+            response = await client.get(url, headers={"Accept-Encoding": encoding})
+            assert response.headers["content-encoding"] == encoding
+            assert response.headers["vary"] == "Accept-Encoding"
+            assert len(response.json()["messages"]) == 10
+
+        response = await client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+
+        small = await client.get(
+            "/api/v1/chats/999999", headers={"Accept-Encoding": "gzip"}
+        )
+        assert "content-encoding" not in small.headers
+
+    async def test_idempotent_message(self, client: AsyncClient, chat_id: int):
+        """Повтор с тем же Idempotency-Key не создает второе сообщение."""
+        url = f"/api/v1/chats/{chat_id}/messages/"
+        headers = {"Idempotency-Key": "retry-1"}
+        first = await client.post(url, json={"text": "Hi"}, headers=headers)
+        assert first.status_code == 201
+        assert "idempotent-replayed" not in first.headers
+
+        # Повтор из памяти процесса и, после ее очистки, по ключу в БД
+        for clear in (False, True):
+            if clear:
+                idempotency_cache.clear()
+            retry = await client.post(url, json={"text": "Hi"}, headers=headers)
+            assert retry.status_code == 201
+            assert retry.headers["idempotent-replayed"] == "true"
+            assert retry.json() == first.json()
+
+        conflict = await client.post(url, json={"text": "Other"}, headers=headers)
+        assert conflict.status_code == 422
+
+        chat = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+        assert [m["text"] for m in chat["messages"]] == ["Hi"]
+
+        missing = await client.post(
+            "/api/v1/chats/999999/messages/", json={"text": "Hi"}, headers=headers
+        )
+        assert missing.status_code == 404
+
+    async def test_message_rate_limit(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """Сверх лимита на чат отправка отклоняется с 429 и Retry-After."""
+        monkeypatch.setattr(ratelimit, "rate_limiter", MemoryRateLimiter(100))
+        monkeypatch.setattr(settings, "RATE_LIMIT_CHAT_PER_SECOND", 0.1)
+        monkeypatch.setattr(settings, "RATE_LIMIT_CHAT_BURST", 2)
+        url = f"/api/v1/chats/{chat_id}/messages/"
+
+        statuses = [
+            (await client.post(url, json={"text": "x"})).status_code for _ in range(3)
+        ]
+        assert statuses == [201, 201, 429]
+        response = await client.post(url, json={"text": "x"})
+        assert 1 <= int(response.headers["retry-after"]) <= 10
+
+    @pytest.mark.asyncio
+    async def test_client_rate_limit_by_header(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """За прокси лимит клиента считается по заголовку, а не по соединению."""
+        monkeypatch.setattr(ratelimit, "rate_limiter", MemoryRateLimiter(100))
+        monkeypatch.setattr(settings, "RATE_LIMIT_CLIENT_HEADER", "X-Forwarded-For")
+        monkeypatch.setattr(settings, "RATE_LIMIT_CLIENT_PER_SECOND", 0.1)
+        monkeypatch.setattr(settings, "RATE_LIMIT_CLIENT_BURST", 1)
+        url = f"/api/v1/chats/{chat_id}/messages/"
+
+        def post(client_ip: str):
+            headers = {"X-Forwarded-For": f"203.0.113.9, {client_ip}"}
+            return client.post(url, json={"text": "x"}, headers=headers)
+
+        assert (await post("10.0.0.1")).status_code == 201
+        assert (await post("10.0.0.2")).status_code == 201
+        assert (await post("10.0.0.1")).status_code == 429
+
+    async def test_history_single_flight(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """Одновременные одинаковые чтения истории выполняются один раз."""
+        url = f"/api/v1/chats/{chat_id}"
+        await client.post(f"{url}/messages/", json={"text": "A"})
+        load = crud.chat.get_history_page
+        calls = 0
+
+        async def slow_load(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return await load(*args, **kwargs)
+
+        monkeypatch.setattr(crud.chat, "get_history_page", slow_load)
+        responses = await asyncio.gather(*(client.get(url) for _ in range(5)))
+        assert calls == 1
+        assert {r.content for r in responses} == {responses[0].content}
+        assert [m["text"] for m in responses[0].json()["messages"]] == ["A"]
+
+    @pytest.mark.asyncio
+    async def test_history_single_flight_one_connection(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """Условный запрос истории обходится одним соединением пула."""
+        url = f"/api/v1/chats/{chat_id}"
+        await client.post(f"{url}/messages/", json={"text": "A"})
+        await history_cache.clear()
+
+        engine = create_async_engine(
+            settings.DATABASE_URL, pool_size=1, max_overflow=0, pool_timeout=1
+        )
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def one_connection_db():
+            async with factory() as session:
+                yield session
+
+        app.dependency_overrides[get_read_db] = one_connection_db
+        monkeypatch.setattr(chats_endpoint, "read_session_factory", lambda _: factory)
+        try:
+            response = await client.get(url, headers={"If-None-Match": 'W/"stale"'})
+        finally:
+            await engine.dispose()
+        assert response.status_code == 200
+        assert [m["text"] for m in response.json()["messages"]] == ["A"]
+
+    async def test_snowflake_message_ids(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """С id от приложения сообщения вставляются без RETURNING и по порядку."""
+        monkeypatch.setattr(crud.chat, "ids", SnowflakeGenerator(worker_id=3))
+        url = f"/api/v1/chats/{chat_id}"
+        single = (await client.post(f"{url}/messages/", json={"text": "A"})).json()
+        bulk = (
+            await client.post(
+                f"{url}/messages/bulk/", json=[{"text": "B"}, {"text": "C"}]
+            )
+        ).json()
+        replay = (
+            await client.post(
+                f"{url}/messages/", json={"text": "D"}, headers={"Idempotency-Key": "k"}
+            )
+        ).json()
+
+        created = [single, *bulk, replay]
+        assert [m["id"] for m in created] == sorted(m["id"] for m in created)
+        assert all(m["id"] > 2**31 for m in created)
+        for message in created:
+            assert datetime.fromisoformat(message["created_at"]) == id_time(
+                message["id"]
+            )
+
+        await history_cache.clear()
+        history = (await client.get(url)).json()
+        assert history["messages"] == created
+
+    async def test_sync_chats(self, client: AsyncClient, chat_id: int):
+        """Синхронизация возвращает только новые сообщения и курсоры чатов."""
+        url = "/api/v1/chats"
+        other = (await client.post(f"{url}/", json={"title": "Other"})).json()["id"]
+        quiet = (await client.post(f"{url}/", json={"title": "Quiet"})).json()["id"]
+        created = (
+            await client.post(
+                f"{url}/messages/bulk/",
+                json=[
+                    {"chat_id": chat_id, "text": "A"},
+                    {"chat_id": chat_id, "text": "B"},
+                    {"chat_id": chat_id, "text": "C"},
+                    {"chat_id": other, "text": "X"},
+                    {"chat_id": quiet, "text": "Q"},
+                ],
+            )
+        ).json()
+        seen = {chat_id: created[0]["id"], other: 0, quiet: created[4]["id"], 0: 0}
+
+        response = await client.post(f"{url}/sync?limit=1", json={"chats": seen})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["missing"] == [0]
+        assert data["chats"] == [
+            {
+                "chat_id": chat_id,
+                "messages": [created[1]],
+                "has_more": True,
+                "resync": False,
+                "last_message_id": created[1]["id"],
+            },
+            {
+                "chat_id": other,
+                "messages": [created[3]],
+                "has_more": False,
+                "resync": False,
+                "last_message_id": created[3]["id"],
+            },
+        ]
+
+        seen = {chat_id: created[1]["id"], other: created[3]["id"]}
+        data = (await client.post(f"{url}/sync", json={"chats": seen})).json()
+        assert [m["text"] for d in data["chats"] for m in d["messages"]] == ["C"]
+
+    @pytest.mark.asyncio
+    async def test_sync_serial_id_out_of_order(self, client: AsyncClient, chat_id: int):
+        """Сообщение с большим id, но более ранним временем, не пропадает."""
+        url = f"/api/v1/chats/{chat_id}"
+        first = (await client.post(f"{url}/messages/", json={"text": "A"})).json()
+        await client.post(f"{url}/messages/", json={"text": "B"})
+        late = (await client.post(f"{url}/messages/", json={"text": "C"})).json()
+        # C получило id раньше, а закоммичено позже B: последним в строке
+        # чата остается B
+        earlier = datetime.fromisoformat(first["created_at"]).replace(microsecond=0)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                text("UPDATE messages SET created_at = :at WHERE id = :id"),
+                {"at": earlier, "id": late["id"]},
+            )
+            await db.execute(
+                text("UPDATE chats SET last_message_id = :id WHERE id = :chat_id"),
+                {"id": late["id"] - 1, "chat_id": chat_id},
+            )
+            await db.commit()
+
+        seen = {chat_id: late["id"] - 1}
+        data = (await client.post("/api/v1/chats/sync", json={"chats": seen})).json()
+        assert [m["id"] for m in data["chats"][0]["messages"]] == [late["id"]]
+
+    async def test_sync_validation(self, client: AsyncClient, chat_id: int):
+        """Пустой набор чатов и отрицательный id отклоняются."""
+        url = "/api/v1/chats/sync"
+        assert (await client.post(url, json={"chats": {}})).status_code == 422
+        response = await client.post(url, json={"chats": {str(chat_id): -1}})
+        assert response.status_code == 422
+
+
+class ASGIConnection:
+    """Соединение с приложением напрямую по ASGI.
+
+    ASGITransport из httpx дожидается конца ответа и не умеет WebSocket,
+    а подписки не заканчиваются сами: события читаются по мере отправки.
+    Приложение работает в цикле теста, поэтому видит подмену сессии БД.
+    """
+
+    def __init__(self, scope_type: str, path: str):
+        scope = {
+            "type": scope_type,
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "scheme": "ws" if scope_type == "websocket" else "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"test")],
+            "client": ("testclient", 50000),
+            "server": ("test", 80),
+        }
+        if scope_type == "http":
+            scope["method"] = "GET"
+        else:
+            scope["subprotocols"] = []
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(
+            app(scope, self.incoming.get, self.outgoing.put)
+        )
+
+    async def receive(self) -> dict:
+        return await asyncio.wait_for(self.outgoing.get(), timeout=5)
+
+    async def finish(self, event: dict) -> None:
+        await self.incoming.put(event)
+        await asyncio.wait_for(self.task, timeout=5)
+
+
+async def wait_subscribed(chat_id: int) -> None:
+    """Ждет, пока подписка зарегистрируется в хабе."""
+    for _ in range(100):
+        if hub.subscriber_count(chat_id):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("subscription was not registered")
+
+
+class TestSubscriptions:
+    """Тесты подписок на сообщения чата через WebSocket и SSE."""
+
+    @pytest.fixture
+    async def chat_id(self, client: AsyncClient) -> int:
+        res = await client.post("/api/v1/chats/", json={"title": "Live Chat"})
+        return res.json()["id"]
+
+    @pytest.mark.asyncio
+    async def test_ws_delivers_messages(
+        self, client: AsyncClient, db_session, chat_id: int
+    ):
+        """Новое сообщение приходит подписчику, сессия БД уже отпущена."""
+        ws = ASGIConnection("websocket", f"/api/v1/chats/{chat_id}/ws")
+        await ws.incoming.put({"type": "websocket.connect"})
+        assert (await ws.receive())["type"] == "websocket.accept"
+        await wait_subscribed(chat_id)
+        # Проверка существования чата не держит соединение на всю подписку
+        assert not db_session.in_transaction()
+
+        await client.post(
+            f"/api/v1/chats/{chat_id}/messages/", json={"text": VALID_MESSAGE_TEXT}
+        )
+        event = await ws.receive()
+        assert event["type"] == "websocket.send"
+        assert orjson.loads(event["text"])["text"] == VALID_MESSAGE_TEXT
+
+        await ws.finish({"type": "websocket.disconnect", "code": 1000})
+        assert hub.subscriber_count(chat_id) == 0
+
+    @pytest.mark.asyncio
+    async def test_ws_missing_chat(self, client: AsyncClient):
+        """Подключение к несуществующему чату отклоняется до accept (403)."""
+        ws = ASGIConnection("websocket", "/api/v1/chats/999999/ws")
+        await ws.incoming.put({"type": "websocket.connect"})
+        event = await ws.receive()
+        assert event == {
+            "type": "websocket.close",
+            "code": status.WS_1008_POLICY_VIOLATION,
+            "reason": "",
+        }
+        await asyncio.wait_for(ws.task, timeout=5)
+        assert hub.subscriber_count(999999) == 0
+
+    @pytest.mark.asyncio
+    async def test_ws_slow_subscriber_dropped(
+        self, client: AsyncClient, chat_id: int, monkeypatch
+    ):
+        """Подписчик с переполненной очередью отключается с кодом 1013."""
+        monkeypatch.setattr(hub, "queue_size", 1)
+        ws = ASGIConnection("websocket", f"/api/v1/chats/{chat_id}/ws")
+        await ws.incoming.put({"type": "websocket.connect"})
+        assert (await ws.receive())["type"] == "websocket.accept"
+        await wait_subscribed(chat_id)
+
+        # Пачка публикуется подряд, и очередь из одного места переполняется
+        await client.post(
+            f"/api/v1/chats/{chat_id}/messages/bulk/",
+            json=[{"text": str(i)} for i in range(3)],
+        )
+        event = await ws.receive()
+        assert event["type"] == "websocket.close"
+        assert event["code"] == status.WS_1013_TRY_AGAIN_LATER
+        await ws.finish({"type": "websocket.disconnect", "code": 1013})
+        assert hub.subscriber_count(chat_id) == 0
+
+    @pytest.mark.asyncio
+    async def test_sse_delivers_messages(
+        self, client: AsyncClient, db_session, chat_id: int, monkeypatch
+    ):
+        """SSE-поток отдает heartbeat и новые сообщения по мере появления."""
+        monkeypatch.setattr(settings, "SSE_HEARTBEAT_SECONDS", 0.05)
+        sse = ASGIConnection("http", f"/api/v1/chats/{chat_id}/events")
+        await sse.incoming.put({"type": "http.request", "body": b""})
+        start = await sse.receive()
+        assert start["status"] == 200
+        assert (b"content-type", b"text/event-stream; charset=utf-8") in start[
+            "headers"
+        ]
+        await wait_subscribed(chat_id)
+        assert not db_session.in_transaction()
+        assert (await sse.receive())["body"] == b": heartbeat\n\n"
+
+        await client.post(
+            f"/api/v1/chats/{chat_id}/messages/", json={"text": VALID_MESSAGE_TEXT}
+        )
+        while (body := (await sse.receive())["body"]) == b": heartbeat\n\n":
+            pass
+        event, data = body.decode().rstrip("\n").split("\n")
+        assert event == "event: message"
+        assert orjson.loads(data.removeprefix("data: "))["chat_id"] == chat_id
+
+        await sse.finish({"type": "http.disconnect"})
+        assert hub.subscriber_count(chat_id) == 0
+
+    @pytest.mark.asyncio
+    async def test_sse_missing_chat(self, client: AsyncClient):
+        """Подписка на несуществующий чат возвращает 404."""
+        sse = ASGIConnection("http", "/api/v1/chats/999999/events")
+        await sse.incoming.put({"type": "http.request", "body": b""})
+        assert (await sse.receive())["status"] == 404
+        await asyncio.wait_for(sse.task, timeout=5)
+        assert hub.subscriber_count(999999) == 0
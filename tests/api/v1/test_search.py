@@ -0,0 +1,71 @@
+import pytest
+from httpx import AsyncClient
+
+
+class TestSearch:
+    """Тесты для поиска сообщений."""
+
+    @pytest.fixture
+    async def chat_ids(self, client: AsyncClient) -> list:
+        """Фикстура: два чата с сообщениями."""
+        ids = []
+        for title, texts in (
+            ("First", ["deploy failed again", "lunch?", "deploy deploy fixed"]),
+            ("Second", ["deploy tomorrow"]),
+        ):
+            chat_id = await client.post("/api/v1/chats/", json={"title": title})
+            chat_id = chat_id.json()["id"]
+            await client.post(
+                f"/api/v1/chats/{chat_id}/messages/bulk/",
+                json=[{"text": text} for text in texts],
+            )
+            ids.append(chat_id)
+        return ids
+
+    @pytest.mark.asyncio
+    async def test_search_ranked_with_pagination(
+        self, client: AsyncClient, chat_ids: list
+    ):
+        """Глобальный поиск упорядочен по релевантности и листается курсором."""
+        first = (
+            await client.get(
+                "/api/v1/search/messages", params={"q": "deploy", "limit": 2}
+            )
+        ).json()
+        assert [m["text"] for m in first["messages"]][0] == "deploy deploy fixed"
+        assert first["messages"][0]["rank"] >= first["messages"][1]["rank"]
+
+        rest = (
+            await client.get(
+                "/api/v1/search/messages",
+                params={"q": "deploy", "limit": 2, "cursor": first["next_cursor"]},
+            )
+        ).json()
+        found = first["messages"] + rest["messages"]
+        assert len({m["id"] for m in found}) == 3
+        assert rest["next_cursor"] is None
+
+    @pytest.mark.asyncio
+    async def test_search_in_chat(self, client: AsyncClient, chat_ids: list):
+        """Поиск в одном чате не видит сообщений других чатов."""
+        response = await client.get(
+            "/api/v1/search/messages", params={"q": "deploy", "chat_id": chat_ids[1]}
+        )
+        assert response.status_code == 200
+        assert [m["text"] for m in response.json()["messages"]] == ["deploy tomorrow"]
+
+    @pytest.mark.asyncio
+    async def test_substring_search_disabled(self, client: AsyncClient):
+        """Поиск подстроки без pg_trgm отклоняется."""
+        response = await client.get(
+            "/api/v1/search/messages", params={"q": "plo", "mode": "substring"}
+        )
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_invalid_cursor(self, client: AsyncClient):
+        """Некорректный курсор отклоняется с 400."""
+        response = await client.get(
+            "/api/v1/search/messages", params={"q": "x", "cursor": "bad"}
+        )
+        assert response.status_code == 400
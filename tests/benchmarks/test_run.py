@@ -0,0 +1,87 @@
+import pytest
+
+from benchmarks.run import compare, percentile
+
+
+def report(**results) -> dict:
+    """Отчет прогона с результатами эндпоинтов."""
+    return {"results": results}
+
+
+def result(p95_ms: float = 10.0, rps: float = 100.0, errors: int = 0) -> dict:
+    return {
+        "requests": 100,
+        "errors": errors,
+        "throughput_rps": rps,
+        "p95_ms": p95_ms,
+    }
+
+
+class TestPercentile:
+    """Тесты для перцентилей задержек."""
+
+    def test_nearest_rank(self):
+        """Перцентиль - замер с рангом q% от их числа, в миллисекундах."""
+        samples = [i / 1000 for i in range(20, 0, -1)]
+        assert percentile(samples, 50) == 10.0
+        assert percentile(samples, 95) == 19.0
+        assert percentile(samples, 99) == 20.0
+        assert percentile(samples, 100) == 20.0
+
+    def test_single_sample(self):
+        """Из одного замера любой перцентиль - сам замер."""
+        for q in (0, 50, 99):
+            assert percentile([0.25], q) == 250.0
+
+
+class TestCompare:
+    """Тесты для сравнения прогона с baseline."""
+
+    @pytest.mark.parametrize(
+        "current, regressed",
+        [
+            (result(p95_ms=10.9), False),
+            (result(p95_ms=11.5), True),
+            (result(rps=91.0), False),
+            (result(rps=85.0), True),
+            (result(p95_ms=5.0, rps=200.0), False),
+        ],
+    )
+    def test_threshold(self, current, regressed):
+        """Деградацией считается только выход за --threshold."""
+        regressions = compare(report(get_chat=current), report(get_chat=result()), 0.1)
+        assert bool(regressions) is regressed
+
+    def test_regression_lines(self):
+        """В деградации указаны эндпоинт, метрика и изменение."""
+        current = report(get_chat=result(p95_ms=15.0, rps=50.0))
+        assert compare(current, report(get_chat=result()), 0.1) == [
+            "get_chat: p95 +50.0%",
+            "get_chat: throughput -50.0%",
+        ]
+        assert current["results"]["get_chat"]["baseline_delta"] == {
+            "p95": 0.5,
+            "throughput": -0.5,
+        }
+
+    def test_rising_error_share(self):
+        """Рост доли ошибок - деградация, даже если задержки улучшились."""
+        current = report(create_message=result(p95_ms=1.0, rps=500.0, errors=20))
+        baseline = report(create_message=result(errors=5))
+        assert compare(current, baseline, 0.1) == [
+            "create_message: errors 20.0% (baseline 5.0%)"
+        ]
+        # Прежняя доля ошибок деградацией не считается
+        assert compare(baseline, baseline, 0.1) == []
+
+    def test_endpoint_missing_in_baseline(self):
+        """Новый эндпоинт без baseline проверяется только на ошибки."""
+        baseline = report(get_chat=result())
+        current = report(get_chat=result(), search=result(p95_ms=1000.0, rps=1.0))
+        assert compare(current, baseline, 0.1) == []
+        assert "baseline_delta" not in current["results"]["search"]
+
+        current = report(search=result(errors=1))
+        assert compare(current, baseline, 0.1) == [
+            "search: errors 1.0% (baseline 0.0%)"
+        ]
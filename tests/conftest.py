@@ -1,11 +1,19 @@
+import os
+
 import pytest
 from typing import AsyncGenerator
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy import pool, text
 
+# Тесты идут в одном процессе: кэш истории в памяти безопасен
+os.environ.setdefault("HISTORY_CACHE_BACKEND", "memory")
+
 from app.main import app
-from app.core.db import get_db
+from app.core.cache import history_cache
+from app.core.idempotency import idempotency_cache
+from app.core.ratelimit import rate_limiter
+from app.core.db import get_db, get_read_db
 from app.core.config import settings
 from app.models.base import Base
 
@@ -42,6 +50,9 @@ async def db_session(db_engine) -> AsyncGenerator[AsyncSession, None]:
             text("TRUNCATE TABLE messages, chats RESTART IDENTITY CASCADE")
         )
         await session.commit()
+        await history_cache.clear()
+        idempotency_cache.clear()
+        await rate_limiter.clear()
 
 
 @pytest.fixture(scope="function")
@@ -52,6 +63,7 @@ async def client(db_session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
         yield db_session
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
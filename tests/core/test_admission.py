@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.core.admission import AdmissionMiddleware, ConcurrencyLimiter
+from app.core.ratelimit import MemoryRateLimiter, PostgresRateLimiter
+
+
+async def slow_app(scope, receive, send):
+    await asyncio.sleep(0.05)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+class TestAdmission:
+    """Тесты для контроля допуска и лимитов частоты."""
+
+    @pytest.mark.asyncio
+    async def test_limiter_queue(self):
+        """Сверх лимита запросы ждут в очереди, а при переполнении отклоняются."""
+        limiter = ConcurrencyLimiter(limit=1, queue_size=1, timeout=1.0)
+        assert await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        assert not await limiter.acquire()
+
+        # Освобожденный слот переходит к ожидающему
+        limiter.release()
+        assert await waiter
+        assert limiter.active == 1 and limiter.waiting == 0
+        limiter.release()
+        assert limiter.active == 0
+
+    @pytest.mark.asyncio
+    async def test_limiter_timeout(self):
+        """По истечении ожидания запрос отклоняется и уходит из очереди."""
+        limiter = ConcurrencyLimiter(limit=1, queue_size=10, timeout=0.01)
+        assert await limiter.acquire()
+        assert not await limiter.acquire()
+        assert limiter.waiting == 0
+
+    @pytest.mark.asyncio
+    async def test_middleware_sheds_load(self):
+        """Перегруженный сервер отвечает 503 с Retry-After."""
+        limiter = ConcurrencyLimiter(limit=1, queue_size=0, timeout=1.0)
+        app = AdmissionMiddleware(slow_app, limiter=limiter)
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            responses = await asyncio.gather(ac.get("/a"), ac.get("/b"))
+            exempt = await asyncio.gather(ac.get("/metrics"), ac.get("/metrics"))
+
+        assert sorted(r.status_code for r in responses) == [200, 503]
+        shed = next(r for r in responses if r.status_code == 503)
+        assert shed.headers["retry-after"] == "1"
+        assert [r.status_code for r in exempt] == [200, 200]
+        assert limiter.active == 0
+
+    @pytest.mark.asyncio
+    async def test_memory_rate_limiter(self):
+        """После исчерпания запаса запросы ждут пополнения бакета."""
+        limiter = MemoryRateLimiter(max_keys=10)
+        assert [await limiter.acquire("a", 10, 3) for _ in range(3)] == [0, 0, 0]
+        wait = await limiter.acquire("a", 10, 3)
+        assert 0 < wait <= 0.1
+        # Другие ключи лимитируются отдельно
+        assert await limiter.acquire("b", 10, 3) == 0
+
+    @pytest.mark.asyncio
+    async def test_postgres_rate_limiter(self, db_engine):
+        """Общие лимиты в Postgres ведут себя так же, как в памяти."""
+        limiter = PostgresRateLimiter(db_engine)
+        await limiter.clear()
+        assert [await limiter.acquire("a", 10, 3) for _ in range(3)] == [0, 0, 0]
+        assert await limiter.acquire("a", 10, 3) > 0
+        assert await limiter.acquire("b", 10, 3) == 0
+        await limiter.clear()
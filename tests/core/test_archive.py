@@ -0,0 +1,179 @@
+import datetime
+
+import orjson
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from app.core import partitions
+from app.core.archive import MessageArchiver, pack_messages, unpack_messages
+from app.core.config import settings
+from app.core.idempotency import idempotency_cache
+from app.core.pagination import encode_cursor
+
+
+async def read_pages(client: AsyncClient, url: str, key: str, **params) -> list:
+    """Проходит историю страницами по курсору `key`, собирая тексты."""
+    texts = []
+    while True:
+        page = (await client.get(url, params=params)).json()
+        messages = [m["text"] for m in page["messages"]]
+        texts = messages + texts if key == "next_cursor" else texts + messages
+        if not page[key]:
+            return texts
+        params = {
+            "limit": params["limit"],
+            "before" if key == "next_cursor" else "after": page[key],
+        }
+
+
+class TestArchive:
+    """Тесты для архива старых сообщений."""
+
+    def test_pack_roundtrip(self):
+        """Блок архива распаковывается в исходные сообщения."""
+        created_at = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        messages = [{"id": 1, "chat_id": 7, "text": "привет", "created_at": created_at}]
+        assert unpack_messages(7, *pack_messages(messages)) == messages
+
+    @pytest.mark.asyncio
+    async def test_history_reads_through_archive(
+        self, client: AsyncClient, db_engine, monkeypatch
+    ):
+        """История и выгрузка прозрачно продолжаются в архиве."""
+        monkeypatch.setattr(settings, "MESSAGES_ARCHIVE_AFTER_DAYS", 2)
+        # Перенос идет несколькими транзакциями, дописывая блоки дня
+        monkeypatch.setattr(settings, "MESSAGES_ARCHIVE_BATCH_MESSAGES", 4)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        chat_id = (await client.post("/api/v1/chats/", json={"title": "Old"})).json()[
+            "id"
+        ]
+        async with db_engine.begin() as conn:
+            await conn.run_sync(
+                partitions.ensure_partitions, 1, partitions.add_months(now.date(), -1)
+            )
+            await conn.execute(
+                text(
+                    "UPDATE chats SET created_at = :at, message_count = 9 "
+                    "WHERE id = :chat_id"
+                ),
+                {"at": now - datetime.timedelta(days=10), "chat_id": chat_id},
+            )
+            for days in (5, 4, 3):
+                for i in range(3):
+                    await conn.execute(
+                        text(
+                            "INSERT INTO messages (chat_id, text, created_at) "
+                            "VALUES (:chat_id, :text, :at)"
+                        ),
+                        {
+                            "chat_id": chat_id,
+                            "text": f"d{days}-{i}",
+                            "at": now - datetime.timedelta(days=days, minutes=-i),
+                        },
+                    )
+        for i in range(2):
+            await client.post(
+                f"/api/v1/chats/{chat_id}/messages/", json={"text": f"new{i}"}
+            )
+        expected = [f"d{d}-{i}" for d in (5, 4, 3) for i in range(3)] + ["new0", "new1"]
+
+        assert await MessageArchiver(db_engine).run_once() == 9
+        # Позднее попавшее в архив сообщение дописывается в блок своего дня
+        async with db_engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "INSERT INTO messages (chat_id, text, created_at) "
+                    "VALUES (:chat_id, 'd3-3', :at)"
+                ),
+                {
+                    "chat_id": chat_id,
+                    "at": now - datetime.timedelta(days=3, minutes=-3),
+                },
+            )
+            await conn.execute(text("UPDATE chats SET message_count = 12"))
+        expected.insert(9, "d3-3")
+        url = f"/api/v1/chats/{chat_id}"
+        newest = (await client.get(url, params={"limit": 1})).json()
+        older = {"limit": 4, "before": newest["next_cursor"]}
+        etag = (await client.get(url, params=older)).headers["etag"]
+
+        assert await MessageArchiver(db_engine).run_once() == 1
+        # Перенос в архив меняет ETag и старых страниц
+        moved = await client.get(url, params=older, headers={"If-None-Match": etag})
+        assert moved.status_code == 200
+        assert moved.headers["etag"] != etag
+        async with db_engine.connect() as conn:
+            hot = await conn.scalar(text("SELECT count(*) FROM messages"))
+            blocks = await conn.scalar(text("SELECT count(*) FROM message_archive"))
+        assert (hot, blocks) == (2, 3)
+
+        assert await read_pages(client, url, "next_cursor", limit=4) == expected
+        monkeypatch.setattr(settings, "HISTORY_JSON_AGG", True)
+        assert await read_pages(client, url, "next_cursor", limit=4) == expected
+
+        # Вперед от самого старого сообщения
+        oldest = (await client.get(url, params={"limit": 20})).json()
+        first = oldest["messages"][0]
+        cursor = encode_cursor(
+            datetime.datetime.fromisoformat(first["created_at"]), first["id"]
+        )
+        forward = await read_pages(client, url, "prev_cursor", limit=4, after=cursor)
+        assert forward == expected[1:]
+
+        export = await client.get(f"{url}/export")
+        lines = [orjson.loads(line)["text"] for line in export.content.splitlines()]
+        assert lines == expected
+
+    @pytest.mark.asyncio
+    async def test_idempotent_replay_from_archive(
+        self, client: AsyncClient, db_engine, monkeypatch
+    ):
+        """Повтор запроса с ключом находит сообщение, уже перенесенное в архив."""
+        monkeypatch.setattr(settings, "MESSAGES_ARCHIVE_AFTER_DAYS", 1)
+        chat_id = (await client.post("/api/v1/chats/", json={"title": "Old"})).json()[
+            "id"
+        ]
+        url = f"/api/v1/chats/{chat_id}/messages/"
+        headers = {"Idempotency-Key": "k"}
+        original = await client.post(url, json={"text": "A"}, headers=headers)
+        await client.post(url, json={"text": "B"})
+
+        today = datetime.date.today() + datetime.timedelta(days=3)
+        assert await MessageArchiver(db_engine).run_once(today=today) == 1
+        idempotency_cache.clear()
+
+        replay = await client.post(url, json={"text": "A"}, headers=headers)
+        assert replay.status_code == 201
+        assert replay.headers["idempotent-replayed"] == "true"
+        assert replay.json() == original.json()
+
+    @pytest.mark.asyncio
+    async def test_sync_flags_archived_messages(
+        self, client: AsyncClient, db_engine, monkeypatch
+    ):
+        """Синхронизация не пропускает молча сообщения, ушедшие в архив."""
+        monkeypatch.setattr(settings, "MESSAGES_ARCHIVE_AFTER_DAYS", 1)
+        chat_id = (await client.post("/api/v1/chats/", json={"title": "Old"})).json()[
+            "id"
+        ]
+        url = f"/api/v1/chats/{chat_id}/messages/"
+        first = (await client.post(url, json={"text": "A"})).json()
+        last = (await client.post(url, json={"text": "B"})).json()
+        today = datetime.date.today() + datetime.timedelta(days=3)
+        assert await MessageArchiver(db_engine).run_once(today=today) == 1
+
+        sync = "/api/v1/chats/sync"
+        data = (await client.post(sync, json={"chats": {chat_id: 0}})).json()
+        assert data["chats"] == [
+            {
+                "chat_id": chat_id,
+                "messages": [],
+                "has_more": False,
+                "resync": True,
+                "last_message_id": last["id"],
+            }
+        ]
+        data = (await client.post(sync, json={"chats": {chat_id: first["id"]}})).json()
+        assert data["chats"][0]["messages"] == [last]
+        assert not data["chats"][0]["resync"]
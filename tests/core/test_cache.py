@@ -0,0 +1,132 @@
+import datetime
+
+import pytest
+
+from app.core.cache import (
+    MESSAGE_OVERHEAD,
+    MemoryHistoryCache,
+    NullHistoryCache,
+    create_history_cache,
+)
+from app.core.config import settings
+
+CHAT = {"id": 1, "title": "Chat", "created_at": datetime.datetime(2026, 1, 1)}
+
+
+def make_message(message_id: int, chat_id: int = 1, text: str = "x") -> dict:
+    """Создает сообщение с временем, возрастающим вместе с id."""
+    created_at = datetime.datetime(2026, 1, 1) + datetime.timedelta(seconds=message_id)
+    return {
+        "id": message_id,
+        "chat_id": chat_id,
+        "text": text,
+        "created_at": created_at,
+    }
+
+
+class TestMemoryHistoryCache:
+    """Тесты для кэша последних сообщений в памяти."""
+
+    @pytest.mark.asyncio
+    async def test_serves_recent_messages_after_fill(self):
+        """После заполнения последние сообщения отдаются из кэша."""
+        cache = MemoryHistoryCache(max_messages=3, max_bytes=10**6, ttl=60)
+        assert await cache.get(1, 2) is None
+
+        token = await cache.fill_token(1)
+        messages = [make_message(i) for i in range(3)]
+        await cache.fill(1, token, CHAT, messages, complete=False, message_count=5)
+
+        page = await cache.get(1, 2)
+        assert [m["id"] for m in page.messages] == [1, 2]
+        assert page.has_older
+        assert page.message_count == 5
+        assert await cache.get(1, 5) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    @pytest.mark.asyncio
+    async def test_append_keeps_ring_buffer(self):
+        """Новые сообщения вытесняют самые старые из буфера."""
+        cache = MemoryHistoryCache(max_messages=3, max_bytes=10**6, ttl=60)
+        token = await cache.fill_token(1)
+        await cache.fill(
+            1, token, CHAT, [make_message(1)], complete=True, message_count=1
+        )
+
+        page = await cache.get(1, 20)
+        assert [m["id"] for m in page.messages] == [1]
+        assert not page.has_older
+
+        await cache.append([make_message(i) for i in (2, 4, 3)])
+        page = await cache.get(1, 3)
+        assert [m["id"] for m in page.messages] == [2, 3, 4]
+        assert page.has_older
+        # Счетчик растет вместе с дописанными сообщениями
+        assert page.message_count == 4
+
+    @pytest.mark.asyncio
+    async def test_stale_fill_is_rejected(self):
+        """Заполнение данными, прочитанными до записи в чат, игнорируется."""
+        cache = MemoryHistoryCache(max_messages=3, max_bytes=10**6, ttl=60)
+        token = await cache.fill_token(1)
+        await cache.append([make_message(5)])
+        await cache.fill(
+            1, token, CHAT, [make_message(1)], complete=True, message_count=1
+        )
+        assert await cache.get(1, 1) is None
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_by_memory(self):
+        """При превышении лимита памяти вытесняются давно читанные чаты."""
+        per_chat = len("x") + MESSAGE_OVERHEAD
+        cache = MemoryHistoryCache(max_messages=3, max_bytes=per_chat * 2, ttl=60)
+        for chat_id in (1, 2):
+            token = await cache.fill_token(chat_id)
+            chat = {**CHAT, "id": chat_id}
+            await cache.fill(
+                chat_id,
+                token,
+                chat,
+                [make_message(1, chat_id)],
+                complete=True,
+                message_count=1,
+            )
+        assert await cache.get(1, 1) is not None
+
+        token = await cache.fill_token(3)
+        await cache.fill(
+            3, token, CHAT, [make_message(1, 3)], complete=True, message_count=1
+        )
+
+        assert await cache.get(2, 1) is None
+        assert await cache.get(1, 1) is not None
+        assert cache.size == per_chat * 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate_and_ttl(self):
+        """Запись сбрасывается явно и по истечении TTL."""
+        cache = MemoryHistoryCache(max_messages=3, max_bytes=10**6, ttl=60)
+        token = await cache.fill_token(1)
+        await cache.fill(
+            1, token, CHAT, [make_message(1)], complete=True, message_count=1
+        )
+        await cache.invalidate(1)
+        assert await cache.get(1, 1) is None
+
+        cache.ttl = -1
+        token = await cache.fill_token(1)
+        await cache.fill(
+            1, token, CHAT, [make_message(1)], complete=True, message_count=1
+        )
+        assert await cache.get(1, 1) is None
+
+
+@pytest.mark.parametrize(
+    "broadcast, expected",
+    [("memory", NullHistoryCache), ("postgres", MemoryHistoryCache)],
+)
+def test_auto_cache_needs_shared_invalidation(monkeypatch, broadcast, expected):
+    """Без рассылки между воркерами кэш по умолчанию выключен."""
+    monkeypatch.setattr(settings, "HISTORY_CACHE_BACKEND", "auto")
+    monkeypatch.setattr(settings, "BROADCAST_BACKEND", broadcast)
+    assert isinstance(create_history_cache(), expected)
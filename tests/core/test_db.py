@@ -0,0 +1,114 @@
+import itertools
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+
+from app.core import db
+from app.core.config import settings
+
+
+class TestEngineOptions:
+    """Тесты для настроек пула соединений и драйвера."""
+
+    def test_pool_settings(self, monkeypatch):
+        """Параметры пула берутся из настроек."""
+        monkeypatch.setattr(settings, "DB_POOL_SIZE", 7)
+        monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", 1500)
+        options = db.engine_options()
+
+        assert options["poolclass"] is db.TimedQueuePool
+        assert options["pool_size"] == 7
+        server_settings = options["connect_args"]["server_settings"]
+        assert server_settings["statement_timeout"] == "1500"
+
+    def test_pgbouncer_mode(self, monkeypatch):
+        """В режиме PgBouncer кэши подготовленных выражений выключены."""
+        monkeypatch.setattr(settings, "DB_PGBOUNCER", True)
+        monkeypatch.setattr(settings, "DB_NULL_POOL", True)
+        options = db.engine_options()
+
+        assert options["poolclass"] is NullPool
+        assert "pool_size" not in options
+        connect_args = options["connect_args"]
+        assert connect_args["statement_cache_size"] == 0
+        assert connect_args["prepared_statement_cache_size"] == 0
+        assert connect_args["prepared_statement_name_func"]().startswith("__asyncpg_")
+
+    @pytest.mark.parametrize("pgbouncer, timeout", [(True, 1500), (False, 0)])
+    def test_no_statement_timeout_parameter(self, monkeypatch, pgbouncer, timeout):
+        """Без таймаута или за PgBouncer параметр запуска не передается."""
+        monkeypatch.setattr(settings, "DB_PGBOUNCER", pgbouncer)
+        monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", timeout)
+        options = db.engine_options()
+
+        assert "server_settings" not in options["connect_args"]
+
+    @pytest.mark.asyncio
+    async def test_checkout_wait_is_recorded(self, db_engine):
+        """Ожидание соединения из пула учитывается в статистике."""
+        checkouts = db.pool_stats.checkouts
+        async with db.AsyncSessionLocal() as session:
+            await session.execute(text("SELECT 1"))
+        assert db.pool_stats.checkouts > checkouts
+
+
+def make_request(cookie: str = "") -> Request:
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "headers": headers})
+
+
+class TestReadReplicas:
+    """Тесты для маршрутизации чтений на реплики."""
+
+    @pytest.fixture
+    def replica(self, db_engine, monkeypatch):
+        """Фикстура: тестовая БД подключена как единственная реплика."""
+        sessions = async_sessionmaker(
+            bind=db_engine, class_=AsyncSession, info={"replica": True}
+        )
+        monkeypatch.setattr(db, "_replica_sessions", itertools.cycle([sessions]))
+
+    @pytest.mark.asyncio
+    async def test_reads_go_to_replica(self, replica):
+        """Без недавних записей чтение идет в реплику."""
+        async for session in db.get_read_db(make_request()):
+            assert db.is_replica(session)
+
+    @pytest.mark.asyncio
+    async def test_recent_writer_reads_primary(self, replica):
+        """Клиент с cookie после записи читает из основной БД."""
+        cookie = f"{db.PRIMARY_COOKIE}={time.time() + 5}"
+        async for session in db.get_read_db(make_request(cookie)):
+            assert not db.is_replica(session)
+
+    @pytest.mark.asyncio
+    async def test_write_sets_primary_cookie(self):
+        """Успешная запись ставит cookie, чтение - нет."""
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 201, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        transport = ASGITransport(app=db.PrimaryPinMiddleware(app))
+        async with AsyncClient(transport=transport, base_url="http://test") as c:
+            assert db.PRIMARY_COOKIE in (await c.post("/")).cookies
+            assert db.PRIMARY_COOKIE not in (await c.get("/")).cookies
+
+    @pytest.mark.asyncio
+    async def test_read_only_post_keeps_replica(self):
+        """POST, читающий через get_read_db, не закрепляет клиента."""
+
+        async def app(scope, receive, send):
+            async for _ in db.get_read_db(Request(scope)):
+                pass
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        transport = ASGITransport(app=db.PrimaryPinMiddleware(app))
+        async with AsyncClient(transport=transport, base_url="http://test") as c:
+            assert db.PRIMARY_COOKIE not in (await c.post("/")).cookies
@@ -0,0 +1,43 @@
+import datetime
+
+import pytest
+
+from app.core import ids
+from app.core.config import settings
+
+
+class TestSnowflake:
+    """Тесты для генератора упорядоченных по времени id."""
+
+    def test_ids_increase_within_process(self, monkeypatch):
+        """id строго возрастают, даже если время стоит или идет назад."""
+        generator = ids.SnowflakeGenerator(worker_id=5)
+        now = 1_800_000_000.0
+        monkeypatch.setattr(ids.time, "time", lambda: now)
+        # Больше id, чем помещается в счетчик одной миллисекунды
+        batch = [generator.next_id() for _ in range(ids.MAX_SEQUENCE + 10)]
+        now -= 1
+        batch.append(generator.next_id())
+        assert batch == sorted(set(batch))
+        assert all((i >> ids.SEQUENCE_BITS) & ids.MAX_WORKER_ID == 5 for i in batch)
+
+    def test_id_time(self, monkeypatch):
+        """Время создания восстанавливается из id с точностью до миллисекунды."""
+        moment = datetime.datetime(
+            2026, 10, 18, 12, 30, 1, 123000, datetime.timezone.utc
+        )
+        monkeypatch.setattr(ids.time, "time", moment.timestamp)
+        assert ids.id_time(ids.SnowflakeGenerator(worker_id=1).next_id()) == moment
+
+    def test_worker_id_range(self):
+        with pytest.raises(ValueError):
+            ids.SnowflakeGenerator(worker_id=ids.MAX_WORKER_ID + 1)
+
+    def test_worker_id_required(self, monkeypatch):
+        """Для snowflake воркер задается явно, иначе приложение не стартует."""
+        monkeypatch.setattr(settings, "MESSAGE_ID_STRATEGY", "snowflake")
+        monkeypatch.setattr(settings, "SNOWFLAKE_WORKER_ID", None)
+        with pytest.raises(ValueError):
+            ids.create_message_ids()
+        monkeypatch.setattr(settings, "SNOWFLAKE_WORKER_ID", 7)
+        assert ids.create_message_ids().worker_id == 7
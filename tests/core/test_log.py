@@ -0,0 +1,40 @@
+import json
+import logging
+import queue
+
+from app.core.log import JsonFormatter, NonBlockingQueueHandler, SamplingFilter
+
+
+def make_record(level: int = logging.INFO, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("app.test", level, __file__, 1, "chat_id=%s", (7,), None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestLogging:
+    """Тесты для настройки логирования."""
+
+    def test_json_formatter(self):
+        """Запись форматируется в JSON вместе с полями из extra."""
+        data = json.loads(JsonFormatter().format(make_record(chat_id=7)))
+        assert data["message"] == "chat_id=7"
+        assert data["level"] == "INFO"
+        assert data["chat_id"] == 7
+        assert data["ts"].endswith("Z")
+
+    def test_sampling_only_info(self):
+        """Сэмплирование отбрасывает INFO, но не предупреждения."""
+        sampling = SamplingFilter(0.0)
+        assert not sampling.filter(make_record(logging.INFO))
+        assert sampling.filter(make_record(logging.WARNING))
+        assert SamplingFilter(1.0).filter(make_record(logging.INFO))
+
+    def test_full_queue_does_not_block(self):
+        """При переполненной очереди запись отбрасывается без ожидания."""
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+        handler.handle(make_record())
+        handler.handle(make_record())
+
+        assert handler.dropped == 1
+        # Сообщение не форматируется в вызывающем потоке
+        assert handler.queue.get_nowait().msg == "chat_id=%s"
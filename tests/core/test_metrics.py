@@ -0,0 +1,62 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+
+from app.core import db, metrics
+from app.core.config import settings
+
+
+class TestMetrics:
+    """Тесты для метрик Prometheus."""
+
+    def test_histogram_render(self):
+        """Гистограмма экспортируется накопительными корзинами."""
+        histogram = metrics.Histogram("t_seconds", "Тест", ("route",), (0.1, 1.0))
+        histogram.observe(0.05, "/a")
+        histogram.observe(0.5, "/a")
+        histogram.observe(5, "/a")
+
+        rendered = histogram.render()
+        assert 't_seconds_bucket{route="/a",le="0.1"} 1' in rendered
+        assert 't_seconds_bucket{route="/a",le="1"} 2' in rendered
+        assert 't_seconds_bucket{route="/a",le="+Inf"} 3' in rendered
+        assert 't_seconds_count{route="/a"} 3' in rendered
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self, client: AsyncClient):
+        """Запросы учитываются по шаблону маршрута."""
+        await client.get("/api/v1/chats/999999")
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+
+        body = response.text
+        assert (
+            'http_requests_total{method="GET",route="/api/v1/chats/{chat_id}",'
+            'status="404"}' in body
+        )
+        assert "history_cache_hits_total" in body
+        assert "db_pool_checkout_wait_seconds" in body
+
+    @pytest.mark.asyncio
+    async def test_request_db_statements(self, db_engine):
+        """SQL-запросы внутри HTTP-запроса считаются через события движка."""
+        engine = db.make_engine(settings.DATABASE_URL)
+
+        async def app(scope, receive, send):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                await conn.execute(text("SELECT 2"))
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        histogram = metrics.REQUEST_DB_STATEMENTS
+        key = ("GET", "unmatched")
+        before = histogram._values.get(key, ([0] * 10, [0.0]))[1][0]
+
+        transport = ASGITransport(app=metrics.MetricsMiddleware(app))
+        async with AsyncClient(transport=transport, base_url="http://test") as c:
+            assert (await c.get("/")).status_code == 200
+        await engine.dispose()
+
+        assert histogram._values[key][1][0] - before == 2
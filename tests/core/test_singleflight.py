@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """Тесты для объединения одинаковых вызовов."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_result(self):
+        """Одновременные вызовы с одним ключом выполняют работу один раз."""
+        flights = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        assert results == [1] * 5
+        assert flights.shared == 4
+        # После завершения следующий вызов снова идет в работу
+        assert await flights.do("k", work) == 2
+
+    @pytest.mark.asyncio
+    async def test_leader_cancellation(self):
+        """Отмена первого вызова не прерывает работу для остальных."""
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.02)
+            return "done"
+
+        leader = asyncio.create_task(flights.do("k", work))
+        await started.wait()
+        follower = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == "done"
+        assert leader.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_work_cancelled_without_waiters(self):
+        """Когда ждать некому, работа отменяется, а новый вызов начинает заново."""
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        async def quick():
+            return "fresh"
+
+        assert await flights.do("k", quick) == "fresh"
+
+    @pytest.mark.asyncio
+    async def test_forget(self):
+        """После forget новые вызовы не присоединяются к начатой работе."""
+        flights = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            call = calls
+            await asyncio.sleep(0.01)
+            return call
+
+        first = asyncio.create_task(flights.do((1, "a"), work))
+        await asyncio.sleep(0)
+        flights.forget(lambda key: key[0] == 1)
+        second = await flights.do((1, "a"), work)
+        assert (await first, second) == (1, 2)